@@ -0,0 +1,372 @@
+# stdlib
+import collections
+import http.client
+import http.server
+import math
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from typing import Deque, Dict, List, Optional, Tuple
+
+
+# =============================================================================
+#
+# constants
+#
+# =============================================================================
+
+LOCALHOST: str = '127.0.0.1'
+MOTO_SERVER_START_TIMEOUT: float = 30.0
+MOTO_SERVER_POLL_INTERVAL: float = 0.1
+PROXY_UPSTREAM_TIMEOUT: float = 60.0
+
+# the response s3 sends when a prefix is over its request rate,
+# which botocore retries
+THROTTLE_STATUS: int = 503
+THROTTLE_RESPONSE_BODY: bytes = (
+    b'<?xml version="1.0" encoding="UTF-8"?>\n'
+    b'<Error><Code>SlowDown</Code>'
+    b'<Message>Please reduce your request rate.</Message></Error>')
+
+# request and response headers that describe a single hop,
+# and are not passed through the proxy
+HOP_BY_HOP_HEADER_NAMES: Tuple[str, ...] = (
+    'connection',
+    'keep-alive',
+    'proxy-authenticate',
+    'proxy-authorization',
+    'te',
+    'trailers',
+    'transfer-encoding',
+    'upgrade'
+)
+
+
+# =============================================================================
+#
+# private functions
+#
+# =============================================================================
+
+# =============================================================================
+# _get_free_port
+# =============================================================================
+def _get_free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind((LOCALHOST, 0))
+        return sock.getsockname()[1]
+
+
+# =============================================================================
+# _wait_for_port
+# =============================================================================
+def _wait_for_port(port: int, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((LOCALHOST, port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(
+                    f"nothing listening on port {port} after {timeout}s")
+            time.sleep(MOTO_SERVER_POLL_INTERVAL)
+
+
+# =============================================================================
+#
+# proxy
+#
+# =============================================================================
+
+# =============================================================================
+# S3RequestCounter
+# =============================================================================
+class S3RequestCounter:
+    '''counts the requests and bytes passing through the proxy,
+    shared by every proxy thread
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.requests_by_method: Dict[str, int] = {}
+            self.throttled_requests = 0
+            self.request_bytes = 0
+            self.response_bytes = 0
+
+    def add(
+            self,
+            method: str,
+            request_bytes: int,
+            response_bytes: int,
+            throttled: bool = False) -> None:
+        with self._lock:
+            self.requests_by_method[method] = \
+                self.requests_by_method.get(method, 0) + 1
+            if throttled:
+                self.throttled_requests += 1
+            self.request_bytes += request_bytes
+            self.response_bytes += response_bytes
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                'requests': sum(self.requests_by_method.values()),
+                'requests_by_method': dict(self.requests_by_method),
+                'throttled_requests': self.throttled_requests,
+                'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes
+            }
+
+
+# =============================================================================
+# S3Faults
+# =============================================================================
+class S3Faults:
+    '''the latency and throttling the proxy injects, shared by every
+    proxy thread
+
+    every request is delayed by latency seconds, plus up to
+    latency_jitter seconds
+
+    a request is throttled with a SlowDown error with
+    throttle_probability, or when its prefix, i.e. the first path
+    segment of its key, has already had prefix_request_rate requests
+    in the last second, like s3's per prefix request rate limit
+    '''
+
+    def __init__(
+            self,
+            latency: float = 0.0,
+            latency_jitter: float = 0.0,
+            throttle_probability: float = 0.0,
+            prefix_request_rate: Optional[int] = None) -> None:
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.throttle_probability = throttle_probability
+        self.prefix_request_rate = prefix_request_rate
+        self._lock = threading.Lock()
+        self._prefix_request_times: Dict[str, Deque[float]] = \
+            collections.defaultdict(collections.deque)
+
+    def delay(self) -> None:
+        delay = self.latency + random.uniform(0, self.latency_jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def should_throttle(self, path: str) -> bool:
+        if random.random() < self.throttle_probability:
+            return True
+        if self.prefix_request_rate is None:
+            return False
+        # path style urls, i.e. /{bucket}/{prefix}/{key}
+        segments = urllib.parse.urlsplit(path).path.lstrip('/').split('/')
+        prefix = segments[1] if len(segments) > 2 else ''
+        now = time.monotonic()
+        with self._lock:
+            request_times = self._prefix_request_times[prefix]
+            while request_times and request_times[0] <= now - 1:
+                request_times.popleft()
+            if len(request_times) >= self.prefix_request_rate:
+                return True
+            request_times.append(now)
+        return False
+
+
+# =============================================================================
+# _S3ProxyRequestHandler
+# =============================================================================
+class _S3ProxyRequestHandler(http.server.BaseHTTPRequestHandler):
+    # keep client connections alive, like s3 does
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def _get_upstream_connection(self) -> http.client.HTTPConnection:
+        # one upstream connection per client connection
+        if not hasattr(self, '_upstream_connection'):
+            self._upstream_connection = http.client.HTTPConnection(
+                self.server.upstream_host,
+                self.server.upstream_port,
+                timeout=PROXY_UPSTREAM_TIMEOUT)
+        return self._upstream_connection
+
+    def finish(self) -> None:
+        super().finish()
+        if hasattr(self, '_upstream_connection'):
+            self._upstream_connection.close()
+
+    def _throttle(self, body: bytes) -> None:
+        self.server.counter.add(
+            self.command,
+            len(body),
+            len(THROTTLE_RESPONSE_BODY),
+            throttled=True)
+        self.send_response(THROTTLE_STATUS)
+        self.send_header('Content-Type', 'application/xml')
+        self.send_header('Content-Length', str(len(THROTTLE_RESPONSE_BODY)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(THROTTLE_RESPONSE_BODY)
+
+    def _forward(self) -> None:
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        faults = self.server.faults
+        if faults is not None:
+            faults.delay()
+            if faults.should_throttle(self.path):
+                self._throttle(body)
+                return
+        # the host header is passed through as is,
+        # as it is part of the request signature
+        headers = {
+            name: value
+            for name, value in self.headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADER_NAMES
+        }
+        connection = self._get_upstream_connection()
+        try:
+            connection.request(self.command, self.path, body, headers)
+            response = connection.getresponse()
+        except (http.client.HTTPException, OSError):
+            # the upstream closed an idle connection, retry once
+            connection.close()
+            connection.request(self.command, self.path, body, headers)
+            response = connection.getresponse()
+        response_body = response.read()
+
+        self.server.counter.add(
+            self.command,
+            len(body),
+            len(response_body))
+
+        self.send_response(response.status, response.reason)
+        for name, value in response.getheaders():
+            if name.lower() not in HOP_BY_HOP_HEADER_NAMES + (
+                    'content-length',):
+                self.send_header(name, value)
+        self.send_header('Content-Length', str(len(response_body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(response_body)
+
+    do_GET = _forward
+    do_HEAD = _forward
+    do_PUT = _forward
+    do_POST = _forward
+    do_DELETE = _forward
+
+
+# =============================================================================
+# _S3ProxyServer
+# =============================================================================
+class _S3ProxyServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+            self,
+            upstream_url: str,
+            counter: S3RequestCounter,
+            faults: Optional[S3Faults]) -> None:
+        upstream = urllib.parse.urlsplit(upstream_url)
+        if upstream.scheme != 'http':
+            raise ValueError('the s3 stand-in must be served over http')
+        self.upstream_host = upstream.hostname
+        self.upstream_port = upstream.port or 80
+        self.counter = counter
+        self.faults = faults
+        super().__init__((LOCALHOST, 0), _S3ProxyRequestHandler)
+
+
+# =============================================================================
+#
+# public functions
+#
+# =============================================================================
+
+# =============================================================================
+# start_moto_server
+# =============================================================================
+def start_moto_server() -> Tuple[subprocess.Popen, str]:
+    '''starts a moto server on a free local port
+
+    returns the process, which the caller terminates,
+    and the endpoint url
+    '''
+    port = _get_free_port()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'moto.server', '-p', str(port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    try:
+        _wait_for_port(port, MOTO_SERVER_START_TIMEOUT)
+    except RuntimeError:
+        process.terminate()
+        raise RuntimeError('moto server did not start,'
+                           ' is moto[server] installed?')
+    return process, f"http://{LOCALHOST}:{port}"
+
+
+# =============================================================================
+# start_proxy
+# =============================================================================
+def start_proxy(
+        upstream_url: str,
+        counter: Optional[S3RequestCounter] = None,
+        faults: Optional[S3Faults] = None
+) -> Tuple[http.server.ThreadingHTTPServer, str]:
+    '''starts a counting proxy in front of an s3 stand-in,
+    in a background thread, injecting the given faults, if any
+
+    returns the server, which the caller shuts down,
+    and the endpoint url to give the resources
+    '''
+    server = _S3ProxyServer(
+        upstream_url,
+        counter or S3RequestCounter(),
+        faults)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{LOCALHOST}:{server.server_address[1]}"
+
+
+# =============================================================================
+# create_bucket
+# =============================================================================
+def create_bucket(
+        endpoint: str,
+        bucket_name: str,
+        source: dict) -> None:
+    '''creates a bucket on the s3 stand-in, unless it exists,
+    with the credentials and region of a resource source
+    '''
+    import boto3
+    s3_client = boto3.client(
+        's3',
+        endpoint_url=endpoint,
+        region_name=source['region_name'],
+        aws_access_key_id=source['access_key_id'],
+        aws_secret_access_key=source['secret_access_key'])
+    bucket_names = [
+        bucket['Name'] for bucket in s3_client.list_buckets()['Buckets']
+    ]
+    if bucket_name not in bucket_names:
+        s3_client.create_bucket(Bucket=bucket_name)
+
+
+# =============================================================================
+# get_percentile
+# =============================================================================
+def get_percentile(values: List[float], percentile: int) -> float:
+    # nearest rank, so every reported time was actually measured
+    sorted_values = sorted(values)
+    rank = math.ceil(percentile / 100 * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
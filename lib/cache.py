@@ -0,0 +1,270 @@
+# stdlib
+import hashlib
+import json
+import os
+import shutil
+from typing import Optional
+
+# local
+from lib.log import log
+
+
+# =============================================================================
+#
+# constants
+#
+# =============================================================================
+
+CACHE_DEFAULT_DIR_PATH: str = '/var/cache/concourse-cfssl-resource'
+CACHE_DEFAULT_MAX_SIZE: int = 16 * 1024 * 1024
+CACHE_OBJECTS_SUBDIR: str = 'objects'
+CACHE_RECORDS_SUBDIR: str = 'records'
+CACHE_DIR_MODE: int = 0o700
+CACHE_PUBLIC_FILE_MODE: int = 0o644
+CACHE_PRIVATE_FILE_MODE: int = 0o600
+
+
+# =============================================================================
+#
+# private functions
+#
+# =============================================================================
+
+# =============================================================================
+# _get_objects_dir_path
+# =============================================================================
+def _get_objects_dir_path(cache_dir_path: str) -> str:
+    return os.path.join(cache_dir_path, CACHE_OBJECTS_SUBDIR)
+
+
+# =============================================================================
+# _get_object_file_path
+# =============================================================================
+def _get_object_file_path(cache_dir_path: str, checksum: str) -> str:
+    # checksums are hex digests, but make sure a
+    # malformed value can never escape the cache dir
+    if not checksum or not all(c in '0123456789abcdef' for c in checksum):
+        raise ValueError(f"invalid cache checksum '{checksum}'")
+    return os.path.join(_get_objects_dir_path(cache_dir_path), checksum)
+
+
+# =============================================================================
+# _get_records_dir_path
+# =============================================================================
+def _get_records_dir_path(cache_dir_path: str) -> str:
+    return os.path.join(cache_dir_path, CACHE_RECORDS_SUBDIR)
+
+
+# =============================================================================
+# _get_record_file_path
+# =============================================================================
+def _get_record_file_path(cache_dir_path: str, record_name: str) -> str:
+    # record names are hashed, so any string can be used as a name
+    record_name_hash = hashlib.sha256(record_name.encode('utf-8')).hexdigest()
+    return os.path.join(
+        _get_records_dir_path(cache_dir_path),
+        f"{record_name_hash}.json")
+
+
+# =============================================================================
+# _ensure_dir
+# =============================================================================
+def _ensure_dir(dir_path: str) -> None:
+    os.makedirs(dir_path, mode=CACHE_DIR_MODE, exist_ok=True)
+
+
+# =============================================================================
+# _remove_file
+# =============================================================================
+def _remove_file(file_path: str) -> None:
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+# =============================================================================
+#
+# public functions
+#
+# =============================================================================
+
+# =============================================================================
+# read_object
+# =============================================================================
+def read_object(cache_dir_path: str, checksum: str) -> Optional[bytes]:
+    '''reads a cached object by checksum
+
+    returns None on a miss
+
+    the contents are verified against the checksum, and a corrupt
+    entry is evicted and treated as a miss
+
+    a hit refreshes the entry's modification time,
+    which is what eviction orders entries by
+    '''
+    object_file_path = _get_object_file_path(cache_dir_path, checksum)
+    try:
+        with open(object_file_path, 'rb') as object_file:
+            contents = object_file.read()
+    except FileNotFoundError:
+        return None
+    if hashlib.sha256(contents).hexdigest() != checksum:
+        log(f"evicting corrupt cache entry: {checksum}")
+        _remove_file(object_file_path)
+        return None
+    os.utime(object_file_path)
+    return contents
+
+
+# =============================================================================
+# write_object
+# =============================================================================
+def write_object(
+        cache_dir_path: str,
+        checksum: str,
+        contents: bytes,
+        private: bool = False) -> None:
+    '''writes an object into the cache under its checksum
+
+    private objects are only readable by the owner
+
+    the entry is written to a temp file and renamed into place,
+    so concurrent readers never see a partial entry
+    '''
+    object_file_path = _get_object_file_path(cache_dir_path, checksum)
+    _ensure_dir(_get_objects_dir_path(cache_dir_path))
+    temp_file_path = f"{object_file_path}.{os.urandom(4).hex()}.tmp"
+    file_mode = \
+        CACHE_PRIVATE_FILE_MODE if private else CACHE_PUBLIC_FILE_MODE
+    try:
+        temp_file_descriptor = os.open(
+            temp_file_path,
+            os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+            file_mode)
+        with os.fdopen(temp_file_descriptor, 'wb') as temp_file:
+            temp_file.write(contents)
+        # apply the mode explicitly, as os.open is subject to the umask
+        os.chmod(temp_file_path, file_mode)
+        os.replace(temp_file_path, object_file_path)
+    except BaseException:
+        _remove_file(temp_file_path)
+        raise
+
+
+# =============================================================================
+# link_object
+# =============================================================================
+def link_object(
+        cache_dir_path: str,
+        checksum: str,
+        destination_file_path: str) -> bool:
+    '''materialises a cached object at a destination file path
+
+    the destination is hardlinked to the cache entry when possible,
+    otherwise the entry is copied
+
+    the entry is verified first, like a read, as a linked file edited
+    in place after an earlier link edits the entry along with it.
+    a corrupt entry is evicted, and a hit refreshes its modification time
+
+    returns False if the object is not cached
+    '''
+    if read_object(cache_dir_path, checksum) is None:
+        return False
+    object_file_path = _get_object_file_path(cache_dir_path, checksum)
+    temp_file_path = f"{destination_file_path}.{os.urandom(4).hex()}.tmp"
+    try:
+        try:
+            os.link(object_file_path, temp_file_path)
+        except FileNotFoundError:
+            return False
+        except OSError:
+            # cross-device or unsupported, fall back to a copy
+            shutil.copy2(object_file_path, temp_file_path)
+        os.replace(temp_file_path, destination_file_path)
+        # renaming a link over another link to the same entry
+        # does nothing, leaving the temp file in place
+        _remove_file(temp_file_path)
+    except BaseException:
+        _remove_file(temp_file_path)
+        raise
+    return True
+
+
+# =============================================================================
+# evict_objects
+# =============================================================================
+def evict_objects(cache_dir_path: str, max_size: int) -> None:
+    '''evicts the least recently used objects
+    until the cache is no larger than max_size bytes
+    '''
+    objects_dir_path = _get_objects_dir_path(cache_dir_path)
+    try:
+        entries = list(os.scandir(objects_dir_path))
+    except FileNotFoundError:
+        return
+    object_stats = []
+    for entry in entries:
+        if entry.name.endswith('.tmp'):
+            continue
+        try:
+            object_stats.append((entry.path, entry.stat()))
+        except FileNotFoundError:
+            continue
+    cache_size = sum(stat.st_size for _, stat in object_stats)
+    for object_file_path, stat in \
+            sorted(object_stats, key=lambda item: item[1].st_mtime):
+        if cache_size <= max_size:
+            break
+        _remove_file(object_file_path)
+        cache_size -= stat.st_size
+
+
+# =============================================================================
+# read_record
+# =============================================================================
+def read_record(cache_dir_path: str, record_name: str) -> Optional[dict]:
+    '''reads a json record by name
+
+    returns None if the record is missing or unreadable
+    '''
+    record_file_path = _get_record_file_path(cache_dir_path, record_name)
+    try:
+        with open(record_file_path, 'r') as record_file:
+            return json.load(record_file)
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        log(f"evicting corrupt cache record: {record_name}")
+        _remove_file(record_file_path)
+        return None
+
+
+# =============================================================================
+# write_record
+# =============================================================================
+def write_record(
+        cache_dir_path: str,
+        record_name: str,
+        record: dict) -> None:
+    '''writes a json record by name
+
+    records are only readable by the owner, as they may hold
+    anything from object metadata to credentials
+    '''
+    record_file_path = _get_record_file_path(cache_dir_path, record_name)
+    _ensure_dir(_get_records_dir_path(cache_dir_path))
+    temp_file_path = f"{record_file_path}.{os.urandom(4).hex()}.tmp"
+    try:
+        temp_file_descriptor = os.open(
+            temp_file_path,
+            os.O_WRONLY | os.O_CREAT | os.O_EXCL,
+            CACHE_PRIVATE_FILE_MODE)
+        with os.fdopen(temp_file_descriptor, 'w') as temp_file:
+            json.dump(record, temp_file)
+        os.chmod(temp_file_path, CACHE_PRIVATE_FILE_MODE)
+        os.replace(temp_file_path, record_file_path)
+    except BaseException:
+        _remove_file(temp_file_path)
+        raise
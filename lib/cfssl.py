@@ -3,31 +3,32 @@ import json
 import os
 import subprocess
 from datetime import datetime, timedelta, timezone
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 # local
-import lib.concourse
+import lib.trace
+import lib.x509
 from lib.log import log
 
 #
 # renew root:
 #
 
-# cfssl gencert -renewca -ca root-ca.pem -ca-key root-ca-key.pem | cfssljson -bare root-ca
+# cfssl gencert -renewca -ca root-ca.pem -ca-key root-ca-key.pem
 
 #
 # renew intermediate:
 #
 
-# cfssl gencsr -key intermediate-ca-key.pem -cert intermediate-ca.pem | cfssljson -bare intermediate-ca
-# cfssl sign -ca root-ca.pem -ca-key root-ca-key.pem -config config.json -profile ca intermediate-ca.csr | cfssljson -bare intermediate-ca
+# cfssl gencsr -key intermediate-ca-key.pem -cert intermediate-ca.pem
+# cfssl sign -ca root-ca.pem -ca-key root-ca-key.pem -config config.json -profile ca -
 
 #
 # renew leaf:
 #
 
-# cfssl gencsr -key server-key.pem -cert server.pem | cfssljson -bare server
-# cfssl sign -ca intermediate-ca.pem -ca-key intermediate-ca-key.pem -config config.json -profile leaf server.csr | cfssljson -bare server
+# cfssl gencsr -key server-key.pem -cert server.pem
+# cfssl sign -ca intermediate-ca.pem -ca-key intermediate-ca-key.pem -config config.json -profile leaf -
 
 # =============================================================================
 #
@@ -36,9 +37,10 @@ from lib.log import log
 # =============================================================================
 
 CFSSL_DATETIME_FORMAT: str = '%Y-%m-%dT%H:%M:%S%z'
-CFSSL_WORKSPACE_DIR_PATH: str = '/tmp/cfssl'
 CFSSL_BIN_FILE_PATH: str = '/root/go/bin/cfssl'
-CFSSLJSON_BIN_FILE_PATH: str = '/root/go/bin/cfssljson'
+# the fields of cfssl json output, which cfssljson -bare
+# would write to {prefix}.pem, {prefix}-key.pem, and {prefix}.csr
+CFSSL_OUTPUT_FIELD_NAMES: List[str] = ['cert', 'key', 'csr']
 ROOT_CA_DEFAULT_KEY_ALGORITHM: str = 'rsa'
 ROOT_CA_DEFAULT_KEY_SIZE: int = 2048
 ROOT_CA_DEFAULT_EXPIRY: str = '87600h'
@@ -55,6 +57,11 @@ LEAF_DEFAULT_USAGES: List[str] = \
      'server auth',
      'client auth']
 LEAF_SIGNING_CONFIG_FILE_NAME: str = 'leaf-config.json'
+# a private key claimed from the key pool, see create_leaf
+POOLED_PRIVATE_KEY_FILE_NAME: str = 'pooled-key.pem'
+POOLED_PRIVATE_KEY_FILE_MODE: int = 0o600
+# the maximum number of cfssl processes generating keys at the same time
+KEY_GENERATION_MAX_CONCURRENCY: int = os.cpu_count() or 1
 
 
 # =============================================================================
@@ -67,10 +74,12 @@ LEAF_SIGNING_CONFIG_FILE_NAME: str = 'leaf-config.json'
 # _run
 # =============================================================================
 def _run(bin: str, *args: str, input=None) -> subprocess.CompletedProcess:
-    command_output = subprocess.run([bin] + list(args),
-                                    capture_output=True,
-                                    encoding='utf-8',
-                                    input=input)
+    # trace each subcommand, e.g. cfssl.gencert
+    with lib.trace.span(f"{os.path.basename(bin)}.{args[0]}"):
+        command_output = subprocess.run([bin] + list(args),
+                                        capture_output=True,
+                                        encoding='utf-8',
+                                        input=input)
     # log stderr if present
     if command_output.stderr:
         log(f"{bin} stderr:")
@@ -93,24 +102,84 @@ def _cfssl(*args: str, input=None) -> subprocess.CompletedProcess:
 
 
 # =============================================================================
-# _cfssljson
+# _decode_cfssl_output
 # =============================================================================
-def _cfssljson(*args: str, input=None) -> subprocess.CompletedProcess:
-    return _run(CFSSLJSON_BIN_FILE_PATH,
-                *args,
-                input=input)
+def _decode_cfssl_output(
+        cfssl_output: subprocess.CompletedProcess) -> Dict[str, bytes]:
+    '''decodes the json written by cfssl in process,
+    in place of piping it to cfssljson -bare
+
+    returns whichever of the pem encoded cert, key, and csr are
+    present, byte for byte as cfssljson would write them
+    '''
+    output = json.loads(cfssl_output.stdout)
+    return {
+        field_name: output[field_name].encode('utf-8')
+        for field_name in CFSSL_OUTPUT_FIELD_NAMES
+        if output.get(field_name)
+    }
+
+
+# =============================================================================
+# _write_pooled_private_key
+# =============================================================================
+def _write_pooled_private_key(
+        repository_dir_path: str,
+        private_key: bytes) -> str:
+    # cfssl reads keys from files, only readable by their owner
+    private_key_file_path = os.path.join(
+        repository_dir_path,
+        POOLED_PRIVATE_KEY_FILE_NAME)
+    file_descriptor = os.open(
+        private_key_file_path,
+        os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+        POOLED_PRIVATE_KEY_FILE_MODE)
+    with open(file_descriptor, 'wb') as private_key_file:
+        private_key_file.write(private_key)
+    return private_key_file_path
+
+
+# =============================================================================
+# _generate_signing_request
+# =============================================================================
+def _generate_signing_request(
+        signing_request: dict,
+        private_key_file_path: str) -> bytes:
+    # creates a csr for an existing private key
+    # from a signing request holding the CN and hosts
+    cfssl_output = _cfssl(
+        'gencsr',
+        '-key',
+        private_key_file_path,
+        '-loglevel=0',
+        '-',
+        input=json.dumps(signing_request))
+    return _decode_cfssl_output(cfssl_output)['csr']
+
+
+# =============================================================================
+# _generate_private_key
+# =============================================================================
+def _generate_private_key(key_request: dict) -> bytes:
+    # genkey also creates a csr, which is discarded
+    cfssl_output = _cfssl(
+        'genkey',
+        '-loglevel=0',
+        '-',
+        input=json.dumps({'key': key_request}))
+    return _decode_cfssl_output(cfssl_output)['key']
 
 
 # =============================================================================
 #
-# private pki functions
+# public pki functions
 #
 # =============================================================================
 
 # =============================================================================
-# _create_root_ca_signing_request
+# create_root_ca_signing_request
 # =============================================================================
-def _create_root_ca_signing_request(payload: dict) -> dict:
+def create_root_ca_signing_request(payload: dict) -> dict:
     # create the base request
     signing_request: dict = {
         'CN': payload['params']['CN'],
@@ -151,9 +220,9 @@ def _create_root_ca_signing_request(payload: dict) -> dict:
 
 
 # =============================================================================
-# _create_intermediate_ca_signing_config
+# create_intermediate_ca_signing_config
 # =============================================================================
-def _create_intermediate_ca_signing_config(payload: dict) -> dict:
+def create_intermediate_ca_signing_config(payload: dict) -> dict:
     # create the base signing config
     signing_config: dict = {
         'signing': {
@@ -186,9 +255,9 @@ def _create_intermediate_ca_signing_config(payload: dict) -> dict:
 
 
 # =============================================================================
-# _create_intermediate_ca_signing_request
+# create_intermediate_ca_signing_request
 # =============================================================================
-def _create_intermediate_ca_signing_request(payload: dict) -> dict:
+def create_intermediate_ca_signing_request(payload: dict) -> dict:
     # create the base request
     signing_request: dict = {
         'key': {
@@ -218,9 +287,9 @@ def _create_intermediate_ca_signing_request(payload: dict) -> dict:
 
 
 # =============================================================================
-# _create_leaf_signing_config
+# create_leaf_signing_config
 # =============================================================================
-def _create_leaf_signing_config(payload: dict) -> dict:
+def create_leaf_signing_config(payload: dict) -> dict:
     # create the base signing config
     signing_config: dict = {
         'signing': {
@@ -249,9 +318,9 @@ def _create_leaf_signing_config(payload: dict) -> dict:
 
 
 # =============================================================================
-# _create_leaf_signing_request
+# create_leaf_signing_request
 # =============================================================================
-def _create_leaf_signing_request(payload: dict) -> dict:
+def create_leaf_signing_request(payload: dict) -> dict:
     # create the base request
     signing_request: dict = {
         'key': {
@@ -291,10 +360,9 @@ def _create_leaf_signing_request(payload: dict) -> dict:
 # =============================================================================
 def get_certificate_info(
         certificate_file_path: str) -> dict:
-    # get certinfo json
-    certinfo_output = _cfssl('certinfo', '-cert', certificate_file_path)
-    # return parsed json
-    return json.loads(certinfo_output.stdout)
+    # parse in process, rather than with cfssl certinfo
+    with open(certificate_file_path, 'rb') as certificate_file:
+        return lib.x509.get_certificate_info(certificate_file.read())
 
 
 # =============================================================================
@@ -341,6 +409,27 @@ def get_duration_until_certificate_expiration(
     return certificate_expiration_date - datetime.now(timezone.utc)
 
 
+# =============================================================================
+# generate_private_keys
+# =============================================================================
+def generate_private_keys(key_requests: List[dict]) -> List[bytes]:
+    '''generates a pem encoded private key for each key request,
+    e.g. {'algo': 'rsa', 'size': 2048}
+
+    several keys are generated by concurrent cfssl processes
+    '''
+    if len(key_requests) < 2:
+        return [
+            _generate_private_key(key_request)
+            for key_request in key_requests
+        ]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(
+            max_workers=min(len(key_requests),
+                            KEY_GENERATION_MAX_CONCURRENCY)) as executor:
+        return list(executor.map(_generate_private_key, key_requests))
+
+
 # =============================================================================
 #
 # public lifecycle functions
@@ -351,11 +440,9 @@ def get_duration_until_certificate_expiration(
 # create_root_ca
 # =============================================================================
 def create_root_ca(
-        payload: dict,
-        destination_dir_path: str,
-        file_prefix: str) -> None:
+        payload: dict) -> Dict[str, bytes]:
     # create root ca signing request
-    root_ca_signing_request = _create_root_ca_signing_request(payload)
+    root_ca_signing_request = create_root_ca_signing_request(payload)
 
     # generate the root ca
     cfssl_output = _cfssl('gencert',
@@ -364,11 +451,8 @@ def create_root_ca(
                           '-',
                           input=json.dumps(root_ca_signing_request))
 
-    # capture the output to file
-    _cfssljson('-bare',
-               os.path.join(destination_dir_path,
-                            file_prefix),
-               input=cfssl_output.stdout)
+    # return the cert, key, and csr
+    return _decode_cfssl_output(cfssl_output)
 
 
 # =============================================================================
@@ -377,15 +461,15 @@ def create_root_ca(
 def create_intermediate_ca(
         payload: dict,
         repository_dir_path: str,
-        file_prefix: str,
         root_ca_certificate_file_name: str,
-        root_ca_private_key_file_name: str) -> None:
+        root_ca_private_key_file_name: str,
+        private_key: Optional[bytes] = None) -> Dict[str, bytes]:
     # create intermediate ca signing request
     intermediate_ca_signing_request = \
-        _create_intermediate_ca_signing_request(payload)
+        create_intermediate_ca_signing_request(payload)
     # create intermediate ca signing config
     intermediate_ca_signing_config = \
-        _create_intermediate_ca_signing_config(payload)
+        create_intermediate_ca_signing_config(payload)
     # write intermediate ca signing config to file
     intermediate_ca_signing_config_file_path = \
         os.path.join(repository_dir_path,
@@ -403,6 +487,32 @@ def create_intermediate_ca(
             repository_dir_path,
             root_ca_private_key_file_name)
     intermediate_ca_common_name = payload['params']['CN']
+    # sign a csr for the given private key, if present
+    if private_key is not None:
+        intermediate_ca_certificate_signing_request = \
+            _generate_signing_request(
+                {
+                    **intermediate_ca_signing_request,
+                    'CN': intermediate_ca_common_name
+                },
+                _write_pooled_private_key(
+                    repository_dir_path,
+                    private_key))
+        cfssl_output = _cfssl(
+            'sign',
+            f"-ca={root_ca_certificate_file_path}",
+            f"-ca-key={root_ca_private_key_file_path}",
+            f"-config={intermediate_ca_signing_config_file_path}",
+            '-profile=ca',
+            '-loglevel=0',
+            '-',
+            input=intermediate_ca_certificate_signing_request.decode(
+                'utf-8'))
+        return {
+            **_decode_cfssl_output(cfssl_output),
+            'key': private_key,
+            'csr': intermediate_ca_certificate_signing_request
+        }
     cfssl_output = _cfssl(
         'gencert',
         f"-ca={root_ca_certificate_file_path}",
@@ -413,11 +523,8 @@ def create_intermediate_ca(
         '-loglevel=0',
         '-',
         input=json.dumps(intermediate_ca_signing_request))
-    # capture the output to file
-    _cfssljson('-bare',
-               os.path.join(repository_dir_path,
-                            file_prefix),
-               input=cfssl_output.stdout)
+    # return the cert, key, and csr
+    return _decode_cfssl_output(cfssl_output)
 
 
 # =============================================================================
@@ -426,15 +533,15 @@ def create_intermediate_ca(
 def create_leaf(
         payload: dict,
         repository_dir_path: str,
-        file_prefix: str,
         intermediate_ca_certificate_file_name: str,
-        intermediate_ca_private_key_file_name: str) -> None:
+        intermediate_ca_private_key_file_name: str,
+        private_key: Optional[bytes] = None) -> Dict[str, bytes]:
     # create leaf signing request
     leaf_signing_request = \
-        _create_leaf_signing_request(payload)
+        create_leaf_signing_request(payload)
     # create leaf signing config
     leaf_signing_config = \
-        _create_leaf_signing_config(payload)
+        create_leaf_signing_config(payload)
     # write leaf signing config to file
     leaf_signing_config_file_path = \
         os.path.join(repository_dir_path,
@@ -466,17 +573,137 @@ def create_leaf(
             cfssl_gencert_args.append(
                 '-hostname='
                 f"{','.join(payload['params']['leaf']['hosts'])}")
+    # sign a csr for the given private key, if present
+    if private_key is not None:
+        leaf_certificate_signing_request = _generate_signing_request(
+            {**leaf_signing_request, 'CN': leaf_common_name},
+            _write_pooled_private_key(
+                repository_dir_path,
+                private_key))
+        # sign takes the same arguments, except -cn
+        cfssl_output = _cfssl(
+            'sign',
+            *[arg for arg in cfssl_gencert_args
+              if not arg.startswith('-cn=')],
+            '-loglevel=0',
+            '-',
+            input=leaf_certificate_signing_request.decode('utf-8'))
+        return {
+            **_decode_cfssl_output(cfssl_output),
+            'key': private_key,
+            'csr': leaf_certificate_signing_request
+        }
     cfssl_output = _cfssl(
         'gencert',
         *cfssl_gencert_args,
         '-loglevel=0',
         '-',
         input=json.dumps(leaf_signing_request))
-    # capture the output to file
-    _cfssljson('-bare',
-               os.path.join(repository_dir_path,
-                            file_prefix),
-               input=cfssl_output.stdout)
+    # return the cert, key, and csr
+    return _decode_cfssl_output(cfssl_output)
+
+
+# =============================================================================
+# create_intermediate_ca_key
+# =============================================================================
+def create_intermediate_ca_key(
+        payload: dict,
+        repository_dir_path: str,
+        private_key: Optional[bytes] = None) -> Dict[str, bytes]:
+    '''generates the intermediate ca private key and signing request,
+    without signing it, for a remote signer
+
+    when a private key is given, only the signing request is created
+    '''
+    # create intermediate ca signing request,
+    # genkey has no -cn argument
+    intermediate_ca_signing_request = {
+        **create_intermediate_ca_signing_request(payload),
+        'CN': payload['params']['CN']
+    }
+    # create a csr for the given private key, if present
+    if private_key is not None:
+        return {
+            'key': private_key,
+            'csr': _generate_signing_request(
+                intermediate_ca_signing_request,
+                _write_pooled_private_key(
+                    repository_dir_path,
+                    private_key))
+        }
+    # generate the key and csr
+    cfssl_output = _cfssl(
+        'genkey',
+        '-loglevel=0',
+        '-',
+        input=json.dumps(intermediate_ca_signing_request))
+    # return the key and csr
+    return _decode_cfssl_output(cfssl_output)
+
+
+# =============================================================================
+# create_leaf_key
+# =============================================================================
+def create_leaf_key(
+        payload: dict,
+        repository_dir_path: str,
+        private_key: Optional[bytes] = None) -> Dict[str, bytes]:
+    '''generates the leaf private key and signing request,
+    without signing it, for a remote signer
+
+    when a private key is given, only the signing request is created
+    '''
+    # create leaf signing request,
+    # genkey has no -cn or -hostname arguments
+    leaf_signing_request = {
+        **create_leaf_signing_request(payload),
+        'CN': payload['params']['CN']
+    }
+    # add hosts, if present
+    if 'leaf' in payload['params']:
+        if 'hosts' in payload['params']['leaf']:
+            leaf_signing_request['hosts'] = \
+                payload['params']['leaf']['hosts']
+    # create a csr for the given private key, if present
+    if private_key is not None:
+        return {
+            'key': private_key,
+            'csr': _generate_signing_request(
+                leaf_signing_request,
+                _write_pooled_private_key(
+                    repository_dir_path,
+                    private_key))
+        }
+    # generate the key and csr
+    cfssl_output = _cfssl(
+        'genkey',
+        '-loglevel=0',
+        '-',
+        input=json.dumps(leaf_signing_request))
+    # return the key and csr
+    return _decode_cfssl_output(cfssl_output)
+
+
+# =============================================================================
+# create_renewal_signing_request
+# =============================================================================
+def create_renewal_signing_request(
+    repository_dir_path: str,
+    certificate_file_name: str,
+    private_key_file_name: str
+) -> bytes:
+    '''creates a signing request from the current certificate
+    and private key, for a remote signer
+    '''
+    cfssl_output = _cfssl(
+        'gencsr',
+        '-cert',
+        os.path.join(repository_dir_path,
+                     certificate_file_name),
+        '-key',
+        os.path.join(repository_dir_path,
+                     private_key_file_name))
+    return _decode_cfssl_output(cfssl_output)['csr']
 
 
 # =============================================================================
@@ -484,10 +711,9 @@ def create_leaf(
 # =============================================================================
 def renew_root_certificate(
     repository_dir_path: str,
-    file_prefix: str,
     root_ca_certificate_file_name: str,
     root_ca_private_key_file_name: str
-) -> None:
+) -> Dict[str, bytes]:
     # determine file paths
     root_ca_certificate_file_path = \
         os.path.join(repository_dir_path,
@@ -505,27 +731,31 @@ def renew_root_certificate(
         '-ca-key',
         root_ca_private_key_file_path,
         '-loglevel=0')
-    # capture the output to file
-    _cfssljson('-bare',
-               os.path.join(repository_dir_path,
-                            file_prefix),
-               input=cfssl_output.stdout)
+    # return the cert and csr,
+    # the private key is unchanged
+    return _decode_cfssl_output(cfssl_output)
 
 
 # =============================================================================
 # renew_intermediate_certificate
 # =============================================================================
-# cfssl gencsr -key intermediate-ca-key.pem -cert intermediate-ca.pem | cfssljson -bare intermediate-ca
-# cfssl sign -ca root-ca.pem -ca-key root-ca-key.pem -config config.json -profile ca intermediate-ca.csr | cfssljson -bare intermediate-ca
+# cfssl gencsr -key intermediate-ca-key.pem -cert intermediate-ca.pem
+# cfssl sign -ca root-ca.pem -ca-key root-ca-key.pem -config config.json -profile ca -
 def renew_intermediate_certificate(
     payload: dict,
     repository_dir_path: str,
-    file_prefix: str,
     root_ca_certificate_file_name: str,
     root_ca_private_key_file_name: str,
     intermediate_ca_certificate_file_name: str,
-    intermediate_ca_private_key_file_name: str
-) -> None:
+    intermediate_ca_private_key_file_name: str,
+    certificate_request: Optional[bytes] = None
+) -> Dict[str, bytes]:
+    '''renews a certificate, keeping the private key
+
+    the certificate_request, when given, is signed as is,
+    instead of generating one from the current certificate
+    and private key
+    '''
     # determine file paths
     root_ca_certificate_file_path = \
         os.path.join(repository_dir_path,
@@ -540,25 +770,22 @@ def renew_intermediate_certificate(
         os.path.join(repository_dir_path,
                      intermediate_ca_private_key_file_name)
     # create a signing request from the
-    # current certificate and private key
-    cfssl_output = _cfssl(
-        'gencsr',
-        '-cert',
-        intermediate_ca_certificate_file_path,
-        '-key',
-        intermediate_ca_private_key_file_path)
-    # capture the output to file
-    _cfssljson('-bare',
-               os.path.join(repository_dir_path,
-                            file_prefix),
-               input=cfssl_output.stdout)
-    # determine csr file path
-    intermediate_ca_signing_request_file_path = \
-        os.path.join(repository_dir_path,
-                     f"{file_prefix}.csr")
+    # current certificate and private key,
+    # unless there is one already
+    intermediate_ca_signing_request = certificate_request
+    if intermediate_ca_signing_request is None:
+        cfssl_output = _cfssl(
+            'gencsr',
+            '-cert',
+            intermediate_ca_certificate_file_path,
+            '-key',
+            intermediate_ca_private_key_file_path)
+        # keep the csr in memory
+        intermediate_ca_signing_request = \
+            _decode_cfssl_output(cfssl_output)['csr']
     # create intermediate ca signing config
     intermediate_ca_signing_config = \
-        _create_intermediate_ca_signing_config(payload)
+        create_intermediate_ca_signing_config(payload)
     # write intermediate ca signing config to file
     intermediate_ca_signing_config_file_path = \
         os.path.join(repository_dir_path,
@@ -567,7 +794,7 @@ def renew_intermediate_certificate(
             as signing_config_file:
         json.dump(intermediate_ca_signing_config, signing_config_file)
     # sign the certificate using the root ca,
-    # the signing request,
+    # the signing request (read from stdin),
     # and the signing config
     cfssl_output = _cfssl(
         'sign',
@@ -579,28 +806,36 @@ def renew_intermediate_certificate(
         intermediate_ca_signing_config_file_path,
         '-profile=ca',
         '-loglevel=0',
-        intermediate_ca_signing_request_file_path)
-    # capture the output to file
-    _cfssljson('-bare',
-               os.path.join(repository_dir_path,
-                            file_prefix),
-               input=cfssl_output.stdout)
+        '-',
+        input=intermediate_ca_signing_request.decode('utf-8'))
+    # return the cert and csr,
+    # the private key is unchanged
+    return {
+        **_decode_cfssl_output(cfssl_output),
+        'csr': intermediate_ca_signing_request
+    }
 
 
 # =============================================================================
 # renew_leaf_certificate
 # =============================================================================
-# cfssl gencsr -key server-key.pem -cert server.pem | cfssljson -bare server
-# cfssl sign -ca intermediate-ca.pem -ca-key intermediate-ca-key.pem -config config.json -profile leaf server.csr | cfssljson -bare server
+# cfssl gencsr -key server-key.pem -cert server.pem
+# cfssl sign -ca intermediate-ca.pem -ca-key intermediate-ca-key.pem -config config.json -profile leaf -
 def renew_leaf_certificate(
     payload: dict,
     repository_dir_path: str,
-    file_prefix: str,
     intermediate_ca_certificate_file_name: str,
     intermediate_ca_private_key_file_name: str,
     leaf_certificate_file_name: str,
-    leaf_private_key_file_name: str
-) -> None:
+    leaf_private_key_file_name: str,
+    certificate_request: Optional[bytes] = None
+) -> Dict[str, bytes]:
+    '''renews a certificate, keeping the private key
+
+    the certificate_request, when given, is signed as is,
+    instead of generating one from the current certificate
+    and private key
+    '''
     # determine file paths
     intermediate_ca_certificate_file_path = \
         os.path.join(repository_dir_path,
@@ -615,25 +850,22 @@ def renew_leaf_certificate(
         os.path.join(repository_dir_path,
                      leaf_private_key_file_name)
     # create a signing request from the
-    # current certificate and private key
-    cfssl_output = _cfssl(
-        'gencsr',
-        '-cert',
-        leaf_certificate_file_path,
-        '-key',
-        leaf_private_key_file_path)
-    # capture the output to file
-    _cfssljson('-bare',
-               os.path.join(repository_dir_path,
-                            file_prefix),
-               input=cfssl_output.stdout)
-    # determine csr file path
-    leaf_signing_request_file_path = \
-        os.path.join(repository_dir_path,
-                     f"{file_prefix}.csr")
+    # current certificate and private key,
+    # unless there is one already
+    leaf_signing_request = certificate_request
+    if leaf_signing_request is None:
+        cfssl_output = _cfssl(
+            'gencsr',
+            '-cert',
+            leaf_certificate_file_path,
+            '-key',
+            leaf_private_key_file_path)
+        # keep the csr in memory
+        leaf_signing_request = \
+            _decode_cfssl_output(cfssl_output)['csr']
     # create leaf signing config
     leaf_signing_config = \
-        _create_leaf_signing_config(payload)
+        create_leaf_signing_config(payload)
     # write leaf ca signing config to file
     leaf_signing_config_file_path = \
         os.path.join(repository_dir_path,
@@ -656,14 +888,16 @@ def renew_leaf_certificate(
                 '-hostname='
                 f"{','.join(payload['params']['leaf']['hosts'])}")
     # sign the certificate using the intermediate ca
-    # the config file, and the signing request
+    # the config file, and the signing request (read from stdin)
     cfssl_output = _cfssl(
         'sign',
         *cfssl_gencert_args,
         '-loglevel=0',
-        leaf_signing_request_file_path)
-    # capture the output to file
-    _cfssljson('-bare',
-               os.path.join(repository_dir_path,
-                            file_prefix),
-               input=cfssl_output.stdout)
+        '-',
+        input=leaf_signing_request.decode('utf-8'))
+    # return the cert and csr,
+    # the private key is unchanged
+    return {
+        **_decode_cfssl_output(cfssl_output),
+        'csr': leaf_signing_request
+    }
@@ -1,20 +1,42 @@
+# future
+from __future__ import annotations
+
 # stdlib
+import base64
+import fnmatch
 import hashlib
 import json
 import os
+import string
 import sys
-import tempfile
-from datetime import timedelta
-from typing import Any, Optional
-
-# pip
-import boto3
-import botocore
+import urllib.parse
+from datetime import datetime, timedelta, timezone
+from typing import (TYPE_CHECKING, Any, Callable, Dict, List, Optional,
+                    Tuple)
 
 # local
-import lib.cfssl
+import lib.duration
+import lib.trace
 from lib.log import log
 
+# the modules below are imported on first use instead,
+# so each script only pays for the modules its code path needs
+# (e.g. check never loads lib.cfssl)
+# see ci/scripts/startup-benchmark
+#
+# - boto3 and botocore
+# - concurrent.futures
+# - lib.cache
+# - lib.cfssl
+# - lib.native
+if TYPE_CHECKING:
+    from types import ModuleType
+
+    import boto3.resources.base
+    import boto3.session
+    import botocore.config
+    import botocore.exceptions
+
 
 # =============================================================================
 #
@@ -23,16 +45,59 @@ from lib.log import log
 # =============================================================================
 
 CHECKSUM_METADATA_KEY_NAME: str = 'sha256'
+COMMON_NAME_METADATA_KEY_NAME: str = 'common-name'
+HOSTS_METADATA_KEY_NAME: str = 'hosts'
+ISSUE_DATE_METADATA_KEY_NAME: str = 'not-before'
+EXPIRATION_METADATA_KEY_NAME: str = 'not-after'
+
+# s3 limits the user metadata of an object to 2kb
+S3_MAX_METADATA_SIZE: int = 2048
+
+# printable characters kept as is in metadata values,
+# any other character is percent-encoded
+S3_METADATA_SAFE_CHARACTERS: str = \
+    ' ' + string.punctuation.replace('%', '')
+HASH_BUFFER_SIZE: int = 65536
+
+# maximum number of s3 requests issued at the same time
+# kept below botocore's default connection pool size (10)
+# so concurrent requests never wait on a pooled connection
+# see _get_s3_max_concurrency
+S3_MAX_CONCURRENCY: int = 8
+
+# assumed role credentials are refreshed this many seconds
+# before they expire, see _get_role_credentials
+ROLE_CREDENTIALS_DEFAULT_REFRESH_MARGIN: int = 300
+
+# source transport options, passed through to botocore's Config
+TRANSPORT_OPTION_NAMES: tuple = (
+    'max_pool_connections',
+    'connect_timeout',
+    'read_timeout',
+    'retries',
+    'tcp_keepalive'
+)
+
+CERTIFICATE_FILE_SUFFIX: str = '.pem'
+PRIVATE_KEY_FILE_SUFFIX: str = '-key.pem'
+MANIFEST_FILE_SUFFIX: str = '-manifest.json'
+MANIFEST_FORMAT_VERSION: int = 1
 
 ROOT_CA_FILE_PREFIX: str = 'root-ca'
-ROOT_CA_CERTIFICATE_FILE_NAME: str = f"{ROOT_CA_FILE_PREFIX}.pem"
-ROOT_CA_PRIVATE_KEY_FILE_NAME: str = f"{ROOT_CA_FILE_PREFIX}-key.pem"
+ROOT_CA_CERTIFICATE_FILE_NAME: str = \
+    f"{ROOT_CA_FILE_PREFIX}{CERTIFICATE_FILE_SUFFIX}"
+ROOT_CA_PRIVATE_KEY_FILE_NAME: str = \
+    f"{ROOT_CA_FILE_PREFIX}{PRIVATE_KEY_FILE_SUFFIX}"
+ROOT_CA_MANIFEST_FILE_NAME: str = \
+    f"{ROOT_CA_FILE_PREFIX}{MANIFEST_FILE_SUFFIX}"
 
 INTERMEDIATE_CA_FILE_PREFIX: str = 'intermediate-ca'
 INTERMEDIATE_CA_CERTIFICATE_FILE_NAME: str = \
-    f"{INTERMEDIATE_CA_FILE_PREFIX}.pem"
+    f"{INTERMEDIATE_CA_FILE_PREFIX}{CERTIFICATE_FILE_SUFFIX}"
 INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME: str = \
-    f"{INTERMEDIATE_CA_FILE_PREFIX}-key.pem"
+    f"{INTERMEDIATE_CA_FILE_PREFIX}{PRIVATE_KEY_FILE_SUFFIX}"
+INTERMEDIATE_CA_MANIFEST_FILE_NAME: str = \
+    f"{INTERMEDIATE_CA_FILE_PREFIX}{MANIFEST_FILE_SUFFIX}"
 
 CA_CERTIFICATE_CHAIN_FILE_PREFIX: str = 'ca-chain'
 CA_CERTIFICATE_CHAIN_FILE_NAME: str = \
@@ -40,6 +105,68 @@ CA_CERTIFICATE_CHAIN_FILE_NAME: str = \
 
 CA_SUBDIR: str = 'ca'
 
+# out works on the parent ca keypair, signing configs, and pooled keys
+# in a private dir on the first of these memory-backed filesystems
+# which is writable, see _get_workspace_dir_path
+WORKSPACE_MEMORY_DIR_PATHS: tuple = ('/dev/shm', '/run/shm')
+WORKSPACE_DIR_PREFIX: str = 'cfssl-'
+
+# the signing profiles requested from a remote signer, named
+# like the profiles of the signing configs used to sign locally
+INTERMEDIATE_CA_SIGNER_PROFILE: str = 'ca'
+LEAF_SIGNER_PROFILE: str = 'leaf'
+
+# keypair version history, see _get_keypair_version_history
+VERSION_HISTORY_DEFAULT_MAX_VERSIONS: int = 100
+VERSION_HISTORY_PAGE_SIZE: int = 1000
+
+# in multi-leaf mode, each leaf's keypair checksum
+# is part of the version under this key prefix
+MULTI_LEAF_VERSION_KEY_PREFIX: str = 'leaf:'
+
+# where the span of an api call is kept in its request context,
+# between the botocore events that start and end it
+# see _trace_boto3_session
+TRACE_SPAN_CONTEXT_KEY: str = 'cfssl_resource_trace_span'
+
+# pre-generated private keys, under {prefix}/key-pool/{algo}-{size}/
+# see _claim_pooled_private_key
+KEY_POOL_DIR_NAME: str = 'key-pool'
+KEY_POOL_DEFAULT_SIZE: int = 10
+KEY_POOL_CLAIM_FILE_SUFFIX: str = '.claim'
+# probes whether the store enforces conditional puts,
+# directly under the key pool dir so listings never see them
+KEY_POOL_PROBE_FILE_PREFIX: str = 'conditional-put-probe-'
+# claims older than this were left behind by an out
+# which failed before removing the key it claimed
+KEY_POOL_STALE_CLAIM_AGE: timedelta = timedelta(hours=1)
+# refill_key_pool emits a version holding the key pool dir name
+# under this key when there is no keypair yet
+KEY_POOL_VERSION_KEY: str = 'key_pool'
+
+
+# =============================================================================
+#
+# private state
+#
+# =============================================================================
+
+# verified s3 object contents fetched during this invocation
+# see _fetch_s3_object
+_s3_object_contents_memo: Dict[tuple, bytes] = {}
+
+# keypair manifests read during this invocation
+# see _get_keypair_manifest
+_keypair_manifest_memo: Dict[tuple, Optional[dict]] = {}
+
+# whether each bucket enforces conditional puts, probed during this invocation
+# see _is_conditional_put_enforced
+_conditional_put_enforced_memo: Dict[str, bool] = {}
+
+# the scratch dir out hands to the pki engines during this invocation
+# see _get_workspace_dir_path
+_workspace_dir_path: Optional[str] = None
+
 
 # =============================================================================
 #
@@ -62,18 +189,44 @@ def _hash_list(string_list: list) -> str:
 
 
 # =============================================================================
-# _hash_file
+# _hash_bytes
 # =============================================================================
-def _hash_file(file_path: str) -> str:
-    BUFFER_SIZE = 65536
-    file_hash = hashlib.sha256()
-    with open(file_path, 'rb') as file:
-        while True:
-            file_data = file.read(BUFFER_SIZE)
-            if not file_data:
-                break
-            file_hash.update(file_data)
-    return file_hash.hexdigest()
+def _hash_bytes(contents: bytes) -> str:
+    return hashlib.sha256(contents).hexdigest()
+
+
+# =============================================================================
+#
+# private concurrency functions
+#
+# =============================================================================
+
+# =============================================================================
+# _map_concurrently
+# =============================================================================
+def _map_concurrently(
+        payload: dict,
+        function: Callable,
+        items: list) -> list:
+    '''applies function to each item using a thread pool
+
+    the pool is bounded by the payload's s3 concurrency,
+    see _get_s3_max_concurrency
+
+    results are returned in the same order as items
+
+    if any call raises, the exception of the first failing item
+    (in item order) is raised after all calls have completed
+
+    a single item is run inline to avoid the thread pool overhead
+    '''
+    max_concurrency = _get_s3_max_concurrency(payload)
+    if len(items) < 2 or max_concurrency < 2:
+        return [function(item) for item in items]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(
+            max_workers=min(len(items), max_concurrency)) as executor:
+        return list(executor.map(function, items))
 
 
 # =============================================================================
@@ -104,28 +257,126 @@ def _get_payload_credentials(payload: dict) -> dict:
 
 
 # =============================================================================
-# _get_role_credentials
+# _get_botocore_config
 # =============================================================================
-def _get_role_credentials(payload: dict) -> dict:
-    initial_session = boto3.session.Session(
-        **_get_payload_credentials(payload))
-    session_name = payload['source'].get(
+def _get_botocore_config(payload: dict) -> botocore.config.Config:
+    '''creates the botocore config shared by the s3 and sts clients
+    from the transport source options
+
+    options which are not set keep botocore's defaults
+    '''
+    import botocore.config
+    transport = payload['source'].get('transport') or {}
+    for option_name in transport:
+        if option_name not in TRANSPORT_OPTION_NAMES:
+            raise ValueError(f"unknown transport option '{option_name}'")
+    return botocore.config.Config(**transport)
+
+
+# =============================================================================
+# _get_s3_max_concurrency
+# =============================================================================
+def _get_s3_max_concurrency(payload: dict) -> int:
+    # a configured connection pool bounds the number of
+    # concurrent requests, so they never wait on a pooled connection
+    transport = payload['source'].get('transport') or {}
+    if 'max_pool_connections' in transport:
+        return transport['max_pool_connections']
+    return S3_MAX_CONCURRENCY
+
+
+# =============================================================================
+# _get_role_session_name
+# =============================================================================
+def _get_role_session_name(payload: dict) -> str:
+    return payload['source'].get(
         'session_name',
         'concourse-cfssl-resource')
+
+
+# =============================================================================
+# _assume_role
+# =============================================================================
+def _assume_role(payload: dict) -> dict:
+    import boto3.session
+    initial_session = boto3.session.Session(
+        **_get_payload_credentials(payload))
+    _trace_boto3_session(initial_session)
     session_duration = payload['source'].get('session_duration', 900)
     sts_client = initial_session.client(
         'sts',
-        region_name=payload['source']['region_name'])
+        region_name=payload['source']['region_name'],
+        config=_get_botocore_config(payload))
     params = {
         'RoleArn': payload['source']['role_arn'],
-        'RoleSessionName': session_name,
+        'RoleSessionName': _get_role_session_name(payload),
         'DurationSeconds': session_duration,
     }
-    response = sts_client.assume_role(**params).get("Credentials")
+    return sts_client.assume_role(**params).get("Credentials")
+
+
+# =============================================================================
+# _get_role_credentials_record_name
+# =============================================================================
+def _get_role_credentials_record_name(payload: dict) -> str:
+    # the secret access key is part of the name, so a cached record
+    # is only ever reused by a client holding the same secret
+    # (record names are hashed, so it is never written in the clear)
+    return 'role-credentials:' + json.dumps([
+        payload['source']['access_key_id'],
+        payload['source']['secret_access_key'],
+        payload['source']['role_arn'],
+        _get_role_session_name(payload),
+        payload['source']['region_name']
+    ])
+
+
+# =============================================================================
+# _are_role_credentials_fresh
+# =============================================================================
+def _are_role_credentials_fresh(payload: dict, record: dict) -> bool:
+    refresh_margin = payload['source'].get(
+        'session_refresh_margin',
+        ROLE_CREDENTIALS_DEFAULT_REFRESH_MARGIN)
+    try:
+        expiration = datetime.fromisoformat(record['expiration'])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return (datetime.now(timezone.utc) + timedelta(seconds=refresh_margin) <
+            expiration)
+
+
+# =============================================================================
+# _get_role_credentials
+# =============================================================================
+def _get_role_credentials(payload: dict) -> dict:
+    '''gets credentials for role_arn
+
+    when the cache is enabled, assumed role credentials are kept
+    as a cache record, and reused by later invocations until
+    session_refresh_margin seconds before they expire,
+    instead of calling sts:AssumeRole every time
+    '''
+    record_name = _get_role_credentials_record_name(payload)
+    record = None
+    if 'cache' in payload['source']:
+        record = _read_cache_record(payload, record_name)
+    if record and _are_role_credentials_fresh(payload, record):
+        log('using cached role credentials')
+    else:
+        response = _assume_role(payload)
+        record = {
+            'access_key_id': response['AccessKeyId'],
+            'secret_access_key': response['SecretAccessKey'],
+            'session_token': response['SessionToken'],
+            'expiration': response['Expiration'].isoformat()
+        }
+        if 'cache' in payload['source']:
+            _write_cache_record(payload, record_name, record)
     return {
-        'aws_access_key_id': response['AccessKeyId'],
-        'aws_secret_access_key': response['SecretAccessKey'],
-        'aws_session_token': response['SessionToken'],
+        'aws_access_key_id': record['access_key_id'],
+        'aws_secret_access_key': record['secret_access_key'],
+        'aws_session_token': record['session_token'],
         'region_name': payload['source']['region_name']
     }
 
@@ -138,7 +389,43 @@ def _get_boto3_session(payload: dict) -> boto3.session.Session:
         credentials = _get_role_credentials(payload)
     else:
         credentials = _get_payload_credentials(payload)
-    return boto3.session.Session(**credentials)
+    with lib.trace.span('boto3.session'):
+        import boto3.session
+        boto3_session = boto3.session.Session(**credentials)
+    _trace_boto3_session(boto3_session)
+    return boto3_session
+
+
+# =============================================================================
+# _trace_boto3_session
+# =============================================================================
+def _trace_boto3_session(boto3_session: boto3.session.Session) -> None:
+    '''records a span for every api call made by the session's clients,
+    named like s3.HeadObject, from building the request until its
+    response is parsed, retries included
+
+    a GetObject span ends once the response headers are parsed,
+    so reading the body is not part of it
+    '''
+    def start_api_call_span(model, params: dict, context: dict,
+                            **kwargs) -> None:
+        context[TRACE_SPAN_CONTEXT_KEY] = lib.trace.span(
+            f"{model.service_model.endpoint_prefix}.{model.name}",
+            path=params.get('url_path'))
+
+    def end_api_call_span(context: dict, http_response=None,
+                          exception=None, **kwargs) -> None:
+        api_call_span = context.pop(TRACE_SPAN_CONTEXT_KEY, None)
+        if api_call_span is None:
+            return
+        if http_response is not None:
+            api_call_span.end(status=http_response.status_code)
+        else:
+            api_call_span.end(error=type(exception).__name__)
+
+    boto3_session.events.register('before-call', start_api_call_span)
+    boto3_session.events.register('after-call', end_api_call_span)
+    boto3_session.events.register('after-call-error', end_api_call_span)
 
 
 # =============================================================================
@@ -148,12 +435,14 @@ def _get_s3_resource(
     payload: dict,
     boto3_session: boto3.session.Session
 ) -> boto3.resources.base.ServiceResource:
-    return boto3_session.resource(
-        's3',
-        endpoint_url=payload['source'].get('endpoint'),
-        use_ssl=(False if
-                 payload['source'].get('disable_ssl')
-                 else True))
+    with lib.trace.span('s3.resource'):
+        return boto3_session.resource(
+            's3',
+            endpoint_url=payload['source'].get('endpoint'),
+            use_ssl=(False if
+                     payload['source'].get('disable_ssl')
+                     else True),
+            config=_get_botocore_config(payload))
 
 
 # =============================================================================
@@ -177,6 +466,23 @@ def _get_s3_object(
 def _get_s3_object_checksum(
     s3_object: boto3.resources.base.ServiceResource
 ) -> boto3.resources.base.ServiceResource:
+    checksum = _get_s3_object_metadata_value(
+        s3_object,
+        CHECKSUM_METADATA_KEY_NAME)
+    # if the checksum is missing, throw a key error
+    if checksum is None:
+        raise KeyError(
+            f"metadata key '{CHECKSUM_METADATA_KEY_NAME}' not found")
+    return checksum
+
+
+# =============================================================================
+# _get_s3_object_metadata_value
+# =============================================================================
+def _get_s3_object_metadata_value(
+    s3_object: boto3.resources.base.ServiceResource,
+    metadata_key_name: str
+) -> Optional[str]:
     # workaround for https://github.com/boto/boto3/issues/1709
     # which results in case-sensitive keys.
     # since it's impossible to end up with two different keys
@@ -188,44 +494,435 @@ def _get_s3_object_checksum(
     # metadata key does not matter, by design
 
     # loop through each key in the metadata dict
-    for key in s3_object.metadata.keys():
+    metadata = s3_object.metadata
+    for key in metadata.keys():
         # if the lowercased version of the key
         # matches the lowercased version of the expected key
-        if key.lower() == CHECKSUM_METADATA_KEY_NAME.lower():
+        if key.lower() == metadata_key_name.lower():
             # return the actual key's value
-            return s3_object.metadata[key]
-    # otherwise, if we didn't return, throw a key error
-    raise KeyError(f"metadata key '{CHECKSUM_METADATA_KEY_NAME}' not found")
+            return metadata[key]
+    # otherwise, if we didn't return, the key is missing
+    return None
+
+
+# =============================================================================
+# _S3ObjectVersion
+# =============================================================================
+class _S3ObjectVersion:
+    '''an s3 object pinned to a single version
+
+    provides the parts of the s3 object resource interface
+    used by this module, making every request for that version
+    '''
+
+    def __init__(self, s3_object, version_id: str) -> None:
+        self.bucket_name = s3_object.bucket_name
+        self.key = s3_object.key
+        self.version_id = version_id
+        self._s3_object = s3_object
+        self._head_response: Optional[dict] = None
+
+    def _head(self) -> dict:
+        if self._head_response is None:
+            self._head_response = self._s3_object.meta.client.head_object(
+                Bucket=self.bucket_name,
+                Key=self.key,
+                VersionId=self.version_id)
+        return self._head_response
+
+    @property
+    def metadata(self) -> dict:
+        return self._head()['Metadata']
+
+    @property
+    def e_tag(self) -> str:
+        return self._head()['ETag']
+
+    def get(self, **params) -> dict:
+        return self._s3_object.get(VersionId=self.version_id, **params)
+
+
+# =============================================================================
+# _get_s3_object_checksums
+# =============================================================================
+def _get_s3_object_checksums(payload: dict, *s3_objects) -> List[str]:
+    '''gets the checksums of several s3 objects concurrently
+
+    each object results in its own HeadObject call,
+    all of which share the connection pool of the
+    client backing the s3 resource the objects were created from
+
+    checksums are returned in the same order as the objects
+    '''
+    return _map_concurrently(
+        payload,
+        _get_s3_object_checksum,
+        list(s3_objects))
+
+
+# =============================================================================
+# _is_missing_s3_object_error
+# =============================================================================
+def _is_missing_s3_object_error(
+    error: botocore.exceptions.ClientError
+) -> bool:
+    '''checks if a client error indicates a missing object
+
+    s3 answers not found when the client may list the bucket,
+    and forbidden to a HeadObject call otherwise
+
+    an access denied answer to a GetObject call is not treated as
+    missing, as it is also given for objects that exist but may not
+    be read, and must be handled by callers that expect it
+    '''
+    if 'Error' not in error.response:
+        return False
+    error_code = error.response['Error'].get('Code')
+    error_message = error.response['Error'].get('Message')
+    return (error_code in ('404', 'NoSuchKey') or
+            (error_code == '403' and error_message == 'Forbidden'))
+
+
+# =============================================================================
+# _is_not_modified_s3_error
+# =============================================================================
+def _is_not_modified_s3_error(
+    error: botocore.exceptions.ClientError
+) -> bool:
+    return ('Error' in error.response and
+            error.response['Error'].get('Code') in ('304', 'NotModified'))
+
+
+# =============================================================================
+# _is_access_denied_s3_error
+# =============================================================================
+def _is_access_denied_s3_error(
+    error: botocore.exceptions.ClientError
+) -> bool:
+    return ('Error' in error.response and
+            error.response['Error'].get('Code') in ('403', 'AccessDenied'))
+
+
+# =============================================================================
+# _get_s3_object_memo_key
+# =============================================================================
+def _get_s3_object_memo_key(s3_object, checksum: str) -> tuple:
+    return (s3_object.bucket_name, s3_object.key, checksum)
+
+
+# =============================================================================
+# _fetch_s3_object
+# =============================================================================
+def _fetch_s3_object(
+    payload: dict,
+    s3_object,
+    expected_checksum: str
+) -> bytes:
+    '''fetches the contents of an s3 object, verifying its checksum
+
+    the object body is read from a single GetObject call
+    and hashed as it arrives
+
+    when the object cache is enabled, it is consulted before
+    the GetObject call and populated after it
+
+    verified contents are memoized for the rest of the invocation,
+    keyed by bucket, key, and checksum, so every consumer of the same
+    object version shares a single fetch
+    '''
+    memo_key = _get_s3_object_memo_key(s3_object, expected_checksum)
+    if memo_key in _s3_object_contents_memo:
+        return _s3_object_contents_memo[memo_key]
+    if _should_cache_s3_object(payload, s3_object):
+        contents = _read_s3_object_from_cache(
+            payload,
+            expected_checksum)
+        if contents is not None:
+            log(f"object cache hit: {s3_object.key}")
+            _s3_object_contents_memo[memo_key] = contents
+            return contents
+    file_hash = hashlib.sha256()
+    file_chunks = []
+    body = s3_object.get()['Body']
+    try:
+        while True:
+            file_data = body.read(HASH_BUFFER_SIZE)
+            if not file_data:
+                break
+            file_hash.update(file_data)
+            file_chunks.append(file_data)
+    finally:
+        body.close()
+    file_checksum = file_hash.hexdigest()
+    if expected_checksum != file_checksum:
+        raise ValueError(f"expected checksum '{expected_checksum}' does"
+                         f" not match file checksum '{file_checksum}'")
+    contents = b''.join(file_chunks)
+    _s3_object_contents_memo[memo_key] = contents
+    if _should_cache_s3_object(payload, s3_object):
+        _write_s3_object_to_cache(
+            payload,
+            s3_object,
+            expected_checksum,
+            contents)
+    return contents
+
+
+# =============================================================================
+# _fetch_s3_objects
+# =============================================================================
+def _fetch_s3_objects(
+    payload: dict,
+    fetches: list
+) -> None:
+    '''fetches several s3 objects concurrently
+
+    each fetch is a (s3 object, expected checksum) tuple,
+    as accepted by _fetch_s3_object
+
+    duplicate fetches are collapsed before any request is made
+    '''
+    unique_fetches = {
+        _get_s3_object_memo_key(*fetch): fetch
+        for fetch in fetches
+    }
+    _map_concurrently(
+        payload,
+        lambda fetch: _fetch_s3_object(payload, *fetch),
+        list(unique_fetches.values()))
 
 
 # =============================================================================
 # _download_s3_object_to_path
 # =============================================================================
 def _download_s3_object_to_path(
+    payload: dict,
     s3_object,
     expected_checksum,
-    destination_file_path
+    destination_file_path,
+    link: bool = False
 ) -> None:
-    s3_object.download_file(destination_file_path)
-    destination_file_hash = _hash_file(destination_file_path)
-    if expected_checksum != destination_file_hash:
-        raise ValueError(f"expected checksum '{expected_checksum}' does"
-                         f" not match file checksum '{destination_file_hash}'")
+    '''downloads an s3 object to a file path, verifying its checksum
+
+    when link is True and the object is in the object cache,
+    the file is materialised from the cache entry with a hardlink
+
+    link must only be used for files that are never modified in place,
+    since a hardlinked file shares its contents with the cache entry
+
+    private keys are always written as a file of their own,
+    so no other file ever shares their contents
+    '''
+    import lib.cache
+    contents = _fetch_s3_object(payload, s3_object, expected_checksum)
+    if (link and
+            not _is_private_key_s3_object(s3_object) and
+            _should_cache_s3_object(payload, s3_object)):
+        try:
+            if lib.cache.link_object(
+                    _get_object_cache_dir_path(payload),
+                    expected_checksum,
+                    destination_file_path):
+                return
+        except OSError as e:
+            log(f"object cache link failed: {e}")
+    _write_file(destination_file_path, contents)
+
+
+# =============================================================================
+# _download_s3_objects_to_paths
+# =============================================================================
+def _download_s3_objects_to_paths(
+    payload: dict,
+    downloads: list,
+    link: bool = False
+) -> None:
+    '''downloads several s3 objects concurrently
+
+    each download is a (s3 object, expected checksum, destination file path)
+    tuple, as accepted by _download_s3_object_to_path
+    '''
+    _fetch_s3_objects(
+        payload,
+        [download[:2] for download in downloads])
+    for download in downloads:
+        _download_s3_object_to_path(payload, *download, link=link)
+
+
+# =============================================================================
+# _upload_s3_objects
+# =============================================================================
+def _upload_s3_objects(
+    payload: dict,
+    uploads: list
+) -> List[dict]:
+    '''uploads several s3 objects concurrently
+
+    each upload is a (s3 object, checksum, contents)
+    or (s3 object, checksum, contents, metadata)
+    tuple, as accepted by _upload_s3_object
+
+    returns the PutObject response of each upload, in the same order
+
+    the uploads complete in no particular order,
+    so anything that must only be written once all of them
+    are in place (e.g. a keypair manifest) must be uploaded after
+    '''
+    return _map_concurrently(
+        payload,
+        lambda upload: _upload_s3_object(payload, *upload),
+        uploads)
+
+
+# =============================================================================
+# _upload_s3_object
+# =============================================================================
+def _upload_s3_object(
+    payload: dict,
+    s3_object,
+    checksum: str,
+    contents: bytes,
+    metadata: Optional[dict] = None
+) -> dict:
+    '''uploads the contents of an s3 object from memory
+    with a single PutObject call
+
+    the checksum is added to any other metadata
+
+    the Content-MD5 header has s3 reject contents
+    corrupted in transit
+
+    returns the PutObject response, which holds the etag of the upload,
+    and its version id if the bucket is versioned
+    '''
+    response = s3_object.put(
+        Body=contents,
+        ContentMD5=_get_content_md5(contents),
+        Metadata={
+            **(metadata or {}),
+            CHECKSUM_METADATA_KEY_NAME: checksum
+        })
+    # write through to the object cache, so the next
+    # fetch of this object does not need a GetObject call
+    if _should_cache_s3_object(payload, s3_object):
+        _write_s3_object_to_cache(
+            payload,
+            s3_object,
+            checksum,
+            contents)
+    return response
+
+
+# =============================================================================
+# _get_content_md5
+# =============================================================================
+def _get_content_md5(contents: bytes) -> str:
+    return base64.b64encode(hashlib.md5(contents).digest()).decode('ascii')
+
+
+# =============================================================================
+#
+# private cache functions
+#
+# =============================================================================
+
+# =============================================================================
+# _get_object_cache_dir_path
+# =============================================================================
+def _get_object_cache_dir_path(payload: dict) -> str:
+    import lib.cache
+    return payload['source']['cache'].get(
+        'dir',
+        lib.cache.CACHE_DEFAULT_DIR_PATH)
+
+
+# =============================================================================
+# _get_object_cache_max_size
+# =============================================================================
+def _get_object_cache_max_size(payload: dict) -> int:
+    import lib.cache
+    return payload['source']['cache'].get(
+        'max_size',
+        lib.cache.CACHE_DEFAULT_MAX_SIZE)
+
+
+# =============================================================================
+# _read_s3_object_from_cache
+# =============================================================================
+def _read_s3_object_from_cache(
+    payload: dict,
+    checksum: str
+) -> Optional[bytes]:
+    import lib.cache
+    # the cache is an optimization, so failing
+    # to read it must never fail the resource
+    try:
+        return lib.cache.read_object(
+            _get_object_cache_dir_path(payload),
+            checksum)
+    except (OSError, ValueError) as e:
+        log(f"object cache read failed: {e}")
+        return None
+
+
+# =============================================================================
+# _read_cache_record
+# =============================================================================
+def _read_cache_record(
+    payload: dict,
+    record_name: str
+) -> Optional[dict]:
+    import lib.cache
+    try:
+        return lib.cache.read_record(
+            _get_object_cache_dir_path(payload),
+            record_name)
+    except OSError as e:
+        log(f"cache record read failed: {e}")
+        return None
+
+
+# =============================================================================
+# _write_cache_record
+# =============================================================================
+def _write_cache_record(
+    payload: dict,
+    record_name: str,
+    record: dict
+) -> None:
+    import lib.cache
+    try:
+        lib.cache.write_record(
+            _get_object_cache_dir_path(payload),
+            record_name,
+            record)
+    except OSError as e:
+        log(f"cache record write failed: {e}")
 
 
 # =============================================================================
-# _upload_s3_object_to_path
+# _write_s3_object_to_cache
 # =============================================================================
-def _upload_s3_object_to_path(
+def _write_s3_object_to_cache(
+    payload: dict,
     s3_object,
-    checksum,
-    source_file_path
+    checksum: str,
+    contents: bytes
 ) -> None:
-    s3_object.upload_file(source_file_path,
-                          ExtraArgs={
-                              'Metadata': {
-                                  CHECKSUM_METADATA_KEY_NAME: checksum
-                              }})
+    import lib.cache
+    # the cache is an optimization, so failing
+    # to write it must never fail the resource
+    try:
+        lib.cache.write_object(
+            _get_object_cache_dir_path(payload),
+            checksum,
+            contents,
+            private=_is_private_key_s3_object(s3_object))
+        lib.cache.evict_objects(
+            _get_object_cache_dir_path(payload),
+            _get_object_cache_max_size(payload))
+    except (OSError, ValueError) as e:
+        log(f"object cache write failed: {e}")
 
 
 # =============================================================================
@@ -241,6 +938,47 @@ def _get_repository_dir_path() -> str:
     return sys.argv[1]
 
 
+# =============================================================================
+# _get_workspace_parent_dir_path
+# =============================================================================
+def _get_workspace_parent_dir_path() -> Optional[str]:
+    # returns None when there is no memory-backed filesystem,
+    # i.e. the default temp dir
+    for dir_path in WORKSPACE_MEMORY_DIR_PATHS:
+        if (os.path.isdir(dir_path) and
+                os.access(dir_path, os.W_OK | os.X_OK)):
+            return dir_path
+    log('no memory-backed filesystem found, using the temp dir')
+    return None
+
+
+# =============================================================================
+# _get_workspace_dir_path
+# =============================================================================
+def _get_workspace_dir_path() -> str:
+    '''gets the scratch dir out works in, i.e. where the parent ca
+    keypair is downloaded to, and where the pki engines write
+    signing configs and pooled private keys
+
+    the dir is created on a memory-backed filesystem when there is one,
+    accessible by the current user only, and removed with everything
+    in it when the process exits, so no key material is written to disk
+    or left behind in the repository dir
+
+    the dir is created once per invocation
+    '''
+    global _workspace_dir_path
+    if _workspace_dir_path is None:
+        import atexit
+        import shutil
+        import tempfile
+        _workspace_dir_path = tempfile.mkdtemp(
+            prefix=WORKSPACE_DIR_PREFIX,
+            dir=_get_workspace_parent_dir_path())
+        atexit.register(shutil.rmtree, _workspace_dir_path, True)
+    return _workspace_dir_path
+
+
 # =============================================================================
 # _read_payload
 # =============================================================================
@@ -255,6 +993,32 @@ def _write_payload(payload: Any, stream=sys.stdout) -> None:
     json.dump(payload, stream)
 
 
+# =============================================================================
+# _write_file
+# =============================================================================
+def _write_file(file_path: str, contents: bytes) -> str:
+    '''writes contents to a file path, returning their checksum
+
+    the contents are written to a temp file beside the destination
+    which is then renamed into place, so readers never see a partial file
+
+    the checksum is computed from the same buffer as it is written,
+    so the file never needs to be read back
+    '''
+    file_hash = hashlib.sha256()
+    temp_file_path = f"{file_path}.{os.urandom(4).hex()}.tmp"
+    try:
+        with open(temp_file_path, 'xb') as temp_file:
+            file_hash.update(contents)
+            temp_file.write(contents)
+        os.replace(temp_file_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
+        raise
+    return file_hash.hexdigest()
+
+
 # =============================================================================
 # _get_repository_file_path
 # =============================================================================
@@ -277,12 +1041,26 @@ def _get_repository_ca_subdir(repository_dir_path: str) -> str:
 # =============================================================================
 
 # =============================================================================
-# _should_download_certificate
+# _should_fetch_metadata_only
 # =============================================================================
-def _should_download_certificate(payload: dict) -> bool:
+def _should_fetch_metadata_only(payload: dict) -> bool:
+    # saves no files, only the certificate details in the metadata
     if 'params' in payload:
-        return payload['params'].get('save_certificate',
-                                     True) is True
+        return payload['params'].get('metadata_only',
+                                     False) is True
+    else:
+        return False
+
+
+# =============================================================================
+# _should_download_certificate
+# =============================================================================
+def _should_download_certificate(payload: dict) -> bool:
+    if _should_fetch_metadata_only(payload):
+        return False
+    if 'params' in payload:
+        return payload['params'].get('save_certificate',
+                                     True) is True
     else:
         return True
 
@@ -291,6 +1069,8 @@ def _should_download_certificate(payload: dict) -> bool:
 # _should_download_private_key
 # =============================================================================
 def _should_download_private_key(payload: dict) -> bool:
+    if _should_fetch_metadata_only(payload):
+        return False
     if 'params' in payload:
         return payload['params'].get('save_private_key',
                                      False) is True
@@ -302,6 +1082,8 @@ def _should_download_private_key(payload: dict) -> bool:
 # _should_download_root_ca_certificate
 # =============================================================================
 def _should_download_root_ca_certificate(payload: dict) -> bool:
+    if _should_fetch_metadata_only(payload):
+        return False
     if 'params' in payload:
         return payload['params'].get('save_root_ca_certificate',
                                      False) is True
@@ -313,6 +1095,8 @@ def _should_download_root_ca_certificate(payload: dict) -> bool:
 # _should_download_intermediate_ca_certificate
 # =============================================================================
 def _should_download_intermediate_ca_certificate(payload: dict) -> bool:
+    if _should_fetch_metadata_only(payload):
+        return False
     if 'params' in payload:
         return payload['params'].get('save_intermediate_ca_certificate',
                                      False) is True
@@ -320,6 +1104,27 @@ def _should_download_intermediate_ca_certificate(payload: dict) -> bool:
         return False
 
 
+# =============================================================================
+# _is_private_key_s3_object
+# =============================================================================
+def _is_private_key_s3_object(s3_object) -> bool:
+    return s3_object.key.endswith(PRIVATE_KEY_FILE_SUFFIX)
+
+
+# =============================================================================
+# _should_cache_s3_object
+# =============================================================================
+def _should_cache_s3_object(payload: dict, s3_object) -> bool:
+    if 'cache' in payload['source']:
+        if _is_private_key_s3_object(s3_object):
+            return payload['source']['cache'].get('include_private_keys',
+                                                  False) is True
+        else:
+            return True
+    else:
+        return False
+
+
 # =============================================================================
 # _should_save_to_ca_subdir
 # =============================================================================
@@ -332,87 +1137,1763 @@ def _should_save_to_ca_subdir(payload: dict) -> bool:
 
 
 # =============================================================================
-# _should_save_ca_certificate_chain
+# _should_save_ca_certificate_chain
+# =============================================================================
+def _should_save_ca_certificate_chain(payload: dict) -> bool:
+    if _should_fetch_metadata_only(payload):
+        return False
+    if 'params' in payload:
+        return payload['params'].get('save_ca_chain',
+                                     False) is True
+    else:
+        return False
+
+
+# =============================================================================
+# _should_use_signer
+# =============================================================================
+def _should_use_signer(payload: dict) -> bool:
+    # signs with a cfssl api server, which holds the parent ca private key
+    return payload['source'].get('signer') is not None
+
+
+# =============================================================================
+# _should_use_key_pool
+# =============================================================================
+def _should_use_key_pool(payload: dict) -> bool:
+    return payload['source'].get('key_pool') is not None
+
+
+# =============================================================================
+# _should_add_timings_metadata
+# =============================================================================
+def _should_add_timings_metadata(payload: dict) -> bool:
+    return payload['source'].get('timings') is True
+
+
+# =============================================================================
+# _action_is_create
+# =============================================================================
+def _action_is_create(payload: dict) -> bool:
+    if 'params' in payload and 'action' in payload['params']:
+        return payload['params']['action'] == 'create'
+    else:
+        return True
+
+
+# =============================================================================
+# _action_is_renew
+# =============================================================================
+def _action_is_renew(payload: dict) -> bool:
+    if 'params' in payload and 'action' in payload['params']:
+        return payload['params']['action'] == 'renew'
+    else:
+        return False
+
+
+# =============================================================================
+# _action_is_refill_key_pool
+# =============================================================================
+def _action_is_refill_key_pool(payload: dict) -> bool:
+    if 'params' in payload and 'action' in payload['params']:
+        return payload['params']['action'] == 'refill_key_pool'
+    else:
+        return False
+
+
+# =============================================================================
+# _is_key_pool_version
+# =============================================================================
+def _is_key_pool_version(payload: dict) -> bool:
+    # emitted by refill_key_pool, and has no keypair to fetch
+    version = payload.get('version') or {}
+    return KEY_POOL_VERSION_KEY in version and 'checksum' not in version
+
+
+# =============================================================================
+# _keypair_exists
+# =============================================================================
+def _keypair_exists(
+        payload: dict,
+        certificate,
+        private_key) -> bool:
+    '''checks if a keypair exists
+
+    attempts to get the checksums from each object
+    this results in a HeadObject call, which if failed
+    with a not found, or due to permissions, indicates the object is missing
+
+    both objects must exist to return True
+
+    if either object is missing, return False
+
+    otherwise raise
+
+    note: this will return a false negative if
+    the client legitimately does not have permissions
+
+    s3 does not let a user know if an object actually exists
+    without resulting to listing the bucket keys and parsing them
+    '''
+    import botocore.exceptions
+    try:
+        _get_s3_object_checksums(payload, certificate, private_key)
+    except botocore.exceptions.ClientError as e:
+        if _is_missing_s3_object_error(e):
+            return False
+        else:
+            raise
+    return True
+
+
+# =============================================================================
+# _should_overwrite_keypair
+# =============================================================================
+def _should_overwrite_keypair(
+        payload: dict,
+        certificate,
+        private_key) -> bool:
+    if _keypair_exists(payload, certificate, private_key):
+        if ('params' in payload and
+                'allow_overwrite' in payload['params'] and
+                payload['params']['allow_overwrite'] is True):
+            return True
+        else:
+            return False
+    else:
+        return True
+
+
+# =============================================================================
+#
+# private manifest functions
+#
+# =============================================================================
+
+# =============================================================================
+# _get_manifest_file_name
+# =============================================================================
+def _get_manifest_file_name(file_prefix: str) -> str:
+    return f"{file_prefix}{MANIFEST_FILE_SUFFIX}"
+
+
+# =============================================================================
+# _create_keypair_manifest
+# =============================================================================
+def _create_keypair_manifest(
+    certificate_checksum: str,
+    private_key_checksum: str,
+    certificate_info: dict,
+    certificate_upload: dict,
+    private_key_upload: dict,
+    certificate_request: Optional[bytes] = None
+) -> dict:
+    '''creates a keypair manifest
+
+    the etags of the certificate and private key uploads,
+    as returned by _upload_s3_object, are recorded, so multi-leaf check,
+    which lists them anyway, only uses a manifest while it describes
+    the objects as they are, see _is_current_keypair_manifest
+
+    on a versioned bucket, the version ids of the uploads are recorded
+    as well, see _get_keypair_version_history
+
+    the certificate_request, when given, is stored with the keypair,
+    so renew can sign it again, see _get_stored_certificate_request
+    '''
+    import lib.cfssl
+    manifest_contents = {
+        'format_version': MANIFEST_FORMAT_VERSION,
+        'checksum': _get_keypair_checksum(
+            certificate_checksum,
+            private_key_checksum),
+        'certificate_checksum': certificate_checksum,
+        'private_key_checksum': private_key_checksum,
+        'certificate_etag': certificate_upload['ETag'],
+        'private_key_etag': private_key_upload['ETag'],
+        'certificate_version_id': certificate_upload.get('VersionId'),
+        'private_key_version_id': private_key_upload.get('VersionId'),
+        'common_name': lib.cfssl.get_certificate_common_name(
+            certificate_info),
+        'hosts': lib.cfssl.get_certificate_hosts(
+            certificate_info) or [],
+        'issue_date': lib.cfssl.get_certificate_issue_date(
+            certificate_info).isoformat(),
+        'expiration_date': lib.cfssl.get_certificate_expiration_date(
+            certificate_info).isoformat()
+    }
+    if certificate_request is not None:
+        manifest_contents['certificate_request'] = \
+            _create_stored_certificate_request(
+                certificate_request,
+                private_key_checksum)
+    return manifest_contents
+
+
+# =============================================================================
+# _is_valid_keypair_manifest
+# =============================================================================
+def _is_valid_keypair_manifest(manifest: Any) -> bool:
+    return (isinstance(manifest, dict) and
+            manifest.get('format_version') == MANIFEST_FORMAT_VERSION and
+            manifest.get('checksum') == _get_keypair_checksum(
+                manifest.get('certificate_checksum', ''),
+                manifest.get('private_key_checksum', '')))
+
+
+# =============================================================================
+# _is_current_keypair_manifest
+# =============================================================================
+def _is_current_keypair_manifest(
+    manifest: Any,
+    certificate_etag: Optional[str],
+    private_key_etag: Optional[str]
+) -> bool:
+    '''checks if a keypair manifest describes the keypair objects
+    with the given etags, i.e. that neither has been replaced since
+    the manifest was uploaded, e.g. by an out which failed to upload
+    the manifest, or by a version of this resource which wrote none
+    '''
+    return (isinstance(manifest, dict) and
+            None not in (certificate_etag, private_key_etag) and
+            manifest.get('certificate_etag') == certificate_etag and
+            manifest.get('private_key_etag') == private_key_etag)
+
+
+# =============================================================================
+# _upload_keypair_manifest
+# =============================================================================
+def _upload_keypair_manifest(
+    payload: dict,
+    manifest,
+    manifest_contents: dict
+) -> dict:
+    '''uploads a keypair manifest
+
+    must be called after both the certificate and private key
+    have been uploaded, so a manifest never describes
+    a keypair that is not fully in place
+
+    returns the PutObject response, which holds
+    its version id if the bucket is versioned
+    '''
+    contents = json.dumps(manifest_contents, sort_keys=True).encode('utf-8')
+    return manifest.put(
+        Body=contents,
+        ContentMD5=_get_content_md5(contents),
+        ContentType='application/json',
+        Metadata={
+            CHECKSUM_METADATA_KEY_NAME: hashlib.sha256(contents).hexdigest()
+        })
+
+
+# =============================================================================
+# _remove_keypair_manifest
+# =============================================================================
+def _remove_keypair_manifest(payload: dict, manifest) -> None:
+    '''removes a keypair manifest after an out failed to replace it,
+    as it would still describe the keypair before that out, and check
+    reads the keypair objects themselves while there is no manifest
+
+    the removal is best effort, and never hides the original error
+    '''
+    import botocore.exceptions
+    try:
+        manifest.delete()
+    except (botocore.exceptions.BotoCoreError,
+            botocore.exceptions.ClientError):
+        log(f"cannot remove keypair manifest: {manifest.key}")
+    _keypair_manifest_memo.pop((manifest.bucket_name, manifest.key), None)
+
+
+# =============================================================================
+# _get_keypair_manifest
+# =============================================================================
+def _get_keypair_manifest(
+    payload: dict,
+    manifest
+) -> Optional[dict]:
+    '''gets a keypair manifest with a single GetObject call
+
+    returns None if the keypair has no (valid) manifest, e.g. because
+    it was uploaded before manifests existed, or the manifest may not
+    be read, so the caller reads the keypair objects themselves instead
+
+    the manifest is trusted to describe the keypair, as out replaces it
+    along with every keypair it writes, and removes it when that fails
+
+    when the object cache is enabled, the last manifest seen is kept
+    as a cache record, and the GetObject call is made conditional on its
+    etag, so an unchanged manifest is not transferred again
+
+    the manifest is memoized for the rest of the invocation
+    '''
+    memo_key = (manifest.bucket_name, manifest.key)
+    if memo_key not in _keypair_manifest_memo:
+        _keypair_manifest_memo[memo_key] = \
+            _read_keypair_manifest(payload, manifest)
+    return _keypair_manifest_memo[memo_key]
+
+
+# =============================================================================
+# _get_current_keypair_manifest
+# =============================================================================
+def _get_current_keypair_manifest(
+    payload: dict,
+    manifest,
+    certificate_checksum: str,
+    private_key_checksum: str
+) -> Optional[dict]:
+    '''gets a keypair manifest, if it describes the keypair as it is
+
+    used by out, which reads the checksums of the keypair objects anyway,
+    so comparing them with the ones the manifest recorded takes
+    no additional requests
+
+    returns None if the keypair has no current (valid) manifest
+    '''
+    manifest_contents = _get_keypair_manifest(payload, manifest)
+    if manifest_contents is None:
+        return None
+    if (manifest_contents['certificate_checksum'] != certificate_checksum or
+            manifest_contents['private_key_checksum'] !=
+            private_key_checksum):
+        log(f"keypair manifest is out of date: {manifest.key}")
+        return None
+    return manifest_contents
+
+
+# =============================================================================
+# _read_keypair_manifest
+# =============================================================================
+def _read_keypair_manifest(
+    payload: dict,
+    manifest
+) -> Optional[dict]:
+    import botocore.exceptions
+    record_name = f"manifest:{manifest.bucket_name}/{manifest.key}"
+    record = None
+    if 'cache' in payload['source']:
+        record = _read_cache_record(payload, record_name)
+    get_params = {}
+    if record:
+        get_params['IfNoneMatch'] = record['etag']
+    try:
+        response = manifest.get(**get_params)
+    except botocore.exceptions.ClientError as e:
+        if record and _is_not_modified_s3_error(e):
+            return record['manifest']
+        if _is_missing_s3_object_error(e):
+            return None
+        if not _is_access_denied_s3_error(e):
+            raise
+        log(f"cannot get the keypair manifest, not using it: {manifest.key}")
+        return None
+    try:
+        manifest_contents = json.loads(response['Body'].read())
+    except ValueError:
+        manifest_contents = None
+    finally:
+        response['Body'].close()
+    if not _is_valid_keypair_manifest(manifest_contents):
+        log(f"ignoring invalid keypair manifest: {manifest.key}")
+        return None
+    if 'cache' in payload['source']:
+        _write_cache_record(
+            payload,
+            record_name,
+            {
+                'etag': response['ETag'],
+                'manifest': manifest_contents
+            })
+    return manifest_contents
+
+
+# =============================================================================
+# _get_keypair_checksums
+# =============================================================================
+def _get_keypair_checksums(
+    payload: dict,
+    manifest,
+    certificate,
+    private_key
+) -> List[str]:
+    '''gets the certificate and private key checksums of a keypair
+
+    reads the keypair manifest if there is one,
+    otherwise falls back to a HeadObject call per object
+    '''
+    manifest_contents = _get_keypair_manifest(payload, manifest)
+    if manifest_contents is not None:
+        log(f"using keypair manifest: {manifest.key}")
+        return [
+            manifest_contents['certificate_checksum'],
+            manifest_contents['private_key_checksum']
+        ]
+    return _get_s3_object_checksums(payload, certificate, private_key)
+
+
+# =============================================================================
+#
+# private multi-leaf functions
+#
+# =============================================================================
+
+# =============================================================================
+# _is_multi_leaf
+# =============================================================================
+def _is_multi_leaf(payload: dict) -> bool:
+    return 'leaf_names' in payload['source']
+
+
+# =============================================================================
+# _get_leaf_name_patterns
+# =============================================================================
+def _get_leaf_name_patterns(payload: dict) -> List[str]:
+    # leaf_names is either a single pattern or a list of them
+    leaf_names = payload['source']['leaf_names']
+    if isinstance(leaf_names, str):
+        return [leaf_names]
+    return list(leaf_names)
+
+
+# =============================================================================
+# _leaf_name_matches
+# =============================================================================
+def _leaf_name_matches(payload: dict, leaf_name: str) -> bool:
+    # the ca keypairs share the prefix, but are never leaves
+    if leaf_name in (ROOT_CA_FILE_PREFIX, INTERMEDIATE_CA_FILE_PREFIX):
+        return False
+    return any(
+        fnmatch.fnmatchcase(leaf_name, leaf_name_pattern)
+        for leaf_name_pattern in _get_leaf_name_patterns(payload))
+
+
+# =============================================================================
+# _get_leaf_name
+# =============================================================================
+def _get_leaf_name(payload: dict) -> str:
+    '''gets the name of the leaf to create or renew
+
+    in multi-leaf mode, the leaf is selected by the leaf_name param,
+    which must match leaf_names
+    '''
+    if not _is_multi_leaf(payload):
+        return payload['source']['leaf_name']
+    leaf_name = payload.get('params', {}).get('leaf_name')
+    if not leaf_name:
+        raise ValueError('leaf_name param is required with leaf_names')
+    if not _leaf_name_matches(payload, leaf_name):
+        raise ValueError(f"leaf name '{leaf_name}' does not match leaf_names")
+    return leaf_name
+
+
+# =============================================================================
+# _get_leaf_keypair_file_names
+# =============================================================================
+def _get_leaf_keypair_file_names(leaf_name: str) -> List[str]:
+    return [
+        f"{leaf_name}{CERTIFICATE_FILE_SUFFIX}",
+        f"{leaf_name}{PRIVATE_KEY_FILE_SUFFIX}"
+    ]
+
+
+# =============================================================================
+# _list_s3_object_etags
+# =============================================================================
+def _list_s3_object_etags(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource
+) -> Dict[str, str]:
+    '''lists the objects directly under the prefix
+
+    returns a dict of file name to etag
+
+    takes one ListObjectsV2 call per 1000 objects
+    '''
+    list_prefix = _format_s3_key_with_prefix(
+        payload['source'].get('prefix'),
+        '')
+    paginator = s3_resource.meta.client.get_paginator('list_objects_v2')
+    s3_object_etags = {}
+    for page in paginator.paginate(
+            Bucket=payload['source']['bucket_name'],
+            Prefix=list_prefix,
+            Delimiter='/'):
+        for s3_object_summary in page.get('Contents', []):
+            file_name = s3_object_summary['Key'][len(list_prefix):]
+            s3_object_etags[file_name] = s3_object_summary['ETag']
+    return s3_object_etags
+
+
+# =============================================================================
+# _match_leaf_names
+# =============================================================================
+def _match_leaf_names(
+    payload: dict,
+    file_names
+) -> List[str]:
+    '''finds the leaves matching leaf_names among listed file names
+
+    only leaves with both a certificate and private key are matched
+    '''
+    leaf_names = []
+    for file_name in sorted(file_names):
+        if not file_name.endswith(CERTIFICATE_FILE_SUFFIX):
+            continue
+        leaf_name = file_name[:-len(CERTIFICATE_FILE_SUFFIX)]
+        if not _leaf_name_matches(payload, leaf_name):
+            continue
+        if not all(
+                leaf_file_name in file_names
+                for leaf_file_name in
+                _get_leaf_keypair_file_names(leaf_name)):
+            continue
+        leaf_names.append(leaf_name)
+    # a pattern without wildcards names a single leaf,
+    # so report it if it could not be found
+    for leaf_name_pattern in _get_leaf_name_patterns(payload):
+        if (not any(c in leaf_name_pattern for c in '*?[') and
+                leaf_name_pattern not in leaf_names):
+            log(f"leaf keypair not found: {leaf_name_pattern}")
+    return leaf_names
+
+
+# =============================================================================
+# _get_listed_s3_object_checksums
+# =============================================================================
+def _get_listed_s3_object_checksums(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    s3_object_etags: Dict[str, Optional[str]],
+    read_checksum: Optional[Callable] = None
+) -> Dict[str, Any]:
+    '''gets the checksums of listed objects, given their etags
+
+    returns a dict of file name to checksum
+
+    checksums are read with read_checksum, which returns
+    a (checksum, etag) tuple for an s3 object, and defaults to
+    a HeadObject call reading the checksum metadata. the checksum may be
+    any json value, e.g. a manifest summary, see
+    _read_keypair_manifest_summary
+
+    when the object cache is enabled, an etag index of the checksums
+    already read is kept as a cache record, and only objects whose etag
+    is not in the index result in a read
+
+    those calls are made concurrently, and the index records the etag
+    returned alongside each checksum rather than the listed one, so an
+    object replaced after the listing is never indexed incorrectly
+    '''
+    record_name = (
+        f"etag-index:{payload['source']['bucket_name']}/"
+        f"{_format_s3_key_with_prefix(payload['source'].get('prefix'), '')}")
+    etag_index = {}
+    if 'cache' in payload['source']:
+        etag_index = _read_cache_record(payload, record_name) or {}
+    checksums = {}
+    changed_file_names = []
+    for file_name, etag in s3_object_etags.items():
+        etag_index_entry = etag_index.get(file_name)
+        if etag_index_entry and etag_index_entry['etag'] == etag:
+            checksums[file_name] = etag_index_entry['checksum']
+        else:
+            changed_file_names.append(file_name)
+    if s3_object_etags:
+        log(f"reading checksums of {len(changed_file_names)}"
+            f" of {len(s3_object_etags)} objects")
+    changed_s3_objects = [
+        _get_s3_object(payload, s3_resource, file_name)
+        for file_name in changed_file_names
+    ]
+    changed_checksums = _map_concurrently(
+        payload,
+        read_checksum or _read_s3_object_checksum,
+        changed_s3_objects)
+    for file_name, (checksum, etag) in \
+            zip(changed_file_names, changed_checksums):
+        checksums[file_name] = checksum
+        etag_index[file_name] = {
+            'etag': etag,
+            'checksum': checksum
+        }
+    if 'cache' in payload['source'] and changed_file_names:
+        _write_cache_record(payload, record_name, etag_index)
+    return checksums
+
+
+# =============================================================================
+# _read_s3_object_checksum
+# =============================================================================
+def _read_s3_object_checksum(s3_object) -> tuple:
+    # the etag comes from the same HeadObject call as the checksum
+    return _get_s3_object_checksum(s3_object), s3_object.e_tag
+
+
+# =============================================================================
+# _read_keypair_manifest_summary
+# =============================================================================
+def _read_keypair_manifest_summary(manifest) -> tuple:
+    # reads the keypair checksum of a manifest, and the keypair object etags
+    # it describes, with a single GetObject call
+    # the summary is None if the manifest is invalid
+    response = manifest.get()
+    try:
+        manifest_contents = json.loads(response['Body'].read())
+    except ValueError:
+        manifest_contents = None
+    finally:
+        response['Body'].close()
+    if not _is_valid_keypair_manifest(manifest_contents):
+        log(f"ignoring invalid keypair manifest: {manifest.key}")
+        return None, response['ETag']
+    return (
+        {
+            'checksum': manifest_contents['checksum'],
+            'certificate_etag': manifest_contents.get('certificate_etag'),
+            'private_key_etag': manifest_contents.get('private_key_etag')
+        },
+        response['ETag'])
+
+
+# =============================================================================
+# _get_multi_leaf_checksums
+# =============================================================================
+def _get_multi_leaf_checksums(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource
+) -> Dict[str, str]:
+    '''gets the keypair checksum of every leaf matching leaf_names
+
+    returns a dict of leaf name to keypair checksum
+    '''
+    s3_object_etags = _list_s3_object_etags(payload, s3_resource)
+    leaf_names = _match_leaf_names(payload, s3_object_etags)
+
+    # read leaves with a current manifest from it, as out uploads the
+    # manifest only once both keypair objects are in place, so a version
+    # never pairs a new certificate with an old private key
+    manifest_file_names = {
+        leaf_name: _get_manifest_file_name(leaf_name)
+        for leaf_name in leaf_names
+        if _get_manifest_file_name(leaf_name) in s3_object_etags
+    }
+    manifest_summaries = _get_listed_s3_object_checksums(
+        payload,
+        s3_resource,
+        {
+            manifest_file_name: s3_object_etags[manifest_file_name]
+            for manifest_file_name in manifest_file_names.values()
+        },
+        _read_keypair_manifest_summary)
+    leaf_checksums = {}
+    for leaf_name, manifest_file_name in manifest_file_names.items():
+        manifest_summary = manifest_summaries[manifest_file_name]
+        if manifest_summary is None:
+            continue
+        (certificate_file_name,
+         private_key_file_name) = _get_leaf_keypair_file_names(leaf_name)
+        if not _is_current_keypair_manifest(
+                manifest_summary,
+                s3_object_etags[certificate_file_name],
+                s3_object_etags[private_key_file_name]):
+            log(f"keypair manifest is out of date: {manifest_file_name}")
+            continue
+        leaf_checksums[leaf_name] = manifest_summary['checksum']
+
+    # otherwise, read the checksums of both keypair objects
+    keypair_leaf_names = [
+        leaf_name
+        for leaf_name in leaf_names
+        if leaf_name not in leaf_checksums
+    ]
+    checksums = _get_listed_s3_object_checksums(
+        payload,
+        s3_resource,
+        {
+            file_name: s3_object_etags[file_name]
+            for leaf_name in keypair_leaf_names
+            for file_name in _get_leaf_keypair_file_names(leaf_name)
+        })
+    for leaf_name in keypair_leaf_names:
+        leaf_checksums[leaf_name] = _get_keypair_checksum(*[
+            checksums[file_name]
+            for file_name in _get_leaf_keypair_file_names(leaf_name)
+        ])
+    return leaf_checksums
+
+
+# =============================================================================
+# _get_multi_leaf_checksum
+# =============================================================================
+def _get_multi_leaf_checksum(leaf_checksums: Dict[str, str]) -> str:
+    return _hash_string(json.dumps(leaf_checksums, sort_keys=True))
+
+
+# =============================================================================
+# _create_multi_leaf_version
+# =============================================================================
+def _create_multi_leaf_version(leaf_checksums: Dict[str, str]) -> dict:
+    '''creates a version covering several leaves
+
+    the checksum covers every leaf, and each leaf's
+    keypair checksum is kept under its own key
+    '''
+    version = {'checksum': _get_multi_leaf_checksum(leaf_checksums)}
+    for leaf_name, leaf_checksum in sorted(leaf_checksums.items()):
+        version[f"{MULTI_LEAF_VERSION_KEY_PREFIX}{leaf_name}"] = \
+            leaf_checksum
+    return version
+
+
+# =============================================================================
+# _get_multi_leaf_version_leaf_names
+# =============================================================================
+def _get_multi_leaf_version_leaf_names(version: dict) -> List[str]:
+    return sorted(
+        key[len(MULTI_LEAF_VERSION_KEY_PREFIX):]
+        for key in version
+        if key.startswith(MULTI_LEAF_VERSION_KEY_PREFIX))
+
+
+# =============================================================================
+#
+# private version history functions
+#
+# =============================================================================
+
+# =============================================================================
+# _should_check_version_history
+# =============================================================================
+def _should_check_version_history(payload: dict) -> bool:
+    version_history = payload['source'].get('version_history')
+    if version_history is None:
+        return False
+    if not isinstance(version_history, dict):
+        raise ValueError('version_history must be a map of options or null')
+    # a multi-leaf version covers many keypairs,
+    # so it has no history of its own
+    return not _is_multi_leaf(payload)
+
+
+# =============================================================================
+# _get_version_history_max_versions
+# =============================================================================
+def _get_version_history_max_versions(payload: dict) -> int:
+    return payload['source']['version_history'].get(
+        'max_versions',
+        VERSION_HISTORY_DEFAULT_MAX_VERSIONS)
+
+
+# =============================================================================
+# _list_s3_object_versions
+# =============================================================================
+def _list_s3_object_versions(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    key: str
+) -> List[dict]:
+    '''lists the versions of an object, newest first
+
+    takes a single paginated ListObjectVersions call over the key itself,
+    which stops once past the key, or once max_versions versions are listed
+
+    delete markers are listed as versions with is_delete_marker set,
+    so callers can tell when the object is currently deleted
+    '''
+    max_versions = _get_version_history_max_versions(payload)
+    s3_object_versions: List[dict] = []
+    paginator = s3_resource.meta.client.get_paginator('list_object_versions')
+    for page in paginator.paginate(
+            Bucket=payload['source']['bucket_name'],
+            Prefix=key,
+            PaginationConfig={'PageSize': VERSION_HISTORY_PAGE_SIZE}):
+        # a page lists versions and delete markers apart,
+        # each ordered by key and then newest first
+        page_versions = sorted(
+            [(s3_object_version, False)
+             for s3_object_version in page.get('Versions', [])
+             if s3_object_version['Key'] == key] +
+            [(s3_object_version, True)
+             for s3_object_version in page.get('DeleteMarkers', [])
+             if s3_object_version['Key'] == key],
+            key=lambda page_version: page_version[0]['LastModified'],
+            reverse=True)
+        for s3_object_version, is_delete_marker in page_versions:
+            s3_object_versions.append({
+                'version_id': s3_object_version['VersionId'],
+                'is_delete_marker': is_delete_marker
+            })
+        # keys are listed in order, and the key itself comes first
+        if (len(s3_object_versions) >= max_versions or
+                (page.get('IsTruncated') and
+                 page['NextKeyMarker'] != key)):
+            break
+    return s3_object_versions[:max_versions]
+
+
+# =============================================================================
+# _create_keypair_version
+# =============================================================================
+def _create_keypair_version(
+    checksum: str,
+    certificate_version_id: str,
+    private_key_version_id: str,
+    manifest_version_id: Optional[str] = None
+) -> dict:
+    keypair_version = {
+        'checksum': checksum,
+        'certificate_version_id': certificate_version_id,
+        'private_key_version_id': private_key_version_id
+    }
+    if manifest_version_id is not None:
+        keypair_version['manifest_version_id'] = manifest_version_id
+    return keypair_version
+
+
+# =============================================================================
+# _read_keypair_manifest_version
+# =============================================================================
+def _read_keypair_manifest_version(
+    manifest,
+    version_id: str
+) -> Optional[dict]:
+    # reads the keypair version a manifest version describes,
+    # with a single GetObject call
+    # None if the manifest is invalid, or holds no version ids,
+    # e.g. because it was written by an older version of this resource
+    response = _S3ObjectVersion(manifest, version_id).get()
+    try:
+        manifest_contents = json.loads(response['Body'].read())
+    except ValueError:
+        manifest_contents = None
+    finally:
+        response['Body'].close()
+    if (not _is_valid_keypair_manifest(manifest_contents) or
+            not manifest_contents.get('certificate_version_id') or
+            not manifest_contents.get('private_key_version_id')):
+        return None
+    return _create_keypair_version(
+        manifest_contents['checksum'],
+        manifest_contents['certificate_version_id'],
+        manifest_contents['private_key_version_id'],
+        version_id)
+
+
+# =============================================================================
+# _get_current_keypair_version
+# =============================================================================
+def _get_current_keypair_version(
+    payload: dict,
+    certificate,
+    private_key
+) -> List[dict]:
+    '''gets the current keypair version from the metadata of the
+    certificate and private key, for keypairs without a manifest
+    which holds their version ids
+
+    returns no version if either object is missing
+    '''
+    import botocore.exceptions
+    try:
+        checksums = _get_s3_object_checksums(
+            payload,
+            certificate,
+            private_key)
+    except botocore.exceptions.ClientError as e:
+        if _is_missing_s3_object_error(e):
+            return []
+        raise
+    # read along with the checksums
+    if not certificate.version_id or not private_key.version_id:
+        return []
+    return [_create_keypair_version(
+        _get_keypair_checksum(*checksums),
+        certificate.version_id,
+        private_key.version_id)]
+
+
+# =============================================================================
+# _get_keypair_version_history
+# =============================================================================
+def _get_keypair_version_history(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    manifest,
+    certificate,
+    private_key
+) -> List[dict]:
+    '''gets the keypair versions for check to emit, oldest first
+
+    every manifest version out writes holds the version ids of the
+    certificate and private key it was written with, so each manifest
+    version describes exactly one keypair version. the versions of the
+    manifest, certificate, and private key are listed concurrently
+
+    the requested version is found among the listed manifest versions
+    by its manifest_version_id, and returned along with every newer
+    version. if it is not listed (or none was requested), only the
+    newest version is returned, and if the certificate or private key
+    is currently deleted, none are
+
+    only the returned manifest versions are read, and manifest versions
+    never change, so when the object cache is enabled they are kept as
+    a cache record, and only read once
+
+    keypairs without such a manifest fall back to their current version,
+    read from the metadata of the certificate and private key
+    '''
+    (manifest_versions,
+     certificate_versions,
+     private_key_versions) = _map_concurrently(
+        payload,
+        lambda key: _list_s3_object_versions(payload, s3_resource, key),
+        [manifest.key, certificate.key, private_key.key])
+    for key, versions in ((certificate.key, certificate_versions),
+                          (private_key.key, private_key_versions)):
+        if versions and versions[0]['is_delete_marker']:
+            log(f"keypair is deleted: {key}")
+            return []
+    listed_version_ids = {
+        version['version_id']
+        for version in certificate_versions + private_key_versions
+        if not version['is_delete_marker']
+    }
+    manifest_version_ids = [
+        version['version_id']
+        for version in manifest_versions
+        if not version['is_delete_marker']
+    ]
+
+    # newest first
+    requested_manifest_version_id = \
+        (payload.get('version') or {}).get('manifest_version_id')
+    if requested_manifest_version_id in manifest_version_ids:
+        emitted_manifest_version_ids = manifest_version_ids[
+            :manifest_version_ids.index(requested_manifest_version_id) + 1]
+    else:
+        emitted_manifest_version_ids = manifest_version_ids[:1]
+
+    record_name = (
+        f"manifest-versions:{manifest.bucket_name}/{manifest.key}")
+    keypair_version_index = {}
+    if 'cache' in payload['source']:
+        keypair_version_index = \
+            _read_cache_record(payload, record_name) or {}
+    unread = [
+        version_id
+        for version_id in emitted_manifest_version_ids
+        if version_id not in keypair_version_index
+    ]
+    keypair_version_index.update(zip(
+        unread,
+        _map_concurrently(
+            payload,
+            lambda version_id: _read_keypair_manifest_version(
+                manifest,
+                version_id),
+            unread)))
+    if 'cache' in payload['source'] and unread:
+        # only keep the keypair versions of listed manifest versions
+        _write_cache_record(
+            payload,
+            record_name,
+            {
+                version_id: keypair_version
+                for version_id, keypair_version
+                in keypair_version_index.items()
+                if version_id in manifest_version_ids
+            })
+
+    # only versions whose certificate and private key versions are listed
+    history = [
+        keypair_version_index[version_id]
+        for version_id in reversed(emitted_manifest_version_ids)
+        if keypair_version_index[version_id] is not None and
+        keypair_version_index[version_id]['certificate_version_id']
+        in listed_version_ids and
+        keypair_version_index[version_id]['private_key_version_id']
+        in listed_version_ids
+    ]
+    if not history:
+        log('no keypair manifest with version ids,'
+            ' using the current keypair version')
+        return _get_current_keypair_version(
+            payload,
+            certificate,
+            private_key)
+    return history
+
+
+# =============================================================================
+# _has_keypair_version_ids
+# =============================================================================
+def _has_keypair_version_ids(payload: dict) -> bool:
+    return 'certificate_version_id' in (payload.get('version') or {})
+
+
+# =============================================================================
+# _get_keypair_s3_object_versions
+# =============================================================================
+def _get_keypair_s3_object_versions(
+    payload: dict,
+    certificate,
+    private_key
+) -> tuple:
+    # pins the keypair objects to the versions in the requested version
+    return (
+        _S3ObjectVersion(
+            certificate,
+            payload['version']['certificate_version_id']),
+        _S3ObjectVersion(
+            private_key,
+            payload['version']['private_key_version_id']))
+
+
+# =============================================================================
+#
+# private certificate metadata functions
+#
+# =============================================================================
+
+# =============================================================================
+# _encode_s3_metadata_value
+# =============================================================================
+def _encode_s3_metadata_value(value: str, safe: str) -> str:
+    # metadata is sent as http headers, which only hold ascii
+    return urllib.parse.quote(value, safe=safe)
+
+
+# =============================================================================
+# _create_certificate_s3_metadata
+# =============================================================================
+def _create_certificate_s3_metadata(certificate_info: dict) -> dict:
+    '''creates the certificate details written as its object metadata
+
+    lets check and in (with metadata_only) read them
+    with a HeadObject call, without downloading the certificate
+    '''
+    import lib.cfssl
+    metadata = {
+        COMMON_NAME_METADATA_KEY_NAME: _encode_s3_metadata_value(
+            lib.cfssl.get_certificate_common_name(certificate_info),
+            S3_METADATA_SAFE_CHARACTERS),
+        # hosts are comma separated, so commas within them are encoded
+        HOSTS_METADATA_KEY_NAME: ','.join(
+            _encode_s3_metadata_value(
+                host,
+                S3_METADATA_SAFE_CHARACTERS.replace(',', ''))
+            for host in lib.cfssl.get_certificate_hosts(
+                certificate_info) or []),
+        ISSUE_DATE_METADATA_KEY_NAME: lib.cfssl.get_certificate_issue_date(
+            certificate_info).isoformat(),
+        EXPIRATION_METADATA_KEY_NAME:
+            lib.cfssl.get_certificate_expiration_date(
+                certificate_info).isoformat()
+    }
+    # leave out hosts that do not fit next to the checksum,
+    # in which case in reads them from the certificate itself
+    metadata_size = sum(
+        len(key) + len(value)
+        for key, value in metadata.items())
+    metadata_size += len(CHECKSUM_METADATA_KEY_NAME) + \
+        hashlib.sha256().digest_size * 2
+    if metadata_size > S3_MAX_METADATA_SIZE:
+        log('certificate hosts do not fit in the object metadata')
+        del metadata[HOSTS_METADATA_KEY_NAME]
+    return metadata
+
+
+# =============================================================================
+# _get_certificate_details
+# =============================================================================
+def _get_certificate_details(
+    payload: dict,
+    certificate,
+    certificate_checksum: str
+) -> dict:
+    '''gets the common name, hosts, and issue and expiration dates
+    of a certificate from its object metadata
+
+    the metadata is read along with the checksum,
+    so this usually takes no additional request
+
+    certificates uploaded before the details were written
+    are fetched and inspected instead
+    '''
+    import lib.cfssl
+    metadata = {
+        key_name: _get_s3_object_metadata_value(certificate, key_name)
+        for key_name in (
+            COMMON_NAME_METADATA_KEY_NAME,
+            HOSTS_METADATA_KEY_NAME,
+            ISSUE_DATE_METADATA_KEY_NAME,
+            EXPIRATION_METADATA_KEY_NAME)
+    }
+    if None not in metadata.values():
+        hosts = metadata[HOSTS_METADATA_KEY_NAME]
+        return {
+            'common_name': urllib.parse.unquote(
+                metadata[COMMON_NAME_METADATA_KEY_NAME]),
+            'hosts': [
+                urllib.parse.unquote(host)
+                for host in hosts.split(',')
+            ] if hosts else [],
+            'issue_date': datetime.fromisoformat(
+                metadata[ISSUE_DATE_METADATA_KEY_NAME]),
+            'expiration_date': datetime.fromisoformat(
+                metadata[EXPIRATION_METADATA_KEY_NAME])
+        }
+
+    log(f"certificate details not in metadata, inspecting: {certificate.key}")
+
+    import lib.x509
+    certificate_info = lib.x509.get_certificate_info(
+        _fetch_s3_object(
+            payload,
+            certificate,
+            certificate_checksum))
+    return {
+        'common_name': lib.cfssl.get_certificate_common_name(
+            certificate_info),
+        'hosts': lib.cfssl.get_certificate_hosts(certificate_info) or [],
+        'issue_date': lib.cfssl.get_certificate_issue_date(
+            certificate_info),
+        'expiration_date': lib.cfssl.get_certificate_expiration_date(
+            certificate_info)
+    }
+
+
+# =============================================================================
+# _create_certificate_details_metadata
+# =============================================================================
+def _create_certificate_details_metadata(
+    file_description: str,
+    certificate_details: dict,
+    include_hosts: bool
+) -> list:
+    # the same metadata entries as out
+    import lib.cfssl
+    metadata = _create_common_name_metadata(
+        file_description,
+        certificate_details['common_name'])
+    if include_hosts:
+        metadata.extend(_create_hosts_metadata(
+            file_description,
+            certificate_details['hosts']))
+    metadata.extend(_create_expiration_metadata(
+        file_description,
+        lib.cfssl.get_duration_until_certificate_expiration(
+            certificate_details['expiration_date'])))
+    return metadata
+
+
+# =============================================================================
+#
+# private renewal functions
+#
+# =============================================================================
+
+
+# =============================================================================
+# _get_certificate_expiration_date
+# =============================================================================
+def _get_certificate_expiration_date(
+    payload: dict,
+    manifest,
+    certificate,
+    private_key
+) -> Optional[datetime]:
+    '''gets a certificate's expiration date, without downloading it
+
+    reads the keypair manifest if there is one, otherwise the
+    certificate metadata, both of which check has already read
+
+    returns None for a certificate uploaded before either existed
+    '''
+    manifest_contents = _get_keypair_manifest(payload, manifest)
+    if manifest_contents is not None:
+        return datetime.fromisoformat(manifest_contents['expiration_date'])
+    expiration_date = _get_s3_object_metadata_value(
+        certificate,
+        EXPIRATION_METADATA_KEY_NAME)
+    if expiration_date is None:
+        return None
+    return datetime.fromisoformat(expiration_date)
+
+
+# =============================================================================
+# _validate_renew_before
+# =============================================================================
+def _validate_renew_before(payload: dict) -> None:
+    # renewal is only flagged on the single current keypair version
+    if payload['source'].get('renew_before') is None:
+        return
+    if payload['source'].get('version_history') is not None:
+        raise ValueError('renew_before cannot be used with version_history')
+    if _is_multi_leaf(payload):
+        raise ValueError('renew_before cannot be used with leaf_names')
+
+
+# =============================================================================
+# _is_certificate_renewal_due
+# =============================================================================
+def _is_certificate_renewal_due(
+    payload: dict,
+    manifest,
+    certificate,
+    private_key
+) -> bool:
+    if payload['source'].get('renew_before') is None:
+        return False
+    renew_before = lib.duration.parse_duration(
+        payload['source']['renew_before'])
+    expiration_date = _get_certificate_expiration_date(
+        payload,
+        manifest,
+        certificate,
+        private_key)
+    if expiration_date is None:
+        log('certificate expiration date unknown, renew_before'
+            ' applies once the keypair is next uploaded by out')
+        return False
+    renewal_date = expiration_date - renew_before
+
+    log(f"certificate renewal date: {renewal_date}")
+
+    return datetime.now(timezone.utc) >= renewal_date
+
+
+# =============================================================================
+# _get_subject_checksum
+# =============================================================================
+def _get_subject_checksum(subject: dict, hosts: List[str]) -> str:
+    # the order of name attributes and hosts is left out,
+    # as signers may not keep it
+    return _hash_string(json.dumps(
+        {
+            'subject': {
+                key: value
+                for key, value in subject.items()
+                if key != 'names'
+            },
+            'hosts': sorted(hosts)
+        },
+        sort_keys=True))
+
+
+# =============================================================================
+# _create_stored_certificate_request
+# =============================================================================
+def _create_stored_certificate_request(
+    certificate_request: bytes,
+    private_key_checksum: str
+) -> dict:
+    import lib.x509
+    certificate_request_info = \
+        lib.x509.get_certificate_request_info(certificate_request)
+    return {
+        'private_key_checksum': private_key_checksum,
+        'subject_checksum': _get_subject_checksum(
+            certificate_request_info['subject'],
+            certificate_request_info.get('sans', [])),
+        'pem': certificate_request.decode('utf-8')
+    }
+
+
+# =============================================================================
+# _get_stored_certificate_request
+# =============================================================================
+def _get_stored_certificate_request(
+    payload: dict,
+    manifest,
+    certificate_checksum: str,
+    private_key_checksum: str,
+    certificate_info: dict
+) -> Optional[bytes]:
+    '''gets the signing request out stored in the keypair manifest,
+    so renew can sign it again instead of generating a new one
+
+    returns None if there is none, or if it was made for another
+    private key, or for another subject or hosts than the certificate's
+    '''
+    manifest_contents = _get_current_keypair_manifest(
+        payload,
+        manifest,
+        certificate_checksum,
+        private_key_checksum)
+    stored_certificate_request = (manifest_contents or {}).get(
+        'certificate_request')
+    if not isinstance(stored_certificate_request, dict):
+        log('no stored signing request, generating one')
+        return None
+    if (stored_certificate_request.get('private_key_checksum') !=
+            private_key_checksum):
+        log('stored signing request is for another private key,'
+            ' generating one')
+        return None
+    if (stored_certificate_request.get('subject_checksum') !=
+            _get_subject_checksum(
+                certificate_info['subject'],
+                certificate_info.get('sans', []))):
+        log('stored signing request is for another subject,'
+            ' generating one')
+        return None
+    log('using stored signing request')
+    return stored_certificate_request['pem'].encode('utf-8')
+
+
+# =============================================================================
+#
+# private key pool functions
+#
+# =============================================================================
+
+# =============================================================================
+# _get_key_pool_size
+# =============================================================================
+def _get_key_pool_size(payload: dict) -> int:
+    return payload['source']['key_pool'].get('size',
+                                             KEY_POOL_DEFAULT_SIZE)
+
+
+# =============================================================================
+# _get_key_pool_dir_name
+# =============================================================================
+def _get_key_pool_dir_name(key_request: dict) -> str:
+    # keys are pooled by algorithm and size
+    return (f"{KEY_POOL_DIR_NAME}/"
+            f"{key_request['algo']}-{key_request['size']}")
+
+
+# =============================================================================
+# _get_pooled_private_key_s3_object
+# =============================================================================
+def _get_pooled_private_key_s3_object(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    key_request: dict,
+    checksum: str
+) -> boto3.resources.base.ServiceResource:
+    # pooled keys are named after their checksum
+    return _get_s3_object(
+        payload,
+        s3_resource,
+        f"{_get_key_pool_dir_name(key_request)}/"
+        f"{checksum}{PRIVATE_KEY_FILE_SUFFIX}")
+
+
+# =============================================================================
+# _get_key_pool_claim_s3_object
+# =============================================================================
+def _get_key_pool_claim_s3_object(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    key_request: dict,
+    checksum: str
+) -> boto3.resources.base.ServiceResource:
+    return _get_s3_object(
+        payload,
+        s3_resource,
+        f"{_get_key_pool_dir_name(key_request)}/"
+        f"{checksum}{KEY_POOL_CLAIM_FILE_SUFFIX}")
+
+
+# =============================================================================
+# _list_key_pool
+# =============================================================================
+def _list_key_pool(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    key_request: dict
+) -> Tuple[Dict[str, datetime], Dict[str, datetime]]:
+    '''lists the pooled private keys for a key request
+
+    returns the last modified dates of the pooled keys,
+    and of the claims on them, each by key checksum
+
+    takes one ListObjectsV2 call per 1000 objects
+    '''
+    list_prefix = _format_s3_key_with_prefix(
+        payload['source'].get('prefix'),
+        f"{_get_key_pool_dir_name(key_request)}/")
+    paginator = s3_resource.meta.client.get_paginator('list_objects_v2')
+    pooled_private_keys = {}
+    claims = {}
+    for page in paginator.paginate(
+            Bucket=payload['source']['bucket_name'],
+            Prefix=list_prefix):
+        for s3_object_summary in page.get('Contents', []):
+            file_name = s3_object_summary['Key'][len(list_prefix):]
+            if file_name.endswith(PRIVATE_KEY_FILE_SUFFIX):
+                pooled_private_keys[
+                    file_name[:-len(PRIVATE_KEY_FILE_SUFFIX)]] = \
+                    s3_object_summary['LastModified']
+            elif file_name.endswith(KEY_POOL_CLAIM_FILE_SUFFIX):
+                claims[file_name[:-len(KEY_POOL_CLAIM_FILE_SUFFIX)]] = \
+                    s3_object_summary['LastModified']
+    return pooled_private_keys, claims
+
+
+# =============================================================================
+# _is_precondition_failed_s3_error
+# =============================================================================
+def _is_precondition_failed_s3_error(
+    error: botocore.exceptions.ClientError
+) -> bool:
+    # s3 answers conflict to a conditional write racing another one
+    return ('Error' in error.response and
+            error.response['Error'].get('Code') in (
+                '412', 'PreconditionFailed',
+                '409', 'ConditionalRequestConflict'))
+
+
+# =============================================================================
+# _get_conditional_put_s3_client
+# =============================================================================
+def _get_conditional_put_s3_client(
+    payload: dict,
+    boto3_session: boto3.session.Session
+):
+    '''creates an s3 client whose PutObject calls only create objects,
+    failing when an object already exists under the key
+
+    boto3 1.33, the last release to support the python 3.7 of the images,
+    has no IfNoneMatch parameter for PutObject, so the If-None-Match header
+    is added by a botocore event handler. the client is only used for these
+    calls, so the handler never affects the client of the s3 resource
+    '''
+    def add_if_none_match_header(params: dict, **kwargs) -> None:
+        params['headers']['If-None-Match'] = '*'
+
+    s3_client = _get_s3_resource(payload, boto3_session).meta.client
+    s3_client.meta.events.register(
+        'before-call.s3.PutObject',
+        add_if_none_match_header)
+    return s3_client
+
+
+# =============================================================================
+# _put_s3_object_if_absent
+# =============================================================================
+def _put_s3_object_if_absent(
+    conditional_put_s3_client,
+    s3_object,
+    contents: bytes
+) -> bool:
+    '''uploads an s3 object unless an object already exists
+    under its key, with a single conditional PutObject call
+    made by a client from _get_conditional_put_s3_client
+
+    returns False if an object already exists
+    '''
+    import botocore.exceptions
+    try:
+        conditional_put_s3_client.put_object(
+            Bucket=s3_object.bucket_name,
+            Key=s3_object.key,
+            Body=contents)
+    except botocore.exceptions.ClientError as e:
+        if _is_precondition_failed_s3_error(e):
+            return False
+        raise
+    return True
+
+
+# =============================================================================
+# _is_conditional_put_enforced
 # =============================================================================
-def _should_save_ca_certificate_chain(payload: dict) -> bool:
-    if 'params' in payload:
-        return payload['params'].get('save_ca_chain',
-                                     False) is True
-    else:
-        return False
+def _is_conditional_put_enforced(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    conditional_put_s3_client
+) -> bool:
+    '''checks once per invocation that the store enforces conditional puts,
+    by creating a probe object twice, the second put must fail
+
+    stores which ignore the If-None-Match header let concurrent claims
+    of the same pooled key all succeed, so the key pool is not used there
+    '''
+    import secrets
+    bucket_name = payload['source']['bucket_name']
+    if bucket_name not in _conditional_put_enforced_memo:
+        probe = _get_s3_object(
+            payload,
+            s3_resource,
+            f"{KEY_POOL_DIR_NAME}/"
+            f"{KEY_POOL_PROBE_FILE_PREFIX}{secrets.token_hex(16)}")
+        try:
+            _conditional_put_enforced_memo[bucket_name] = (
+                _put_s3_object_if_absent(
+                    conditional_put_s3_client,
+                    probe,
+                    b'')
+                and not _put_s3_object_if_absent(
+                    conditional_put_s3_client,
+                    probe,
+                    b''))
+        finally:
+            _delete_s3_objects(payload, s3_resource, [probe])
+    return _conditional_put_enforced_memo[bucket_name]
 
 
 # =============================================================================
-# _action_is_create
+# _delete_s3_objects
 # =============================================================================
-def _action_is_create(payload: dict) -> bool:
-    if 'params' in payload and 'action' in payload['params']:
-        return payload['params']['action'] == 'create'
-    else:
-        return True
+def _delete_s3_objects(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    s3_objects: list
+) -> None:
+    # deletes up to 1000 objects with a single DeleteObjects call
+    s3_resource.meta.client.delete_objects(
+        Bucket=payload['source']['bucket_name'],
+        Delete={
+            'Objects': [{'Key': s3_object.key} for s3_object in s3_objects],
+            'Quiet': True
+        })
 
 
 # =============================================================================
-# _action_is_renew
+# _claim_pooled_private_key
 # =============================================================================
-def _action_is_renew(payload: dict) -> bool:
-    if 'params' in payload and 'action' in payload['params']:
-        return payload['params']['action'] == 'renew'
-    else:
-        return False
+def _claim_pooled_private_key(
+    payload: dict,
+    boto3_session: boto3.session.Session,
+    s3_resource: boto3.resources.base.ServiceResource,
+    key_request: dict
+) -> Optional[bytes]:
+    '''claims a pre-generated private key from the key pool
 
+    a key is claimed by creating its claim object with a conditional
+    PutObject call, which succeeds for a single out even when several
+    claim the same key at the same time. the claimed key is then
+    fetched, verified against the checksum it is named after,
+    and removed from the pool together with its claim
 
-# =============================================================================
-# _keypair_exists
-# =============================================================================
-def _keypair_exists(certificate, private_key) -> bool:
-    '''checks if a keypair exists
+    the pool is skipped on stores which do not enforce the condition,
+    see _is_conditional_put_enforced
 
-    attempts to get the checksums from each object
-    this results in a HeadObject call, which if failed
-    due to permissions, indicates the object is missing
+    returns None when the pool holds no unclaimed key, or the pool
+    is skipped, so the caller generates a key instead
+    '''
+    import random
+    import botocore.exceptions
+    pooled_private_keys, claims = _list_key_pool(
+        payload,
+        s3_resource,
+        key_request)
+    checksums = [
+        checksum
+        for checksum in pooled_private_keys
+        if checksum not in claims
+    ]
+    if not checksums:
+        log(f"key pool {_get_key_pool_dir_name(key_request)} is empty")
+        return None
+    # try the keys in random order, so concurrent outs
+    # rarely race for the same key
+    random.shuffle(checksums)
+    conditional_put_s3_client = _get_conditional_put_s3_client(
+        payload,
+        boto3_session)
+    if not _is_conditional_put_enforced(
+            payload,
+            s3_resource,
+            conditional_put_s3_client):
+        log("key pool skipped, the bucket does not enforce conditional puts")
+        return None
+    for checksum in checksums:
+        claim = _get_key_pool_claim_s3_object(
+            payload,
+            s3_resource,
+            key_request,
+            checksum)
+        if not _put_s3_object_if_absent(
+                conditional_put_s3_client,
+                claim,
+                b''):
+            log(f"pooled private key already claimed: {checksum}")
+            continue
+        pooled_private_key = _get_pooled_private_key_s3_object(
+            payload,
+            s3_resource,
+            key_request,
+            checksum)
+        try:
+            private_key = _fetch_s3_object(
+                payload,
+                pooled_private_key,
+                checksum)
+        except botocore.exceptions.ClientError as e:
+            # removed by a refill since the listing
+            if not _is_missing_s3_object_error(e):
+                raise
+            _delete_s3_objects(payload, s3_resource, [claim])
+            continue
+        _delete_s3_objects(
+            payload,
+            s3_resource,
+            [pooled_private_key, claim])
+        log(f"claimed pooled private key: {checksum}")
+        return private_key
+    log(f"key pool {_get_key_pool_dir_name(key_request)} is exhausted")
+    return None
 
-    both objects must exist to return True
 
-    if either object is missing, return False
+# =============================================================================
+# _refill_key_pool
+# =============================================================================
+def _refill_key_pool(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    pki_engine: ModuleType,
+    key_request: dict
+) -> Tuple[int, int]:
+    '''tops the key pool for a key request up to the key_pool size
 
-    otherwise raise
+    the keys are generated in parallel by the pki engine,
+    and uploaded concurrently
 
-    note: this will return a false negative if
-    the client legitimately does not have permissions
+    stale claims are removed together with their key
 
-    s3 does not let a user know if an object actually exists
-    without resulting to listing the bucket keys and parsing them
+    returns the number of keys generated,
+    and the number of unclaimed keys in the pool
     '''
+    pooled_private_keys, claims = _list_key_pool(
+        payload,
+        s3_resource,
+        key_request)
+
+    # remove stale claims, and the keys they claimed
+    now = datetime.now(timezone.utc)
+    stale_checksums = [
+        checksum
+        for checksum, last_modified in claims.items()
+        if now - last_modified > KEY_POOL_STALE_CLAIM_AGE
+    ]
+    if stale_checksums:
+        log(f"removing {len(stale_checksums)} stale key pool claims")
+        _delete_s3_objects(
+            payload,
+            s3_resource,
+            [_get_key_pool_claim_s3_object(
+                payload, s3_resource, key_request, checksum)
+             for checksum in stale_checksums] +
+            [_get_pooled_private_key_s3_object(
+                payload, s3_resource, key_request, checksum)
+             for checksum in stale_checksums
+             if checksum in pooled_private_keys])
+
+    # generate the missing keys
+    unclaimed_key_count = len([
+        checksum
+        for checksum in pooled_private_keys
+        if checksum not in claims
+    ])
+    missing_key_count = max(
+        0,
+        _get_key_pool_size(payload) - unclaimed_key_count)
+    log(f"key pool {_get_key_pool_dir_name(key_request)}:"
+        f" {unclaimed_key_count} keys, generating {missing_key_count}")
+    private_keys = pki_engine.generate_private_keys(
+        [key_request] * missing_key_count)
+
+    # upload them
+    uploads = []
+    for private_key in private_keys:
+        checksum = _hash_bytes(private_key)
+        uploads.append((
+            _get_pooled_private_key_s3_object(
+                payload,
+                s3_resource,
+                key_request,
+                checksum),
+            checksum,
+            private_key))
+    _upload_s3_objects(payload, uploads)
+    return missing_key_count, unclaimed_key_count + missing_key_count
+
+
+# =============================================================================
+# _get_current_keypair_checksum
+# =============================================================================
+def _get_current_keypair_checksum(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    file_prefix: str,
+    file_description: str
+) -> Optional[str]:
+    # the version emitted by an out which leaves the keypair as it is,
+    # None when there is no keypair yet
+    import botocore.exceptions
     try:
-        _get_s3_object_checksum(certificate)
-        _get_s3_object_checksum(private_key)
+        return _get_keypair_checksum(*_get_keypair_checksums(
+            payload,
+            _get_s3_object(
+                payload,
+                s3_resource,
+                _get_manifest_file_name(file_prefix)),
+            _get_s3_object(
+                payload,
+                s3_resource,
+                f"{file_prefix}{CERTIFICATE_FILE_SUFFIX}"),
+            _get_s3_object(
+                payload,
+                s3_resource,
+                f"{file_prefix}{PRIVATE_KEY_FILE_SUFFIX}")))
     except botocore.exceptions.ClientError as e:
-        if ('Error' in e.response and
-                e.response['Error']['Code'] == '403' and
-                e.response['Error']['Message'] == 'Forbidden'):
-            return False
-        else:
-            raise
-    return True
+        if _is_missing_s3_object_error(e):
+            log(f"{file_description} keypair not found,"
+                ' emitting a key pool version')
+            return None
+        raise
 
 
 # =============================================================================
-# _should_overwrite_keypair
+# _create_key_pool_version
 # =============================================================================
-def _should_overwrite_keypair(
-        payload: dict,
-        certificate,
-        private_key) -> bool:
-    if _keypair_exists(certificate, private_key):
-        if ('params' in payload and
-                'allow_overwrite' in payload['params'] and
-                payload['params']['allow_overwrite'] is True):
-            return True
-        else:
-            return False
-    else:
-        return True
+def _create_key_pool_version(
+    checksum: Optional[str],
+    key_request: dict
+) -> dict:
+    # without a keypair, the version only names the key pool
+    if checksum is None:
+        return {KEY_POOL_VERSION_KEY: _get_key_pool_dir_name(key_request)}
+    return {'checksum': checksum}
+
+
+# =============================================================================
+# _create_key_pool_out_payload
+# =============================================================================
+def _create_key_pool_out_payload(
+    payload: dict,
+    version: dict,
+    generated_key_count: int,
+    key_count: int
+) -> dict:
+    out_payload: dict = {
+        'version': version,
+        'metadata': []
+    }
+    _update_payload_with_metadata(
+        out_payload,
+        [
+            {
+                'name': 'key_pool_generated_keys',
+                'value': str(generated_key_count)
+            },
+            {
+                'name': 'key_pool_keys',
+                'value': str(key_count)
+            }
+        ])
+    if _should_add_timings_metadata(payload):
+        _update_payload_with_metadata(
+            out_payload,
+            _create_timings_metadata())
+    return out_payload
 
 
 # =============================================================================
@@ -447,11 +2928,62 @@ def _checksum_exists(
 #
 # =============================================================================
 
+# =============================================================================
+# _create_ca_certificate_chain
+# =============================================================================
+def _create_ca_certificate_chain(*certificates: bytes) -> bytes:
+    '''concatenates pem certificates into a chain, in the given order
+
+    each certificate is normalised to end in exactly one newline,
+    so a certificate missing its trailing newline cannot run into
+    the next certificate's BEGIN line
+    '''
+    return b''.join(
+        certificate.rstrip() + b'\n'
+        for certificate in certificates)
+
+
+# =============================================================================
+# _get_leaf_hosts
+# =============================================================================
+def _get_leaf_hosts(payload: dict) -> Optional[List[str]]:
+    # the leaf hosts param, if present
+    if 'leaf' in payload['params']:
+        return payload['params']['leaf'].get('hosts')
+    return None
+
+
+# =============================================================================
+# _get_pki_engine
+# =============================================================================
+def _get_pki_engine(payload: dict) -> ModuleType:
+    '''returns the module that creates and renews keypairs,
+    either lib.cfssl, which runs cfssl, or lib.native, which does
+    the same in process
+    '''
+    engine = payload['source'].get('engine', 'cfssl')
+    if engine == 'cfssl':
+        import lib.cfssl
+        return lib.cfssl
+    if engine == 'native':
+        import lib.native
+        return lib.native
+    raise ValueError(f"unknown engine '{engine}'")
+
+
 # =============================================================================
 # _create_check_payload
 # =============================================================================
-def _create_check_payload(checksum: str) -> list:
-    return [{'checksum': checksum}]
+def _create_check_payload(
+    checksum: str,
+    renewal_due: bool = False
+) -> list:
+    version = {'checksum': checksum}
+    # a distinct version, so the version that became due
+    # for renewal can trigger a renewal job
+    if renewal_due:
+        version['renewal_due'] = 'true'
+    return [version]
 
 
 # =============================================================================
@@ -459,9 +2991,7 @@ def _create_check_payload(checksum: str) -> list:
 # =============================================================================
 def _create_in_payload(payload: dict) -> dict:
     in_payload: dict = {
-        'version': {
-            'checksum': payload['version']['checksum']
-        },
+        'version': dict(payload['version']),
         'metadata': []
     }
     return in_payload
@@ -483,6 +3013,19 @@ def _create_out_payload(
     return out_payload
 
 
+# =============================================================================
+# _get_leaf_file_description
+# =============================================================================
+def _get_leaf_file_description(
+        payload: dict,
+        leaf_name: str,
+        file_kind: str) -> str:
+    # in multi-leaf mode, metadata names tell the leaves apart
+    if _is_multi_leaf(payload):
+        return f"leaf_{leaf_name}_{file_kind}"
+    return f"leaf_{file_kind}"
+
+
 # =============================================================================
 # _create_file_metadata
 # =============================================================================
@@ -542,6 +3085,18 @@ def _create_hosts_metadata(
     return hosts_metadata
 
 
+# =============================================================================
+# _create_timings_metadata
+# =============================================================================
+def _create_timings_metadata():
+    # where the invocation spent its time so far, see lib.trace
+    return [
+        {
+            'name': 'timings',
+            'value': lib.trace.get_timings_summary()
+        }]
+
+
 # =============================================================================
 # _update_payload_with_metadata
 # =============================================================================
@@ -560,8 +3115,43 @@ def _update_payload_with_metadata(
 # =============================================================================
 # _do_check
 # =============================================================================
-def _do_check(checksum: str) -> None:
-    _write_payload(_create_check_payload(checksum))
+def _do_check(
+    checksum: str,
+    renewal_due: bool = False
+) -> None:
+    _write_payload(_create_check_payload(checksum, renewal_due))
+
+
+# =============================================================================
+# _do_version_history_check
+# =============================================================================
+def _do_version_history_check(
+    payload: dict,
+    s3_resource: boto3.resources.base.ServiceResource,
+    manifest,
+    certificate,
+    private_key
+) -> None:
+    history = _get_keypair_version_history(
+        payload,
+        s3_resource,
+        manifest,
+        certificate,
+        private_key)
+    for keypair_version in history:
+        log(f"keypair version: {keypair_version['checksum']}")
+    _write_payload(history)
+
+
+# =============================================================================
+# _do_multi_leaf_check
+# =============================================================================
+def _do_multi_leaf_check(leaf_checksums: Dict[str, str]) -> None:
+    # no version until at least one leaf exists
+    if not leaf_checksums:
+        _write_payload([])
+        return
+    _write_payload([_create_multi_leaf_version(leaf_checksums)])
 
 
 # =============================================================================
@@ -576,6 +3166,7 @@ def _do_check(checksum: str) -> None:
 def root_ca_check() -> None:
     # read input
     input_payload = _read_payload()
+    _validate_renew_before(input_payload)
 
     # create s3 objects
     boto3_session = _get_boto3_session(input_payload)
@@ -590,12 +3181,31 @@ def root_ca_check() -> None:
             input_payload,
             s3_resource,
             ROOT_CA_PRIVATE_KEY_FILE_NAME)
+    root_ca_manifest = \
+        _get_s3_object(
+            input_payload,
+            s3_resource,
+            ROOT_CA_MANIFEST_FILE_NAME)
+
+    # with version history, emit every keypair version
+    # since the requested one instead
+    if _should_check_version_history(input_payload):
+        _do_version_history_check(
+            input_payload,
+            s3_resource,
+            root_ca_manifest,
+            root_ca_certificate,
+            root_ca_private_key)
+        return
 
     # get remote checksums
-    root_ca_certificate_checksum = \
-        _get_s3_object_checksum(root_ca_certificate)
-    root_ca_private_key_checksum = \
-        _get_s3_object_checksum(root_ca_private_key)
+    (root_ca_certificate_checksum,
+     root_ca_private_key_checksum) = \
+        _get_keypair_checksums(
+            input_payload,
+            root_ca_manifest,
+            root_ca_certificate,
+            root_ca_private_key)
 
     log(f"root ca certificate checksum: {root_ca_certificate_checksum}")
     log(f"root ca private key checksum: {root_ca_private_key_checksum}")
@@ -608,8 +3218,14 @@ def root_ca_check() -> None:
 
     log(f"root ca checksum: {root_ca_checksum}")
 
-    # do check
-    _do_check(root_ca_checksum)
+    # do check, flagging a certificate due for renewal
+    _do_check(
+        root_ca_checksum,
+        _is_certificate_renewal_due(
+            input_payload,
+            root_ca_manifest,
+            root_ca_certificate,
+            root_ca_private_key))
 
 
 # =============================================================================
@@ -634,11 +3250,22 @@ def root_ca_in() -> None:
             s3_resource,
             ROOT_CA_PRIVATE_KEY_FILE_NAME)
 
+    # pin the keypair to the requested version from the version history
+    if _has_keypair_version_ids(input_payload):
+        (root_ca_certificate,
+         root_ca_private_key) = \
+            _get_keypair_s3_object_versions(
+                input_payload,
+                root_ca_certificate,
+                root_ca_private_key)
+
     # get remote checksums
-    root_ca_certificate_checksum = \
-        _get_s3_object_checksum(root_ca_certificate)
-    root_ca_private_key_checksum = \
-        _get_s3_object_checksum(root_ca_private_key)
+    (root_ca_certificate_checksum,
+     root_ca_private_key_checksum) = \
+        _get_s3_object_checksums(
+            input_payload,
+            root_ca_certificate,
+            root_ca_private_key)
 
     log(f"root ca certificate checksum: {root_ca_certificate_checksum}")
     log(f"root ca private key checksum: {root_ca_private_key_checksum}")
@@ -672,9 +3299,11 @@ def root_ca_in() -> None:
         if _should_download_certificate(input_payload):
             # download file
             _download_s3_object_to_path(
+                input_payload,
                 root_ca_certificate,
                 root_ca_certificate_checksum,
-                root_ca_certificate_file_path)
+                root_ca_certificate_file_path,
+                link=True)
             # create file metadata
             root_ca_certificate_file_metadata = _create_file_metadata(
                 "root_ca_certificate",
@@ -687,9 +3316,11 @@ def root_ca_in() -> None:
         if _should_download_private_key(input_payload):
             # download file
             _download_s3_object_to_path(
+                input_payload,
                 root_ca_private_key,
                 root_ca_private_key_checksum,
-                root_ca_private_key_file_path)
+                root_ca_private_key_file_path,
+                link=True)
             # create file metadata
             root_ca_private_key_file_metadata = _create_file_metadata(
                 "root_ca_private_key",
@@ -699,10 +3330,30 @@ def root_ca_in() -> None:
             _update_payload_with_metadata(
                 output_payload,
                 root_ca_private_key_file_metadata)
+        if _should_fetch_metadata_only(input_payload):
+            # get certificate details
+            # from the metadata read along with the checksum
+            root_ca_certificate_details = _get_certificate_details(
+                input_payload,
+                root_ca_certificate,
+                root_ca_certificate_checksum)
+            # update payload with certificate details metadata
+            _update_payload_with_metadata(
+                output_payload,
+                _create_certificate_details_metadata(
+                    "root_ca_certificate",
+                    root_ca_certificate_details,
+                    include_hosts=False))
     else:
         # cannot continue if checksum is unavailable
         raise ValueError('requested checksum is unavailable')
 
+    # add timings metadata, if requested
+    if _should_add_timings_metadata(input_payload):
+        _update_payload_with_metadata(
+            output_payload,
+            _create_timings_metadata())
+
     # write output
     _write_payload(output_payload)
 
@@ -711,9 +3362,13 @@ def root_ca_in() -> None:
 # root_ca_out
 # =============================================================================
 def root_ca_out() -> None:
+    import lib.cfssl
+    import lib.x509
+
     # read input
     input_payload = _read_payload()
-    repository_dir = _get_repository_dir_path()
+    workspace_dir = _get_workspace_dir_path()
+    pki_engine = _get_pki_engine(input_payload)
 
     # create s3 objects
     boto3_session = _get_boto3_session(input_payload)
@@ -728,15 +3383,20 @@ def root_ca_out() -> None:
             input_payload,
             s3_resource,
             ROOT_CA_PRIVATE_KEY_FILE_NAME)
+    root_ca_manifest = \
+        _get_s3_object(
+            input_payload,
+            s3_resource,
+            ROOT_CA_MANIFEST_FILE_NAME)
 
     # get file paths
     root_ca_certificate_file_path = \
         _get_repository_file_path(
-            repository_dir,
+            workspace_dir,
             ROOT_CA_CERTIFICATE_FILE_NAME)
     root_ca_private_key_file_path = \
         _get_repository_file_path(
-            repository_dir,
+            workspace_dir,
             ROOT_CA_PRIVATE_KEY_FILE_NAME)
 
     # check if keypair can be overwritten
@@ -748,17 +3408,16 @@ def root_ca_out() -> None:
 
     # check action
     if _action_is_create(input_payload):
-        # create root ca key pair
-        lib.cfssl.create_root_ca(
-            input_payload,
-            repository_dir,
-            ROOT_CA_FILE_PREFIX)
+        # create root ca key pair in memory
+        root_ca_keypair = pki_engine.create_root_ca(input_payload)
     elif _action_is_renew(input_payload):
         # get remote checksums
-        root_ca_certificate_initial_checksum = \
-            _get_s3_object_checksum(root_ca_certificate)
-        root_ca_private_key_initial_checksum = \
-            _get_s3_object_checksum(root_ca_private_key)
+        (root_ca_certificate_initial_checksum,
+         root_ca_private_key_initial_checksum) = \
+            _get_s3_object_checksums(
+                input_payload,
+                root_ca_certificate,
+                root_ca_private_key)
 
         log('initial root ca certificate checksum: '
             f"{root_ca_certificate_initial_checksum}")
@@ -767,17 +3426,23 @@ def root_ca_out() -> None:
 
         # download keypair
         _download_s3_object_to_path(
+            input_payload,
             root_ca_certificate,
             root_ca_certificate_initial_checksum,
             root_ca_certificate_file_path)
         _download_s3_object_to_path(
+            input_payload,
             root_ca_private_key,
             root_ca_private_key_initial_checksum,
             root_ca_private_key_file_path)
 
         # get current issue and expiration dates from certificate info
         root_ca_certificate_initial_info = \
-            lib.cfssl.get_certificate_info(root_ca_certificate_file_path)
+            lib.x509.get_certificate_info(
+                _fetch_s3_object(
+                    input_payload,
+                    root_ca_certificate,
+                    root_ca_certificate_initial_checksum))
         root_ca_certificate_initial_issue_date = \
             lib.cfssl.get_certificate_issue_date(
                 root_ca_certificate_initial_info)
@@ -798,20 +3463,24 @@ def root_ca_out() -> None:
         log('initial root ca certificate time until expiration: '
             f"{root_ca_certificate_initial_time_until_expiration}")
 
-        # renew certificate
-        lib.cfssl.renew_root_certificate(
-            repository_dir,
-            ROOT_CA_FILE_PREFIX,
+        # renew certificate in memory,
+        # keeping the private key
+        root_ca_keypair = pki_engine.renew_root_certificate(
+            workspace_dir,
             ROOT_CA_CERTIFICATE_FILE_NAME,
             ROOT_CA_PRIVATE_KEY_FILE_NAME)
+        root_ca_keypair['key'] = _fetch_s3_object(
+            input_payload,
+            root_ca_private_key,
+            root_ca_private_key_initial_checksum)
     else:
         raise ValueError("action must be 'create' or 'renew'")
 
     # get local checksums
     root_ca_certificate_checksum = \
-        _hash_file(root_ca_certificate_file_path)
+        _hash_bytes(root_ca_keypair['cert'])
     root_ca_private_key_checksum = \
-        _hash_file(root_ca_private_key_file_path)
+        _hash_bytes(root_ca_keypair['key'])
 
     log(f"root ca certificate checksum: {root_ca_certificate_checksum}")
     log(f"root ca private key checksum: {root_ca_private_key_checksum}")
@@ -826,8 +3495,8 @@ def root_ca_out() -> None:
 
     # get certificate info
     root_ca_certificate_info = \
-        lib.cfssl.get_certificate_info(
-            root_ca_certificate_file_path)
+        lib.x509.get_certificate_info(
+            root_ca_keypair['cert'])
 
     # get common name from certificate info
     root_ca_certificate_common_name = \
@@ -858,23 +3527,54 @@ def root_ca_out() -> None:
     log('root ca certificate time until expiration: '
         f"{root_ca_certificate_time_until_expiration}")
 
-    # upload certificate
-    _upload_s3_object_to_path(
-        root_ca_certificate,
-        root_ca_certificate_checksum,
-        root_ca_certificate_file_path)
-
-    # upload private key
-    _upload_s3_object_to_path(
-        root_ca_private_key,
-        root_ca_private_key_checksum,
-        root_ca_private_key_file_path)
+    # upload certificate and private key concurrently
+    # check reads the keypair manifest, which is only uploaded
+    # once both are in place, so a version never pairs
+    # a new certificate with an old private key
+    # if either upload fails, the manifest would still describe
+    # the previous keypair, so it is removed
+    try:
+        (root_ca_certificate_upload,
+         root_ca_private_key_upload) = _upload_s3_objects(
+            input_payload,
+            [(root_ca_certificate,
+              root_ca_certificate_checksum,
+              root_ca_keypair['cert'],
+              _create_certificate_s3_metadata(
+                  root_ca_certificate_info)),
+             (root_ca_private_key,
+              root_ca_private_key_checksum,
+              root_ca_keypair['key'])])
+
+        # upload keypair manifest last
+        root_ca_manifest_upload = _upload_keypair_manifest(
+            input_payload,
+            root_ca_manifest,
+            _create_keypair_manifest(
+                root_ca_certificate_checksum,
+                root_ca_private_key_checksum,
+                root_ca_certificate_info,
+                root_ca_certificate_upload,
+                root_ca_private_key_upload))
+    except Exception:
+        _remove_keypair_manifest(input_payload, root_ca_manifest)
+        raise
 
     # create output payload
     output_payload = _create_out_payload(
         input_payload,
         root_ca_checksum)
 
+    # with version history, the version pins the uploaded versions
+    if (_should_check_version_history(input_payload) and
+            root_ca_certificate_upload.get('VersionId') and
+            root_ca_private_key_upload.get('VersionId')):
+        output_payload['version'] = _create_keypair_version(
+            root_ca_checksum,
+            root_ca_certificate_upload['VersionId'],
+            root_ca_private_key_upload['VersionId'],
+            root_ca_manifest_upload.get('VersionId'))
+
     # create certificate file metadata
     root_ca_certificate_file_metadata = _create_file_metadata(
         "root_ca_certificate",
@@ -912,6 +3612,12 @@ def root_ca_out() -> None:
         output_payload,
         root_ca_certificate_expiration_metadata)
 
+    # add timings metadata, if requested
+    if _should_add_timings_metadata(input_payload):
+        _update_payload_with_metadata(
+            output_payload,
+            _create_timings_metadata())
+
     # write output
     _write_payload(output_payload)
 
@@ -928,6 +3634,7 @@ def root_ca_out() -> None:
 def intermediate_ca_check() -> None:
     # read input
     input_payload = _read_payload()
+    _validate_renew_before(input_payload)
 
     # create s3 objects
     boto3_session = _get_boto3_session(input_payload)
@@ -942,12 +3649,31 @@ def intermediate_ca_check() -> None:
             input_payload,
             s3_resource,
             INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
+    intermediate_ca_manifest = \
+        _get_s3_object(
+            input_payload,
+            s3_resource,
+            INTERMEDIATE_CA_MANIFEST_FILE_NAME)
+
+    # with version history, emit every keypair version
+    # since the requested one instead
+    if _should_check_version_history(input_payload):
+        _do_version_history_check(
+            input_payload,
+            s3_resource,
+            intermediate_ca_manifest,
+            intermediate_ca_certificate,
+            intermediate_ca_private_key)
+        return
 
     # get remote checksums
-    intermediate_ca_certificate_checksum = \
-        _get_s3_object_checksum(intermediate_ca_certificate)
-    intermediate_ca_private_key_checksum = \
-        _get_s3_object_checksum(intermediate_ca_private_key)
+    (intermediate_ca_certificate_checksum,
+     intermediate_ca_private_key_checksum) = \
+        _get_keypair_checksums(
+            input_payload,
+            intermediate_ca_manifest,
+            intermediate_ca_certificate,
+            intermediate_ca_private_key)
 
     log('intermediate ca certificate checksum: '
         f"{intermediate_ca_certificate_checksum}")
@@ -962,8 +3688,14 @@ def intermediate_ca_check() -> None:
 
     log(f"intermediate ca checksum: {intermediate_ca_checksum}")
 
-    # do check
-    _do_check(intermediate_ca_checksum)
+    # do check, flagging a certificate due for renewal
+    _do_check(
+        intermediate_ca_checksum,
+        _is_certificate_renewal_due(
+            input_payload,
+            intermediate_ca_manifest,
+            intermediate_ca_certificate,
+            intermediate_ca_private_key))
 
 
 # =============================================================================
@@ -974,6 +3706,11 @@ def intermediate_ca_in() -> None:
     input_payload = _read_payload()
     repository_dir = _get_repository_dir_path()
 
+    # a key pool version has no keypair to fetch
+    if _is_key_pool_version(input_payload):
+        _write_payload(_create_in_payload(input_payload))
+        return
+
     # create s3 objects
     boto3_session = _get_boto3_session(input_payload)
     s3_resource = _get_s3_resource(input_payload, boto3_session)
@@ -988,11 +3725,22 @@ def intermediate_ca_in() -> None:
             s3_resource,
             INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
 
+    # pin the keypair to the requested version from the version history
+    if _has_keypair_version_ids(input_payload):
+        (intermediate_ca_certificate,
+         intermediate_ca_private_key) = \
+            _get_keypair_s3_object_versions(
+                input_payload,
+                intermediate_ca_certificate,
+                intermediate_ca_private_key)
+
     # get remote checksums
-    intermediate_ca_certificate_checksum = \
-        _get_s3_object_checksum(intermediate_ca_certificate)
-    intermediate_ca_private_key_checksum = \
-        _get_s3_object_checksum(intermediate_ca_private_key)
+    (intermediate_ca_certificate_checksum,
+     intermediate_ca_private_key_checksum) = \
+        _get_s3_object_checksums(
+            input_payload,
+            intermediate_ca_certificate,
+            intermediate_ca_private_key)
 
     log('intermediate ca certificate checksum: '
         f"{intermediate_ca_certificate_checksum}")
@@ -1028,9 +3776,11 @@ def intermediate_ca_in() -> None:
         if _should_download_certificate(input_payload):
             # download file
             _download_s3_object_to_path(
+                input_payload,
                 intermediate_ca_certificate,
                 intermediate_ca_certificate_checksum,
-                intermediate_ca_certificate_file_path)
+                intermediate_ca_certificate_file_path,
+                link=True)
             # create file metadata
             intermediate_ca_certificate_file_metadata = _create_file_metadata(
                 "intermediate_ca_certificate",
@@ -1043,9 +3793,11 @@ def intermediate_ca_in() -> None:
         if _should_download_private_key(input_payload):
             # download file
             _download_s3_object_to_path(
+                input_payload,
                 intermediate_ca_private_key,
                 intermediate_ca_private_key_checksum,
-                intermediate_ca_private_key_file_path)
+                intermediate_ca_private_key_file_path,
+                link=True)
             # create file metadata
             intermediate_ca_private_key_file_metadata = _create_file_metadata(
                 "intermediate_ca_private_key",
@@ -1055,10 +3807,30 @@ def intermediate_ca_in() -> None:
             _update_payload_with_metadata(
                 output_payload,
                 intermediate_ca_private_key_file_metadata)
+        if _should_fetch_metadata_only(input_payload):
+            # get certificate details
+            # from the metadata read along with the checksum
+            intermediate_ca_certificate_details = _get_certificate_details(
+                input_payload,
+                intermediate_ca_certificate,
+                intermediate_ca_certificate_checksum)
+            # update payload with certificate details metadata
+            _update_payload_with_metadata(
+                output_payload,
+                _create_certificate_details_metadata(
+                    "intermediate_ca_certificate",
+                    intermediate_ca_certificate_details,
+                    include_hosts=False))
     else:
         # cannot continue if checksum is unavailable
         raise ValueError('requested checksum is unavailable')
 
+    # add timings metadata, if requested
+    if _should_add_timings_metadata(input_payload):
+        _update_payload_with_metadata(
+            output_payload,
+            _create_timings_metadata())
+
     # write output
     _write_payload(output_payload)
 
@@ -1067,13 +3839,45 @@ def intermediate_ca_in() -> None:
 # intermediate_ca_out
 # =============================================================================
 def intermediate_ca_out() -> None:
+    import lib.cfssl
+    import lib.signer
+    import lib.x509
+
     # read input
     input_payload = _read_payload()
-    repository_dir = _get_repository_dir_path()
+    workspace_dir = _get_workspace_dir_path()
+    pki_engine = _get_pki_engine(input_payload)
 
     # create root ca s3 objects
     boto3_session = _get_boto3_session(input_payload)
     s3_resource = _get_s3_resource(input_payload, boto3_session)
+
+    # refill the key pool, leaving the keypair as it is
+    if _action_is_refill_key_pool(input_payload):
+        key_pool_key_request = \
+            lib.cfssl.create_intermediate_ca_signing_request(
+                input_payload)['key']
+        # read the version first, so a failure leaves the pool as it is
+        key_pool_version = _create_key_pool_version(
+            _get_current_keypair_checksum(
+                input_payload,
+                s3_resource,
+                INTERMEDIATE_CA_FILE_PREFIX,
+                'intermediate ca'),
+            key_pool_key_request)
+        (key_pool_generated_key_count,
+         key_pool_key_count) = _refill_key_pool(
+            input_payload,
+            s3_resource,
+            pki_engine,
+            key_pool_key_request)
+        _write_payload(_create_key_pool_out_payload(
+            input_payload,
+            key_pool_version,
+            key_pool_generated_key_count,
+            key_pool_key_count))
+        return
+
     root_ca_certificate = \
         _get_s3_object(
             input_payload,
@@ -1085,51 +3889,58 @@ def intermediate_ca_out() -> None:
             s3_resource,
             ROOT_CA_PRIVATE_KEY_FILE_NAME)
 
-    # get root ca remote checksums
-    root_ca_certificate_checksum = \
-        _get_s3_object_checksum(root_ca_certificate)
-    root_ca_private_key_checksum = \
-        _get_s3_object_checksum(root_ca_private_key)
+    # the root ca keypair is only needed to sign locally,
+    # a remote signer holds its own
+    if not _should_use_signer(input_payload):
+        # get root ca remote checksums
+        (root_ca_certificate_checksum,
+         root_ca_private_key_checksum) = \
+            _get_s3_object_checksums(
+                input_payload,
+                root_ca_certificate,
+                root_ca_private_key)
 
-    log(f"root ca certificate checksum: {root_ca_certificate_checksum}")
-    log(f"root ca private key checksum: {root_ca_private_key_checksum}")
+        log(f"root ca certificate checksum: {root_ca_certificate_checksum}")
+        log(f"root ca private key checksum: {root_ca_private_key_checksum}")
 
-    # get root ca remote checksum
-    root_ca_checksum = \
-        _get_keypair_checksum(
-            root_ca_certificate_checksum,
-            root_ca_private_key_checksum)
+        # get root ca remote checksum
+        root_ca_checksum = \
+            _get_keypair_checksum(
+                root_ca_certificate_checksum,
+                root_ca_private_key_checksum)
 
-    log(f"root ca checksum: {root_ca_checksum}")
+        log(f"root ca checksum: {root_ca_checksum}")
 
-    # get root ca file paths
-    root_ca_certificate_file_path = \
-        _get_repository_file_path(
-            repository_dir,
-            ROOT_CA_CERTIFICATE_FILE_NAME)
-    root_ca_private_key_file_path = \
-        _get_repository_file_path(
-            repository_dir,
-            ROOT_CA_PRIVATE_KEY_FILE_NAME)
+        # get root ca file paths
+        root_ca_certificate_file_path = \
+            _get_repository_file_path(
+                workspace_dir,
+                ROOT_CA_CERTIFICATE_FILE_NAME)
+        root_ca_private_key_file_path = \
+            _get_repository_file_path(
+                workspace_dir,
+                ROOT_CA_PRIVATE_KEY_FILE_NAME)
 
-    # download root ca keypair
-    _download_s3_object_to_path(
-        root_ca_certificate,
-        root_ca_certificate_checksum,
-        root_ca_certificate_file_path)
-    _download_s3_object_to_path(
-        root_ca_private_key,
-        root_ca_private_key_checksum,
-        root_ca_private_key_file_path)
+        # download root ca keypair
+        _download_s3_object_to_path(
+            input_payload,
+            root_ca_certificate,
+            root_ca_certificate_checksum,
+            root_ca_certificate_file_path)
+        _download_s3_object_to_path(
+            input_payload,
+            root_ca_private_key,
+            root_ca_private_key_checksum,
+            root_ca_private_key_file_path)
 
     # get intermediate ca file paths
     intermediate_ca_certificate_file_path = \
         _get_repository_file_path(
-            repository_dir,
+            workspace_dir,
             INTERMEDIATE_CA_CERTIFICATE_FILE_NAME)
     intermediate_ca_private_key_file_path = \
         _get_repository_file_path(
-            repository_dir,
+            workspace_dir,
             INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
 
     # create intermediate ca s3 objects
@@ -1143,6 +3954,11 @@ def intermediate_ca_out() -> None:
             input_payload,
             s3_resource,
             INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
+    intermediate_ca_manifest = \
+        _get_s3_object(
+            input_payload,
+            s3_resource,
+            INTERMEDIATE_CA_MANIFEST_FILE_NAME)
 
     # check if keypair can be overwritten
     if not _should_overwrite_keypair(
@@ -1153,19 +3969,44 @@ def intermediate_ca_out() -> None:
 
     # check action
     if _action_is_create(input_payload):
-        # create intermediate ca key pair
-        lib.cfssl.create_intermediate_ca(
-            input_payload,
-            repository_dir,
-            INTERMEDIATE_CA_FILE_PREFIX,
-            ROOT_CA_CERTIFICATE_FILE_NAME,
-            ROOT_CA_PRIVATE_KEY_FILE_NAME)
+        # claim a pre-generated private key, if there is a key pool
+        intermediate_ca_pooled_private_key = None
+        if _should_use_key_pool(input_payload):
+            intermediate_ca_pooled_private_key = \
+                _claim_pooled_private_key(
+                    input_payload,
+                    boto3_session,
+                    s3_resource,
+                    lib.cfssl.create_intermediate_ca_signing_request(
+                        input_payload)['key'])
+        if _should_use_signer(input_payload):
+            # create intermediate ca key in memory,
+            # and have the remote signer sign it
+            intermediate_ca_keypair = \
+                pki_engine.create_intermediate_ca_key(
+                    input_payload,
+                    workspace_dir,
+                    intermediate_ca_pooled_private_key)
+            intermediate_ca_keypair['cert'] = lib.signer.sign(
+                input_payload['source']['signer'],
+                intermediate_ca_keypair['csr'],
+                INTERMEDIATE_CA_SIGNER_PROFILE)
+        else:
+            # create intermediate ca key pair in memory
+            intermediate_ca_keypair = pki_engine.create_intermediate_ca(
+                input_payload,
+                workspace_dir,
+                ROOT_CA_CERTIFICATE_FILE_NAME,
+                ROOT_CA_PRIVATE_KEY_FILE_NAME,
+                intermediate_ca_pooled_private_key)
     elif _action_is_renew(input_payload):
         # get remote checksums
-        intermediate_ca_certificate_initial_checksum = \
-            _get_s3_object_checksum(intermediate_ca_certificate)
-        intermediate_ca_private_key_initial_checksum = \
-            _get_s3_object_checksum(intermediate_ca_private_key)
+        (intermediate_ca_certificate_initial_checksum,
+         intermediate_ca_private_key_initial_checksum) = \
+            _get_s3_object_checksums(
+                input_payload,
+                intermediate_ca_certificate,
+                intermediate_ca_private_key)
 
         log('initial intermediate ca certificate checksum: '
             f"{intermediate_ca_certificate_initial_checksum}")
@@ -1174,10 +4015,12 @@ def intermediate_ca_out() -> None:
 
         # download intermediate ca keypair
         _download_s3_object_to_path(
+            input_payload,
             intermediate_ca_certificate,
             intermediate_ca_certificate_initial_checksum,
             intermediate_ca_certificate_file_path)
         _download_s3_object_to_path(
+            input_payload,
             intermediate_ca_private_key,
             intermediate_ca_private_key_initial_checksum,
             intermediate_ca_private_key_file_path)
@@ -1185,8 +4028,11 @@ def intermediate_ca_out() -> None:
         # get current intermedia ca certificate
         # issue and expiration dates from certificate info
         intermediate_ca_certificate_initial_info = \
-            lib.cfssl.get_certificate_info(
-                intermediate_ca_certificate_file_path)
+            lib.x509.get_certificate_info(
+                _fetch_s3_object(
+                    input_payload,
+                    intermediate_ca_certificate,
+                    intermediate_ca_certificate_initial_checksum))
         intermediate_ca_certificate_initial_issue_date = \
             lib.cfssl.get_certificate_issue_date(
                 intermediate_ca_certificate_initial_info)
@@ -1207,23 +4053,55 @@ def intermediate_ca_out() -> None:
         log('initial root ca certificate time until expiration: '
             f"{intermediate_ca_certificate_initial_time_until_expiration}")
 
-        # renew certificate
-        lib.cfssl.renew_intermediate_certificate(
+        # get the signing request stored by the last out,
+        # unless the private key or subject has changed since
+        intermediate_ca_stored_signing_request = \
+            _get_stored_certificate_request(
+                input_payload,
+                intermediate_ca_manifest,
+                intermediate_ca_certificate_initial_checksum,
+                intermediate_ca_private_key_initial_checksum,
+                intermediate_ca_certificate_initial_info)
+
+        # renew certificate in memory,
+        # keeping the private key
+        if _should_use_signer(input_payload):
+            intermediate_ca_signing_request = \
+                intermediate_ca_stored_signing_request or \
+                pki_engine.create_renewal_signing_request(
+                    workspace_dir,
+                    INTERMEDIATE_CA_CERTIFICATE_FILE_NAME,
+                    INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
+            intermediate_ca_keypair = {
+                'cert': lib.signer.sign(
+                    input_payload['source']['signer'],
+                    intermediate_ca_signing_request,
+                    INTERMEDIATE_CA_SIGNER_PROFILE),
+                'csr': intermediate_ca_signing_request
+            }
+        else:
+            intermediate_ca_keypair = \
+                pki_engine.renew_intermediate_certificate(
+                    input_payload,
+                    workspace_dir,
+                    ROOT_CA_CERTIFICATE_FILE_NAME,
+                    ROOT_CA_PRIVATE_KEY_FILE_NAME,
+                    INTERMEDIATE_CA_CERTIFICATE_FILE_NAME,
+                    INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME,
+                    intermediate_ca_stored_signing_request)
+        intermediate_ca_keypair['key'] = _fetch_s3_object(
             input_payload,
-            repository_dir,
-            INTERMEDIATE_CA_FILE_PREFIX,
-            ROOT_CA_CERTIFICATE_FILE_NAME,
-            ROOT_CA_PRIVATE_KEY_FILE_NAME,
-            INTERMEDIATE_CA_CERTIFICATE_FILE_NAME,
-            INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
+            intermediate_ca_private_key,
+            intermediate_ca_private_key_initial_checksum)
     else:
-        raise ValueError("action must be 'create' or 'renew'")
+        raise ValueError("action must be 'create', 'renew',"
+                         " or 'refill_key_pool'")
 
     # get intermediate ca local checksums
     intermediate_ca_certificate_checksum = \
-        _hash_file(intermediate_ca_certificate_file_path)
+        _hash_bytes(intermediate_ca_keypair['cert'])
     intermediate_ca_private_key_checksum = \
-        _hash_file(intermediate_ca_private_key_file_path)
+        _hash_bytes(intermediate_ca_keypair['key'])
 
     log('intermediate ca certificate checksum: '
         f"{intermediate_ca_certificate_checksum}")
@@ -1240,8 +4118,8 @@ def intermediate_ca_out() -> None:
 
     # get certificate info
     intermediate_ca_certificate_info = \
-        lib.cfssl.get_certificate_info(
-            intermediate_ca_certificate_file_path)
+        lib.x509.get_certificate_info(
+            intermediate_ca_keypair['cert'])
 
     # get common name from certificate info
     intermediate_ca_certificate_common_name = \
@@ -1272,23 +4150,55 @@ def intermediate_ca_out() -> None:
     log('intermediate ca certificate time until expiration: '
         f"{intermediate_ca_certificate_time_until_expiration}")
 
-    # upload certificate
-    _upload_s3_object_to_path(
-        intermediate_ca_certificate,
-        intermediate_ca_certificate_checksum,
-        intermediate_ca_certificate_file_path)
-
-    # upload private key
-    _upload_s3_object_to_path(
-        intermediate_ca_private_key,
-        intermediate_ca_private_key_checksum,
-        intermediate_ca_private_key_file_path)
+    # upload certificate and private key concurrently
+    # check reads the keypair manifest, which is only uploaded
+    # once both are in place, so a version never pairs
+    # a new certificate with an old private key
+    # if either upload fails, the manifest would still describe
+    # the previous keypair, so it is removed
+    try:
+        (intermediate_ca_certificate_upload,
+         intermediate_ca_private_key_upload) = _upload_s3_objects(
+            input_payload,
+            [(intermediate_ca_certificate,
+              intermediate_ca_certificate_checksum,
+              intermediate_ca_keypair['cert'],
+              _create_certificate_s3_metadata(
+                  intermediate_ca_certificate_info)),
+             (intermediate_ca_private_key,
+              intermediate_ca_private_key_checksum,
+              intermediate_ca_keypair['key'])])
+
+        # upload keypair manifest last
+        intermediate_ca_manifest_upload = _upload_keypair_manifest(
+            input_payload,
+            intermediate_ca_manifest,
+            _create_keypair_manifest(
+                intermediate_ca_certificate_checksum,
+                intermediate_ca_private_key_checksum,
+                intermediate_ca_certificate_info,
+                intermediate_ca_certificate_upload,
+                intermediate_ca_private_key_upload,
+                intermediate_ca_keypair.get('csr')))
+    except Exception:
+        _remove_keypair_manifest(input_payload, intermediate_ca_manifest)
+        raise
 
     # create output payload
     output_payload = _create_out_payload(
         input_payload,
         intermediate_ca_checksum)
 
+    # with version history, the version pins the uploaded versions
+    if (_should_check_version_history(input_payload) and
+            intermediate_ca_certificate_upload.get('VersionId') and
+            intermediate_ca_private_key_upload.get('VersionId')):
+        output_payload['version'] = _create_keypair_version(
+            intermediate_ca_checksum,
+            intermediate_ca_certificate_upload['VersionId'],
+            intermediate_ca_private_key_upload['VersionId'],
+            intermediate_ca_manifest_upload.get('VersionId'))
+
     # create certificate file metadata
     intermediate_ca_certificate_file_metadata = _create_file_metadata(
         "intermediate_ca_certificate",
@@ -1327,6 +4237,12 @@ def intermediate_ca_out() -> None:
         output_payload,
         intermediate_ca_certificate_expiration_metadata)
 
+    # add timings metadata, if requested
+    if _should_add_timings_metadata(input_payload):
+        _update_payload_with_metadata(
+            output_payload,
+            _create_timings_metadata())
+
     # write output
     _write_payload(output_payload)
 
@@ -1343,11 +4259,28 @@ def intermediate_ca_out() -> None:
 def leaf_check() -> None:
     # read input
     input_payload = _read_payload()
+    _validate_renew_before(input_payload)
+
+    # in multi-leaf mode, check every matching leaf with a single listing
+    if _is_multi_leaf(input_payload):
+        boto3_session = _get_boto3_session(input_payload)
+        s3_resource = _get_s3_resource(input_payload, boto3_session)
+        leaf_checksums = _get_multi_leaf_checksums(
+            input_payload,
+            s3_resource)
+
+        log(f"leaf count: {len(leaf_checksums)}")
+
+        _do_multi_leaf_check(leaf_checksums)
+        return
 
     # get file names
     leaf_file_prefix = input_payload['source']['leaf_name']
-    leaf_certificate_file_name = f"{leaf_file_prefix}.pem"
-    leaf_private_key_file_name = f"{leaf_file_prefix}-key.pem"
+    leaf_certificate_file_name = \
+        f"{leaf_file_prefix}{CERTIFICATE_FILE_SUFFIX}"
+    leaf_private_key_file_name = \
+        f"{leaf_file_prefix}{PRIVATE_KEY_FILE_SUFFIX}"
+    leaf_manifest_file_name = _get_manifest_file_name(leaf_file_prefix)
 
     # create s3 objects
     boto3_session = _get_boto3_session(input_payload)
@@ -1362,12 +4295,31 @@ def leaf_check() -> None:
             input_payload,
             s3_resource,
             leaf_private_key_file_name)
+    leaf_manifest = \
+        _get_s3_object(
+            input_payload,
+            s3_resource,
+            leaf_manifest_file_name)
+
+    # with version history, emit every keypair version
+    # since the requested one instead
+    if _should_check_version_history(input_payload):
+        _do_version_history_check(
+            input_payload,
+            s3_resource,
+            leaf_manifest,
+            leaf_certificate,
+            leaf_private_key)
+        return
 
     # get remote checksums
-    leaf_certificate_checksum = \
-        _get_s3_object_checksum(leaf_certificate)
-    leaf_private_key_checksum = \
-        _get_s3_object_checksum(leaf_private_key)
+    (leaf_certificate_checksum,
+     leaf_private_key_checksum) = \
+        _get_keypair_checksums(
+            input_payload,
+            leaf_manifest,
+            leaf_certificate,
+            leaf_private_key)
 
     log('leaf certificate checksum: '
         f"{leaf_certificate_checksum}")
@@ -1382,8 +4334,14 @@ def leaf_check() -> None:
 
     log(f"leaf checksum: {leaf_checksum}")
 
-    # do check
-    _do_check(leaf_checksum)
+    # do check, flagging a certificate due for renewal
+    _do_check(
+        leaf_checksum,
+        _is_certificate_renewal_due(
+            input_payload,
+            leaf_manifest,
+            leaf_certificate,
+            leaf_private_key))
 
 
 # =============================================================================
@@ -1394,282 +4352,287 @@ def leaf_in() -> None:
     input_payload = _read_payload()
     repository_dir = _get_repository_dir_path()
 
-    # get file names
-    leaf_file_prefix = input_payload['source']['leaf_name']
-    leaf_certificate_file_name = f"{leaf_file_prefix}.pem"
-    leaf_private_key_file_name = f"{leaf_file_prefix}-key.pem"
+    # a key pool version has no keypair to fetch
+    if _is_key_pool_version(input_payload):
+        _write_payload(_create_in_payload(input_payload))
+        return
+
+    # get leaf names
+    # in multi-leaf mode, every leaf in the requested version
+    if _is_multi_leaf(input_payload):
+        leaf_names = \
+            _get_multi_leaf_version_leaf_names(input_payload['version'])
+    else:
+        leaf_names = [input_payload['source']['leaf_name']]
+
+    # plan the objects needed by this invocation up front
+    # the leaf keypairs are always needed to verify the requested checksum
+    # the ca certificates are only needed when saved or chained
+    fetch_file_names = [
+        file_name
+        for leaf_name in leaf_names
+        for file_name in _get_leaf_keypair_file_names(leaf_name)
+    ]
+    if (_should_download_root_ca_certificate(input_payload) or
+            _should_save_ca_certificate_chain(input_payload)):
+        fetch_file_names.append(ROOT_CA_CERTIFICATE_FILE_NAME)
+    if (_should_download_intermediate_ca_certificate(input_payload) or
+            _should_save_ca_certificate_chain(input_payload)):
+        fetch_file_names.append(INTERMEDIATE_CA_CERTIFICATE_FILE_NAME)
 
     # create s3 objects
     boto3_session = _get_boto3_session(input_payload)
     s3_resource = _get_s3_resource(input_payload, boto3_session)
-    leaf_certificate = \
-        _get_s3_object(
+    s3_objects = {
+        file_name: _get_s3_object(
             input_payload,
             s3_resource,
-            leaf_certificate_file_name)
-    leaf_private_key = \
-        _get_s3_object(
+            file_name)
+        for file_name in fetch_file_names
+    }
+
+    # pin the keypair to the requested version from the version history
+    if _has_keypair_version_ids(input_payload):
+        (leaf_certificate_file_name,
+         leaf_private_key_file_name) = \
+            _get_leaf_keypair_file_names(leaf_names[0])
+        (s3_objects[leaf_certificate_file_name],
+         s3_objects[leaf_private_key_file_name]) = \
+            _get_keypair_s3_object_versions(
+                input_payload,
+                s3_objects[leaf_certificate_file_name],
+                s3_objects[leaf_private_key_file_name])
+
+    # get remote checksums
+    # in multi-leaf mode, list the prefix once
+    # and only read the checksums of changed objects
+    if _is_multi_leaf(input_payload):
+        s3_object_etags = _list_s3_object_etags(input_payload, s3_resource)
+        checksums = _get_listed_s3_object_checksums(
             input_payload,
             s3_resource,
-            leaf_private_key_file_name)
+            {
+                file_name: s3_object_etags.get(file_name)
+                for file_name in fetch_file_names
+            })
+    else:
+        checksums = dict(zip(
+            fetch_file_names,
+            _get_s3_object_checksums(input_payload, *s3_objects.values())))
 
-    # get remote checksums
-    leaf_certificate_checksum = \
-        _get_s3_object_checksum(leaf_certificate)
-    leaf_private_key_checksum = \
-        _get_s3_object_checksum(leaf_private_key)
+    # get remote leaf checksums
+    leaf_checksums = {}
+    for leaf_name in leaf_names:
+        (leaf_certificate_file_name,
+         leaf_private_key_file_name) = \
+            _get_leaf_keypair_file_names(leaf_name)
 
-    log('leaf certificate checksum: '
-        f"{leaf_certificate_checksum}")
-    log('leaf private key checksum: '
-        f"{leaf_private_key_checksum}")
+        log(f"leaf {leaf_name} certificate checksum: "
+            f"{checksums[leaf_certificate_file_name]}")
+        log(f"leaf {leaf_name} private key checksum: "
+            f"{checksums[leaf_private_key_file_name]}")
+
+        leaf_checksums[leaf_name] = \
+            _get_keypair_checksum(
+                checksums[leaf_certificate_file_name],
+                checksums[leaf_private_key_file_name])
+
+        log(f"leaf {leaf_name} checksum: {leaf_checksums[leaf_name]}")
 
     # get remote checksum
-    leaf_checksum = \
-        _get_keypair_checksum(
-            leaf_certificate_checksum,
-            leaf_private_key_checksum)
+    if _is_multi_leaf(input_payload):
+        leaf_checksum = _get_multi_leaf_checksum(leaf_checksums)
+    else:
+        leaf_checksum = leaf_checksums[leaf_names[0]]
 
     log(f"leaf checksum: {leaf_checksum}")
 
-    # get file paths
-    leaf_certificate_file_path = \
-        _get_repository_file_path(
-            repository_dir,
-            leaf_certificate_file_name)
-    leaf_private_key_file_path = \
-        _get_repository_file_path(
-            repository_dir,
-            leaf_private_key_file_name)
+    # cannot continue if checksum is unavailable
+    if not _checksum_exists(
+            input_payload,
+            leaf_checksum):
+        raise ValueError('requested checksum is unavailable')
+
+    # get the ca destination dir
+    if _should_save_to_ca_subdir(input_payload):
+        ca_destination_dir = _get_repository_ca_subdir(repository_dir)
+    else:
+        ca_destination_dir = repository_dir
 
     # create output payload
     output_payload = _create_in_payload(input_payload)
 
-    # check for requested checksum
-    # and download
-    if _checksum_exists(
-            input_payload,
-            leaf_checksum):
+    # plan the downloads and their file metadata
+    # as (s3 object, checksum, file path) tuples
+    # and any further fetches as (s3 object, checksum) tuples
+    downloads = []
+    fetches = []
+    for leaf_name in leaf_names:
+        (leaf_certificate_file_name,
+         leaf_private_key_file_name) = \
+            _get_leaf_keypair_file_names(leaf_name)
         if _should_download_certificate(input_payload):
-            # download file
-            _download_s3_object_to_path(
-                leaf_certificate,
-                leaf_certificate_checksum,
-                leaf_certificate_file_path)
-            # create file metadata
-            leaf_certificate_file_metadata = _create_file_metadata(
-                "leaf_certificate",
-                leaf_certificate_file_name,
-                leaf_certificate_checksum)
-            # update payload with file metadata
+            downloads.append((
+                s3_objects[leaf_certificate_file_name],
+                checksums[leaf_certificate_file_name],
+                _get_repository_file_path(
+                    repository_dir,
+                    leaf_certificate_file_name)))
             _update_payload_with_metadata(
                 output_payload,
-                leaf_certificate_file_metadata)
+                _create_file_metadata(
+                    _get_leaf_file_description(
+                        input_payload,
+                        leaf_name,
+                        'certificate'),
+                    leaf_certificate_file_name,
+                    checksums[leaf_certificate_file_name]))
         if _should_download_private_key(input_payload):
-            # download file
-            _download_s3_object_to_path(
-                leaf_private_key,
-                leaf_private_key_checksum,
-                leaf_private_key_file_path)
-            # create file metadata
-            leaf_private_key_file_metadata = _create_file_metadata(
-                "leaf_private_key",
-                leaf_private_key_file_name,
-                leaf_private_key_checksum)
-            # update payload with file metadata
+            downloads.append((
+                s3_objects[leaf_private_key_file_name],
+                checksums[leaf_private_key_file_name],
+                _get_repository_file_path(
+                    repository_dir,
+                    leaf_private_key_file_name)))
             _update_payload_with_metadata(
                 output_payload,
-                leaf_private_key_file_metadata)
-        if _should_download_root_ca_certificate(input_payload):
-            # create root ca certificate s3 object
-            root_ca_certificate = \
-                _get_s3_object(
-                    input_payload,
-                    s3_resource,
-                    ROOT_CA_CERTIFICATE_FILE_NAME)
-
-            # get remote root ca certificate checksum
-            root_ca_certificate_checksum = \
-                _get_s3_object_checksum(root_ca_certificate)
-
-            log('root ca certificate checksum: '
-                f"{root_ca_certificate_checksum}")
-
-            # get the ca destination dir
-            if _should_save_to_ca_subdir(input_payload):
-                ca_destination_dir = _get_repository_ca_subdir(repository_dir)
-                if not os.path.exists(ca_destination_dir):
-                    os.makedirs(ca_destination_dir)
-            else:
-                ca_destination_dir = repository_dir
-
-            # get root ca certificate file path
-            root_ca_certificate_file_path = \
-                _get_repository_file_path(
-                    ca_destination_dir,
-                    ROOT_CA_CERTIFICATE_FILE_NAME)
-
-            # download root ca certificate
-            _download_s3_object_to_path(
-                root_ca_certificate,
-                root_ca_certificate_checksum,
-                root_ca_certificate_file_path)
-            # create root ca certificate file metadata
-            root_ca_certificate_file_metadata = _create_file_metadata(
+                _create_file_metadata(
+                    _get_leaf_file_description(
+                        input_payload,
+                        leaf_name,
+                        'private_key'),
+                    leaf_private_key_file_name,
+                    checksums[leaf_private_key_file_name]))
+    if _should_download_root_ca_certificate(input_payload):
+        root_ca_certificate_checksum = \
+            checksums[ROOT_CA_CERTIFICATE_FILE_NAME]
+
+        log('root ca certificate checksum: '
+            f"{root_ca_certificate_checksum}")
+
+        downloads.append((
+            s3_objects[ROOT_CA_CERTIFICATE_FILE_NAME],
+            root_ca_certificate_checksum,
+            _get_repository_file_path(
+                ca_destination_dir,
+                ROOT_CA_CERTIFICATE_FILE_NAME)))
+        _update_payload_with_metadata(
+            output_payload,
+            _create_file_metadata(
                 "root_ca_certificate",
                 ROOT_CA_CERTIFICATE_FILE_NAME,
-                root_ca_certificate_checksum)
-            # update payload with root ca certificate file metadata
-            _update_payload_with_metadata(
-                output_payload,
-                root_ca_certificate_file_metadata)
-        if _should_download_intermediate_ca_certificate(input_payload):
-            # create intermediate ca certificate s3 object
-            intermediate_ca_certificate = \
-                _get_s3_object(
-                    input_payload,
-                    s3_resource,
-                    INTERMEDIATE_CA_CERTIFICATE_FILE_NAME)
+                root_ca_certificate_checksum))
+    if _should_download_intermediate_ca_certificate(input_payload):
+        intermediate_ca_certificate_checksum = \
+            checksums[INTERMEDIATE_CA_CERTIFICATE_FILE_NAME]
 
-            # get remote intermediate ca certificate checksum
-            intermediate_ca_certificate_checksum = \
-                _get_s3_object_checksum(intermediate_ca_certificate)
+        log('intermediate ca certificate checksum: '
+            f"{intermediate_ca_certificate_checksum}")
 
-            log('intermediate ca certificate checksum: '
-                f"{intermediate_ca_certificate_checksum}")
-
-            # get the ca destination dir
-            if _should_save_to_ca_subdir(input_payload):
-                ca_destination_dir = _get_repository_ca_subdir(repository_dir)
-                if not os.path.exists(ca_destination_dir):
-                    os.makedirs(ca_destination_dir)
-            else:
-                ca_destination_dir = repository_dir
-
-            # get intermediate ca certificate file path
-            intermediate_ca_certificate_file_path = \
-                _get_repository_file_path(
-                    ca_destination_dir,
-                    INTERMEDIATE_CA_CERTIFICATE_FILE_NAME)
-
-            # download intermediate ca certificate
-            _download_s3_object_to_path(
-                intermediate_ca_certificate,
-                intermediate_ca_certificate_checksum,
-                intermediate_ca_certificate_file_path)
-            # create intermediate ca certificate file metadata
-            intermediate_ca_certificate_file_metadata = _create_file_metadata(
+        downloads.append((
+            s3_objects[INTERMEDIATE_CA_CERTIFICATE_FILE_NAME],
+            intermediate_ca_certificate_checksum,
+            _get_repository_file_path(
+                ca_destination_dir,
+                INTERMEDIATE_CA_CERTIFICATE_FILE_NAME)))
+        _update_payload_with_metadata(
+            output_payload,
+            _create_file_metadata(
                 "intermediate_ca_certificate",
                 INTERMEDIATE_CA_CERTIFICATE_FILE_NAME,
-                intermediate_ca_certificate_checksum)
-            # update payload with intermediate ca certificate file metadata
+                intermediate_ca_certificate_checksum))
+    if _should_save_ca_certificate_chain(input_payload):
+        # plan the chain sources, which share the fetches
+        # of any ca certificates that are also saved
+        fetches.append((
+            s3_objects[INTERMEDIATE_CA_CERTIFICATE_FILE_NAME],
+            checksums[INTERMEDIATE_CA_CERTIFICATE_FILE_NAME]))
+        fetches.append((
+            s3_objects[ROOT_CA_CERTIFICATE_FILE_NAME],
+            checksums[ROOT_CA_CERTIFICATE_FILE_NAME]))
+
+    # create the ca destination dir, if needed
+    if ((_should_download_root_ca_certificate(input_payload) or
+            _should_download_intermediate_ca_certificate(input_payload) or
+            _should_save_ca_certificate_chain(input_payload)) and
+            not os.path.exists(ca_destination_dir)):
+        os.makedirs(ca_destination_dir)
+
+    # fetch every planned object once, concurrently
+    _fetch_s3_objects(
+        input_payload,
+        [download[:2] for download in downloads] + fetches)
+
+    # write the planned files from the fetched contents
+    _download_s3_objects_to_paths(
+        input_payload,
+        downloads,
+        link=True)
+
+    if _should_fetch_metadata_only(input_payload):
+        # get certificate details concurrently
+        # single leaf certificate metadata was read along with its checksum
+        # in multi-leaf mode, this is a HeadObject call per leaf
+        leaf_certificate_details = _map_concurrently(
+            input_payload,
+            lambda leaf_name: _get_certificate_details(
+                input_payload,
+                s3_objects[_get_leaf_keypair_file_names(leaf_name)[0]],
+                checksums[_get_leaf_keypair_file_names(leaf_name)[0]]),
+            leaf_names)
+        for leaf_name, certificate_details in \
+                zip(leaf_names, leaf_certificate_details):
+            # update payload with certificate details metadata
             _update_payload_with_metadata(
                 output_payload,
-                intermediate_ca_certificate_file_metadata)
-        if _should_save_ca_certificate_chain(input_payload):
-            # create temp files as download scratch
-            temp_intermediate_ca_certificate_file = \
-                tempfile.NamedTemporaryFile(mode='r')
-            temp_root_ca_certificate_file = \
-                tempfile.NamedTemporaryFile(mode='r')
-
-            # create intermediate ca certificate s3 object
-            intermediate_ca_certificate = \
-                _get_s3_object(
+                _create_certificate_details_metadata(
+                    _get_leaf_file_description(
+                        input_payload,
+                        leaf_name,
+                        'certificate'),
+                    certificate_details,
+                    include_hosts=True))
+
+    if _should_save_ca_certificate_chain(input_payload):
+        # get ca certificate chain file path
+        ca_certificate_chain_file_path = \
+            _get_repository_file_path(
+                ca_destination_dir,
+                CA_CERTIFICATE_CHAIN_FILE_NAME)
+
+        # write the ca certificate chain file
+        # from the fetched ca certificates,
+        # getting its checksum as it is written
+        ca_certificate_chain_checksum = _write_file(
+            ca_certificate_chain_file_path,
+            _create_ca_certificate_chain(
+                _fetch_s3_object(
                     input_payload,
-                    s3_resource,
-                    INTERMEDIATE_CA_CERTIFICATE_FILE_NAME)
-
-            # get remote intermediate ca certificate checksum
-            intermediate_ca_certificate_checksum = \
-                _get_s3_object_checksum(intermediate_ca_certificate)
-
-            log('intermediate ca certificate checksum: '
-                f"{intermediate_ca_certificate_checksum}")
-
-            # download intermediate ca certificate
-            _download_s3_object_to_path(
-                intermediate_ca_certificate,
-                intermediate_ca_certificate_checksum,
-                temp_intermediate_ca_certificate_file.name)
-
-            # create root ca certificate s3 object
-            root_ca_certificate = \
-                _get_s3_object(
+                    s3_objects[INTERMEDIATE_CA_CERTIFICATE_FILE_NAME],
+                    checksums[INTERMEDIATE_CA_CERTIFICATE_FILE_NAME]),
+                _fetch_s3_object(
                     input_payload,
-                    s3_resource,
-                    ROOT_CA_CERTIFICATE_FILE_NAME)
-
-            # get remote root ca certificate checksum
-            root_ca_certificate_checksum = \
-                _get_s3_object_checksum(root_ca_certificate)
-
-            log('root ca certificate checksum: '
-                f"{root_ca_certificate_checksum}")
+                    s3_objects[ROOT_CA_CERTIFICATE_FILE_NAME],
+                    checksums[ROOT_CA_CERTIFICATE_FILE_NAME])))
+
+        log('ca certificate chain checksum: '
+            f"{ca_certificate_chain_checksum}")
+
+        # create ca certificate chain file metadata
+        ca_certificate_chain_file_metadata = _create_file_metadata(
+            "ca_certificate_chain",
+            CA_CERTIFICATE_CHAIN_FILE_NAME,
+            ca_certificate_chain_checksum)
+        # update payload with ca certificate chain file metadata
+        _update_payload_with_metadata(
+            output_payload,
+            ca_certificate_chain_file_metadata)
 
-            # download root ca certificate
-            _download_s3_object_to_path(
-                root_ca_certificate,
-                root_ca_certificate_checksum,
-                temp_root_ca_certificate_file.name)
-
-            # get the ca destination dir
-            if _should_save_to_ca_subdir(input_payload):
-                ca_destination_dir = _get_repository_ca_subdir(repository_dir)
-                if not os.path.exists(ca_destination_dir):
-                    os.makedirs(ca_destination_dir)
-            else:
-                ca_destination_dir = repository_dir
-
-            # get ca certificate chain file path
-            ca_certificate_chain_file_path = \
-                _get_repository_file_path(
-                    ca_destination_dir,
-                    CA_CERTIFICATE_CHAIN_FILE_NAME)
-
-            # get the contents of intermediate ca certificate
-            with open(temp_intermediate_ca_certificate_file.name, 'r') \
-                    as opened_temp_file:
-                temp_intermediate_ca_certificate_file_contents = \
-                    opened_temp_file.readlines()
-
-            # get the contents of root ca certificate
-            with open(temp_root_ca_certificate_file.name, 'r') \
-                    as opened_temp_file:
-                temp_root_ca_certificate_file_contents = \
-                    opened_temp_file.readlines()
-
-            # close the temp files
-            temp_root_ca_certificate_file.close()
-            temp_intermediate_ca_certificate_file.close()
-
-            # write the ca certificate chain file
-            with open(ca_certificate_chain_file_path, 'w') \
-                    as ca_certificate_chain_file:
-                ca_certificate_chain_file.writelines(
-                    temp_intermediate_ca_certificate_file_contents)
-                ca_certificate_chain_file.writelines(
-                    temp_root_ca_certificate_file_contents)
-
-            # get ca certificate chain local checksum
-            ca_certificate_chain_checksum = \
-                _hash_file(ca_certificate_chain_file_path)
-
-            log('ca certificate chain checksum: '
-                f"{ca_certificate_chain_checksum}")
-
-            # create ca certificate chain file metadata
-            ca_certificate_chain_file_metadata = _create_file_metadata(
-                "ca_certificate_chain",
-                CA_CERTIFICATE_CHAIN_FILE_NAME,
-                ca_certificate_chain_checksum)
-            # update payload with ca certificate chain file metadata
-            _update_payload_with_metadata(
-                output_payload,
-                ca_certificate_chain_file_metadata)
-    else:
-        # cannot continue if checksum is unavailable
-        raise ValueError('requested checksum is unavailable')
+    # add timings metadata, if requested
+    if _should_add_timings_metadata(input_payload):
+        _update_payload_with_metadata(
+            output_payload,
+            _create_timings_metadata())
 
     # write output
     _write_payload(output_payload)
@@ -1679,9 +4642,14 @@ def leaf_in() -> None:
 # leaf_out
 # =============================================================================
 def leaf_out() -> None:
+    import lib.cfssl
+    import lib.signer
+    import lib.x509
+
     # read input
     input_payload = _read_payload()
-    repository_dir = _get_repository_dir_path()
+    workspace_dir = _get_workspace_dir_path()
+    pki_engine = _get_pki_engine(input_payload)
 
     # create intermediate ca s3 objects
     boto3_session = _get_boto3_session(input_payload)
@@ -1697,56 +4665,95 @@ def leaf_out() -> None:
             s3_resource,
             INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
 
-    # get intermediate ca remote checksums
-    intermediate_ca_certificate_checksum = \
-        _get_s3_object_checksum(intermediate_ca_certificate)
-    intermediate_ca_private_key_checksum = \
-        _get_s3_object_checksum(intermediate_ca_private_key)
+    # refill the key pool, leaving the keypair as it is
+    if _action_is_refill_key_pool(input_payload):
+        key_pool_key_request = \
+            lib.cfssl.create_leaf_signing_request(input_payload)['key']
+        # read the version first, so a failure leaves the pool as it is
+        # in multi-leaf mode, the version covers every matching leaf
+        if _is_multi_leaf(input_payload):
+            key_pool_version = _create_multi_leaf_version(
+                _get_multi_leaf_checksums(input_payload, s3_resource))
+        else:
+            key_pool_version = _create_key_pool_version(
+                _get_current_keypair_checksum(
+                    input_payload,
+                    s3_resource,
+                    _get_leaf_name(input_payload),
+                    'leaf'),
+                key_pool_key_request)
+        (key_pool_generated_key_count,
+         key_pool_key_count) = _refill_key_pool(
+            input_payload,
+            s3_resource,
+            pki_engine,
+            key_pool_key_request)
+        _write_payload(_create_key_pool_out_payload(
+            input_payload,
+            key_pool_version,
+            key_pool_generated_key_count,
+            key_pool_key_count))
+        return
+
+    # the intermediate ca keypair is only needed to sign locally,
+    # a remote signer holds its own
+    if not _should_use_signer(input_payload):
+        # get intermediate ca remote checksums
+        (intermediate_ca_certificate_checksum,
+         intermediate_ca_private_key_checksum) = \
+            _get_s3_object_checksums(
+                input_payload,
+                intermediate_ca_certificate,
+                intermediate_ca_private_key)
 
-    log('intermediate ca certificate checksum: '
-        f"{intermediate_ca_certificate_checksum}")
-    log('intermediate ca private key checksum: '
-        f"{intermediate_ca_private_key_checksum}")
+        log('intermediate ca certificate checksum: '
+            f"{intermediate_ca_certificate_checksum}")
+        log('intermediate ca private key checksum: '
+            f"{intermediate_ca_private_key_checksum}")
 
-    # get intermediate ca remote checksum
-    intermediate_ca_checksum = \
-        _get_keypair_checksum(
-            intermediate_ca_certificate_checksum,
-            intermediate_ca_private_key_checksum)
+        # get intermediate ca remote checksum
+        intermediate_ca_checksum = \
+            _get_keypair_checksum(
+                intermediate_ca_certificate_checksum,
+                intermediate_ca_private_key_checksum)
 
-    log(f"intermediate ca checksum: {intermediate_ca_checksum}")
+        log(f"intermediate ca checksum: {intermediate_ca_checksum}")
 
-    # get intermediate ca file paths
-    intermediate_ca_certificate_file_path = \
-        _get_repository_file_path(
-            repository_dir,
-            INTERMEDIATE_CA_CERTIFICATE_FILE_NAME)
-    intermediate_ca_private_key_file_path = \
-        _get_repository_file_path(
-            repository_dir,
-            INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
+        # get intermediate ca file paths
+        intermediate_ca_certificate_file_path = \
+            _get_repository_file_path(
+                workspace_dir,
+                INTERMEDIATE_CA_CERTIFICATE_FILE_NAME)
+        intermediate_ca_private_key_file_path = \
+            _get_repository_file_path(
+                workspace_dir,
+                INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
 
-    # download intermediate ca keypair
-    _download_s3_object_to_path(
-        intermediate_ca_certificate,
-        intermediate_ca_certificate_checksum,
-        intermediate_ca_certificate_file_path)
-    _download_s3_object_to_path(
-        intermediate_ca_private_key,
-        intermediate_ca_private_key_checksum,
-        intermediate_ca_private_key_file_path)
+        # download intermediate ca keypair
+        _download_s3_object_to_path(
+            input_payload,
+            intermediate_ca_certificate,
+            intermediate_ca_certificate_checksum,
+            intermediate_ca_certificate_file_path)
+        _download_s3_object_to_path(
+            input_payload,
+            intermediate_ca_private_key,
+            intermediate_ca_private_key_checksum,
+            intermediate_ca_private_key_file_path)
 
     # get leaf file paths
-    leaf_file_prefix = input_payload['source']['leaf_name']
-    leaf_certificate_file_name = f"{leaf_file_prefix}.pem"
+    leaf_file_prefix = _get_leaf_name(input_payload)
+    leaf_certificate_file_name = \
+        f"{leaf_file_prefix}{CERTIFICATE_FILE_SUFFIX}"
     leaf_certificate_file_path = \
         _get_repository_file_path(
-            repository_dir,
+            workspace_dir,
             leaf_certificate_file_name)
-    leaf_private_key_file_name = f"{leaf_file_prefix}-key.pem"
+    leaf_private_key_file_name = \
+        f"{leaf_file_prefix}{PRIVATE_KEY_FILE_SUFFIX}"
     leaf_private_key_file_path = \
         _get_repository_file_path(
-            repository_dir,
+            workspace_dir,
             leaf_private_key_file_name)
 
     # create leaf s3 objects
@@ -1760,6 +4767,11 @@ def leaf_out() -> None:
             input_payload,
             s3_resource,
             leaf_private_key_file_name)
+    leaf_manifest = \
+        _get_s3_object(
+            input_payload,
+            s3_resource,
+            _get_manifest_file_name(leaf_file_prefix))
 
     # check if keypair can be overwritten
     if not _should_overwrite_keypair(
@@ -1770,19 +4782,42 @@ def leaf_out() -> None:
 
     # check action
     if _action_is_create(input_payload):
-        # create leaf key pair
-        lib.cfssl.create_leaf(
-            input_payload,
-            repository_dir,
-            leaf_file_prefix,
-            INTERMEDIATE_CA_CERTIFICATE_FILE_NAME,
-            INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME)
+        # claim a pre-generated private key, if there is a key pool
+        leaf_pooled_private_key = None
+        if _should_use_key_pool(input_payload):
+            leaf_pooled_private_key = _claim_pooled_private_key(
+                input_payload,
+                boto3_session,
+                s3_resource,
+                lib.cfssl.create_leaf_signing_request(input_payload)['key'])
+        if _should_use_signer(input_payload):
+            # create leaf key in memory,
+            # and have the remote signer sign it
+            leaf_keypair = pki_engine.create_leaf_key(
+                input_payload,
+                workspace_dir,
+                leaf_pooled_private_key)
+            leaf_keypair['cert'] = lib.signer.sign(
+                input_payload['source']['signer'],
+                leaf_keypair['csr'],
+                LEAF_SIGNER_PROFILE,
+                _get_leaf_hosts(input_payload))
+        else:
+            # create leaf key pair in memory
+            leaf_keypair = pki_engine.create_leaf(
+                input_payload,
+                workspace_dir,
+                INTERMEDIATE_CA_CERTIFICATE_FILE_NAME,
+                INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME,
+                leaf_pooled_private_key)
     elif _action_is_renew(input_payload):
         # get remote checksums
-        leaf_certificate_initial_checksum = \
-            _get_s3_object_checksum(leaf_certificate)
-        leaf_private_key_initial_checksum = \
-            _get_s3_object_checksum(leaf_private_key)
+        (leaf_certificate_initial_checksum,
+         leaf_private_key_initial_checksum) = \
+            _get_s3_object_checksums(
+                input_payload,
+                leaf_certificate,
+                leaf_private_key)
 
         log('initial leaf certificate checksum: '
             f"{leaf_certificate_initial_checksum}")
@@ -1791,10 +4826,12 @@ def leaf_out() -> None:
 
         # download leaf keypair
         _download_s3_object_to_path(
+            input_payload,
             leaf_certificate,
             leaf_certificate_initial_checksum,
             leaf_certificate_file_path)
         _download_s3_object_to_path(
+            input_payload,
             leaf_private_key,
             leaf_private_key_initial_checksum,
             leaf_private_key_file_path)
@@ -1802,8 +4839,11 @@ def leaf_out() -> None:
         # get current leaf certificate
         # issue and expiration dates from certificate info
         leaf_certificate_initial_info = \
-            lib.cfssl.get_certificate_info(
-                leaf_certificate_file_path)
+            lib.x509.get_certificate_info(
+                _fetch_s3_object(
+                    input_payload,
+                    leaf_certificate,
+                    leaf_certificate_initial_checksum))
         leaf_certificate_initial_issue_date = \
             lib.cfssl.get_certificate_issue_date(
                 leaf_certificate_initial_info)
@@ -1824,23 +4864,56 @@ def leaf_out() -> None:
         log('initial leaf certificate time until expiration: '
             f"{leaf_certificate_initial_time_until_expiration}")
 
-        # renew certificate
-        lib.cfssl.renew_leaf_certificate(
+        # get the signing request stored by the last out,
+        # unless the private key or subject has changed since
+        leaf_stored_signing_request = \
+            _get_stored_certificate_request(
+                input_payload,
+                leaf_manifest,
+                leaf_certificate_initial_checksum,
+                leaf_private_key_initial_checksum,
+                leaf_certificate_initial_info)
+
+        # renew certificate in memory,
+        # keeping the private key
+        if _should_use_signer(input_payload):
+            # the hosts param replaces the current hosts, if present
+            leaf_signing_request = \
+                leaf_stored_signing_request or \
+                pki_engine.create_renewal_signing_request(
+                    workspace_dir,
+                    leaf_certificate_file_name,
+                    leaf_private_key_file_name)
+            leaf_keypair = {
+                'cert': lib.signer.sign(
+                    input_payload['source']['signer'],
+                    leaf_signing_request,
+                    LEAF_SIGNER_PROFILE,
+                    _get_leaf_hosts(input_payload)),
+                'csr': leaf_signing_request
+            }
+        else:
+            leaf_keypair = pki_engine.renew_leaf_certificate(
+                input_payload,
+                workspace_dir,
+                INTERMEDIATE_CA_CERTIFICATE_FILE_NAME,
+                INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME,
+                leaf_certificate_file_name,
+                leaf_private_key_file_name,
+                leaf_stored_signing_request)
+        leaf_keypair['key'] = _fetch_s3_object(
             input_payload,
-            repository_dir,
-            leaf_file_prefix,
-            INTERMEDIATE_CA_CERTIFICATE_FILE_NAME,
-            INTERMEDIATE_CA_PRIVATE_KEY_FILE_NAME,
-            leaf_certificate_file_name,
-            leaf_private_key_file_name)
+            leaf_private_key,
+            leaf_private_key_initial_checksum)
     else:
-        raise ValueError("action must be 'create' or 'renew'")
+        raise ValueError("action must be 'create', 'renew',"
+                         " or 'refill_key_pool'")
 
     # get leaf local checksums
     leaf_certificate_checksum = \
-        _hash_file(leaf_certificate_file_path)
+        _hash_bytes(leaf_keypair['cert'])
     leaf_private_key_checksum = \
-        _hash_file(leaf_private_key_file_path)
+        _hash_bytes(leaf_keypair['key'])
 
     log('leaf certificate checksum: '
         f"{leaf_certificate_checksum}")
@@ -1857,8 +4930,8 @@ def leaf_out() -> None:
 
     # get certificate info
     leaf_certificate_info = \
-        lib.cfssl.get_certificate_info(
-            leaf_certificate_file_path)
+        lib.x509.get_certificate_info(
+            leaf_keypair['cert'])
 
     # get common name and hosts from certificate info
     leaf_certificate_common_name = \
@@ -1894,23 +4967,60 @@ def leaf_out() -> None:
     log('leaf certificate time until expiration: '
         f"{leaf_certificate_time_until_expiration}")
 
-    # upload certificate
-    _upload_s3_object_to_path(
-        leaf_certificate,
-        leaf_certificate_checksum,
-        leaf_certificate_file_path)
-
-    # upload private key
-    _upload_s3_object_to_path(
-        leaf_private_key,
-        leaf_private_key_checksum,
-        leaf_private_key_file_path)
+    # upload certificate and private key concurrently
+    # check reads the keypair manifest, which is only uploaded
+    # once both are in place, so a version never pairs
+    # a new certificate with an old private key
+    # if either upload fails, the manifest would still describe
+    # the previous keypair, so it is removed
+    try:
+        (leaf_certificate_upload,
+         leaf_private_key_upload) = _upload_s3_objects(
+            input_payload,
+            [(leaf_certificate,
+              leaf_certificate_checksum,
+              leaf_keypair['cert'],
+              _create_certificate_s3_metadata(
+                  leaf_certificate_info)),
+             (leaf_private_key,
+              leaf_private_key_checksum,
+              leaf_keypair['key'])])
+
+        # upload keypair manifest last
+        leaf_manifest_upload = _upload_keypair_manifest(
+            input_payload,
+            leaf_manifest,
+            _create_keypair_manifest(
+                leaf_certificate_checksum,
+                leaf_private_key_checksum,
+                leaf_certificate_info,
+                leaf_certificate_upload,
+                leaf_private_key_upload,
+                leaf_keypair.get('csr')))
+    except Exception:
+        _remove_keypair_manifest(input_payload, leaf_manifest)
+        raise
 
     # create output payload
     output_payload = _create_out_payload(
         input_payload,
         leaf_checksum)
 
+    # with version history, the version pins the uploaded versions
+    if (_should_check_version_history(input_payload) and
+            leaf_certificate_upload.get('VersionId') and
+            leaf_private_key_upload.get('VersionId')):
+        output_payload['version'] = _create_keypair_version(
+            leaf_checksum,
+            leaf_certificate_upload['VersionId'],
+            leaf_private_key_upload['VersionId'],
+            leaf_manifest_upload.get('VersionId'))
+
+    # in multi-leaf mode, the version covers every matching leaf
+    if _is_multi_leaf(input_payload):
+        output_payload['version'] = _create_multi_leaf_version(
+            _get_multi_leaf_checksums(input_payload, s3_resource))
+
     # create certificate file metadata
     leaf_certificate_file_metadata = _create_file_metadata(
         "leaf_certificate",
@@ -1961,5 +5071,11 @@ def leaf_out() -> None:
         output_payload,
         leaf_certificate_expiration_metadata)
 
+    # add timings metadata, if requested
+    if _should_add_timings_metadata(input_payload):
+        _update_payload_with_metadata(
+            output_payload,
+            _create_timings_metadata())
+
     # write output
     _write_payload(output_payload)
@@ -0,0 +1,39 @@
+# stdlib
+import re
+from datetime import timedelta
+from typing import Any, Dict
+
+
+# =============================================================================
+#
+# constants
+#
+# =============================================================================
+
+# go duration units, as used by cfssl expiry
+DURATION_UNIT_SECONDS: Dict[str, int] = {'h': 3600, 'm': 60, 's': 1}
+
+
+# =============================================================================
+#
+# public functions
+#
+# =============================================================================
+
+# =============================================================================
+# parse_duration
+# =============================================================================
+def parse_duration(duration: Any) -> timedelta:
+    '''parses a duration in seconds, or in the form understood
+    by go's time package (e.g. 720h or 1h30m), limited to hours,
+    minutes and seconds
+    '''
+    if isinstance(duration, (int, float)):
+        return timedelta(seconds=duration)
+    parts = re.findall(r'(\d+(?:\.\d+)?)([hms])', duration)
+    if not parts or ''.join(
+            number + unit for number, unit in parts) != duration:
+        raise ValueError(f"invalid duration '{duration}'")
+    return timedelta(seconds=sum(
+        float(number) * DURATION_UNIT_SECONDS[unit]
+        for number, unit in parts))
@@ -0,0 +1,799 @@
+# stdlib
+import ipaddress
+import os
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+# local
+import lib.cfssl
+import lib.duration
+import lib.trace
+import lib.x509
+from lib.log import log
+
+# the cryptography package is only imported when this engine is used
+# see _import_cryptography
+if TYPE_CHECKING:
+    from cryptography import x509
+
+
+# =============================================================================
+#
+# constants
+#
+# =============================================================================
+
+# cfssl backdates the validity of every certificate it signs
+CERTIFICATE_BACKDATE: timedelta = timedelta(minutes=5)
+
+# the key sizes cfssl accepts
+RSA_MIN_KEY_SIZE: int = 2048
+RSA_MAX_KEY_SIZE: int = 8192
+ECDSA_KEY_SIZES: List[int] = [256, 384, 521]
+
+# the usages of a ca created with cfssl gencert -initca
+ROOT_CA_USAGES: List[str] = ['cert sign', 'crl sign']
+
+# cfssl signing config usages, by cryptography KeyUsage argument
+KEY_USAGE_NAMES: Dict[str, str] = {
+    'signing': 'digital_signature',
+    'digital signature': 'digital_signature',
+    'content commitment': 'content_commitment',
+    'key encipherment': 'key_encipherment',
+    'key agreement': 'key_agreement',
+    'data encipherment': 'data_encipherment',
+    'cert sign': 'key_cert_sign',
+    'crl sign': 'crl_sign',
+    'encipher only': 'encipher_only',
+    'decipher only': 'decipher_only'
+}
+
+# cfssl signing config usages, by extended key usage oid
+EXTENDED_KEY_USAGE_OIDS: Dict[str, str] = {
+    'any': '2.5.29.37.0',
+    'server auth': '1.3.6.1.5.5.7.3.1',
+    'client auth': '1.3.6.1.5.5.7.3.2',
+    'code signing': '1.3.6.1.5.5.7.3.3',
+    'email protection': '1.3.6.1.5.5.7.3.4',
+    's/mime': '1.3.6.1.5.5.7.3.4',
+    'ipsec end system': '1.3.6.1.5.5.7.3.5',
+    'ipsec tunnel': '1.3.6.1.5.5.7.3.6',
+    'ipsec user': '1.3.6.1.5.5.7.3.7',
+    'timestamping': '1.3.6.1.5.5.7.3.8',
+    'ocsp signing': '1.3.6.1.5.5.7.3.9',
+    'microsoft sgc': '1.3.6.1.4.1.311.10.3.3',
+    'netscape sgc': '2.16.840.1.113730.4.1'
+}
+
+# signing request names, by name attribute oid,
+# in the order cfssl writes them
+NAME_ATTRIBUTE_OIDS: Dict[str, str] = {
+    'C': '2.5.4.6',
+    'ST': '2.5.4.8',
+    'L': '2.5.4.7',
+    'O': '2.5.4.10',
+    'OU': '2.5.4.11'
+}
+COMMON_NAME_OID: str = '2.5.4.3'
+
+
+# =============================================================================
+#
+# private functions
+#
+# =============================================================================
+
+# =============================================================================
+# _import_cryptography
+# =============================================================================
+def _import_cryptography():
+    # cryptography is pinned in requirements.txt, and only imported
+    # on first use so scripts which never sign do not load it at startup
+    import cryptography.x509
+    import cryptography.hazmat.primitives.asymmetric.ec
+    import cryptography.hazmat.primitives.asymmetric.rsa
+    import cryptography.hazmat.primitives.hashes
+    import cryptography.hazmat.primitives.serialization
+    return cryptography
+
+
+# =============================================================================
+# _generate_private_key
+# =============================================================================
+def _generate_private_key(key_request: dict):
+    cryptography = _import_cryptography()
+    asymmetric = cryptography.hazmat.primitives.asymmetric
+    algorithm = key_request.get('algo')
+    size = key_request.get('size')
+    if algorithm == 'rsa':
+        if not RSA_MIN_KEY_SIZE <= size <= RSA_MAX_KEY_SIZE:
+            raise ValueError(f"invalid rsa key size {size}")
+        with lib.trace.span('native.genkey', algo=algorithm, size=size):
+            return asymmetric.rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=size)
+    if algorithm == 'ecdsa':
+        curves = {
+            256: asymmetric.ec.SECP256R1,
+            384: asymmetric.ec.SECP384R1,
+            521: asymmetric.ec.SECP521R1
+        }
+        if size not in curves:
+            raise ValueError(f"invalid ecdsa key size {size}")
+        with lib.trace.span('native.genkey', algo=algorithm, size=size):
+            return asymmetric.ec.generate_private_key(curves[size]())
+    raise ValueError(f"invalid key algorithm '{algorithm}'")
+
+
+# =============================================================================
+# _generate_private_key_pem
+# =============================================================================
+def _generate_private_key_pem(key_request: dict) -> bytes:
+    # module level, so it can run in a worker process
+    return _encode_private_key(_generate_private_key(key_request))
+
+
+# =============================================================================
+# _encode_private_key
+# =============================================================================
+def _encode_private_key(private_key) -> bytes:
+    # the traditional format, as written by cfssl
+    serialization = \
+        _import_cryptography().hazmat.primitives.serialization
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.TraditionalOpenSSL,
+        serialization.NoEncryption())
+
+
+# =============================================================================
+# _read_private_key
+# =============================================================================
+def _read_private_key(private_key_file_path: str):
+    with open(private_key_file_path, 'rb') as private_key_file:
+        return _load_private_key(private_key_file.read())
+
+
+# =============================================================================
+# _load_private_key
+# =============================================================================
+def _load_private_key(private_key: bytes):
+    serialization = \
+        _import_cryptography().hazmat.primitives.serialization
+    return serialization.load_pem_private_key(
+        private_key,
+        password=None)
+
+
+# =============================================================================
+# _get_private_key
+# =============================================================================
+def _get_private_key(
+        key_request: dict,
+        private_key: Optional[bytes]) -> tuple:
+    # loads the given pem private key, or generates one
+    # returns the key and its pem encoding
+    if private_key is not None:
+        return _load_private_key(private_key), private_key
+    generated_private_key = _generate_private_key(key_request)
+    return (generated_private_key,
+            _encode_private_key(generated_private_key))
+
+
+# =============================================================================
+# _read_certificate
+# =============================================================================
+def _read_certificate(certificate_file_path: str) -> 'x509.Certificate':
+    cryptography = _import_cryptography()
+    with open(certificate_file_path, 'rb') as certificate_file:
+        return cryptography.x509.load_pem_x509_certificate(
+            certificate_file.read())
+
+
+# =============================================================================
+# _get_signature_hash
+# =============================================================================
+def _get_signature_hash(private_key):
+    # the hash cfssl signs with, which depends on the key
+    cryptography = _import_cryptography()
+    hashes = cryptography.hazmat.primitives.hashes
+    if isinstance(private_key,
+                  cryptography.hazmat.primitives.asymmetric.ec
+                  .EllipticCurvePrivateKey):
+        key_size = private_key.curve.key_size
+        if key_size >= 521:
+            return hashes.SHA512()
+        if key_size >= 384:
+            return hashes.SHA384()
+        return hashes.SHA256()
+    if private_key.key_size >= 4096:
+        return hashes.SHA512()
+    if private_key.key_size >= 3072:
+        return hashes.SHA384()
+    return hashes.SHA256()
+
+
+# =============================================================================
+# _create_name
+# =============================================================================
+def _create_name(
+        signing_request: dict,
+        common_name: Optional[str]) -> 'x509.Name':
+    cryptography = _import_cryptography()
+    attributes = []
+    for names in signing_request.get('names', []):
+        for name_key, oid in NAME_ATTRIBUTE_OIDS.items():
+            if names.get(name_key):
+                attributes.append(cryptography.x509.NameAttribute(
+                    cryptography.x509.ObjectIdentifier(oid),
+                    names[name_key]))
+    if common_name:
+        attributes.append(cryptography.x509.NameAttribute(
+            cryptography.x509.ObjectIdentifier(COMMON_NAME_OID),
+            common_name))
+    return cryptography.x509.Name(attributes)
+
+
+# =============================================================================
+# _create_general_names
+# =============================================================================
+def _create_general_names(hosts: List[str]) -> list:
+    # hosts are sorted into ip addresses, email addresses,
+    # uris, and dns names, like cfssl does
+    cryptography = _import_cryptography()
+    general_names = []
+    for host in hosts:
+        try:
+            general_names.append(cryptography.x509.IPAddress(
+                ipaddress.ip_address(host)))
+            continue
+        except ValueError:
+            pass
+        if '@' in host:
+            general_names.append(cryptography.x509.RFC822Name(host))
+        elif '://' in host:
+            general_names.append(
+                cryptography.x509.UniformResourceIdentifier(host))
+        else:
+            general_names.append(cryptography.x509.DNSName(host))
+    return general_names
+
+
+# =============================================================================
+# _get_certificate_hosts
+# =============================================================================
+def _get_certificate_hosts(certificate) -> List[str]:
+    # every subject alternative name, as cfssl gencsr -cert extracts them
+    cryptography = _import_cryptography()
+    try:
+        subject_alternative_name = certificate.extensions \
+            .get_extension_for_class(
+                cryptography.x509.SubjectAlternativeName).value
+    except cryptography.x509.ExtensionNotFound:
+        return []
+    return [
+        str(general_name.value)
+        for general_name in subject_alternative_name
+    ]
+
+
+# =============================================================================
+# _create_signing_request
+# =============================================================================
+def _create_signing_request(
+        private_key,
+        subject: 'x509.Name',
+        hosts: List[str]) -> bytes:
+    cryptography = _import_cryptography()
+    builder = cryptography.x509.CertificateSigningRequestBuilder() \
+        .subject_name(subject)
+    if hosts:
+        builder = builder.add_extension(
+            cryptography.x509.SubjectAlternativeName(
+                _create_general_names(hosts)),
+            critical=False)
+    return builder.sign(private_key, _get_signature_hash(private_key)) \
+        .public_bytes(
+            cryptography.hazmat.primitives.serialization.Encoding.PEM)
+
+
+# =============================================================================
+# _create_key_usage
+# =============================================================================
+def _create_key_usage(usages: List[str]) -> 'x509.KeyUsage':
+    cryptography = _import_cryptography()
+    key_usages = {
+        argument_name: False
+        for argument_name in KEY_USAGE_NAMES.values()
+    }
+    for usage in usages:
+        if usage in KEY_USAGE_NAMES:
+            key_usages[KEY_USAGE_NAMES[usage]] = True
+    # encipher and decipher only are only defined with key agreement
+    if not key_usages['key_agreement']:
+        key_usages['encipher_only'] = False
+        key_usages['decipher_only'] = False
+    return cryptography.x509.KeyUsage(**key_usages)
+
+
+# =============================================================================
+# _sign_certificate
+# =============================================================================
+def _sign_certificate(
+        subject: 'x509.Name',
+        public_key,
+        hosts: List[str],
+        profile: dict,
+        issuer_private_key,
+        issuer_certificate: Optional['x509.Certificate'] = None) -> bytes:
+    '''signs a certificate the way cfssl does with a signing profile
+
+    i.e. with the profile's expiry, usages, and ca constraint,
+    backdated by 5 minutes, with a random serial number, and with
+    subject and authority key ids
+
+    the certificate is self-signed when there is no issuer certificate
+    '''
+    cryptography = _import_cryptography()
+    x509 = cryptography.x509
+
+    # unknown usages are rejected, like cfssl does
+    unknown_usages = [
+        usage for usage in profile['usages']
+        if usage not in KEY_USAGE_NAMES and
+        usage not in EXTENDED_KEY_USAGE_OIDS
+    ]
+    if unknown_usages:
+        raise ValueError(f"invalid usages {unknown_usages}")
+
+    not_before = datetime.now(timezone.utc).replace(
+        second=0,
+        microsecond=0) - CERTIFICATE_BACKDATE
+    not_after = not_before + lib.duration.parse_duration(
+        profile['expiry'])
+
+    # max path len is only set when positive, or explicitly zero
+    ca_constraint = profile.get('ca_constraint', {})
+    is_ca = ca_constraint.get('is_ca', False) is True
+    path_length = ca_constraint.get('max_path_len', 0)
+    if path_length <= 0 and not (
+            path_length == 0 and
+            ca_constraint.get('max_path_len_zero', False) is True):
+        path_length = None
+
+    if issuer_certificate is None:
+        issuer_name = subject
+        issuer_public_key = public_key
+    else:
+        issuer_name = issuer_certificate.subject
+        issuer_public_key = issuer_certificate.public_key()
+
+    builder = x509.CertificateBuilder() \
+        .subject_name(subject) \
+        .issuer_name(issuer_name) \
+        .public_key(public_key) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(not_before) \
+        .not_valid_after(not_after) \
+        .add_extension(
+            x509.BasicConstraints(
+                ca=is_ca,
+                path_length=path_length if is_ca else None),
+            critical=True) \
+        .add_extension(
+            _create_key_usage(profile['usages']),
+            critical=True) \
+        .add_extension(
+            x509.SubjectKeyIdentifier.from_public_key(public_key),
+            critical=False)
+    extended_key_usages = [
+        x509.ObjectIdentifier(EXTENDED_KEY_USAGE_OIDS[usage])
+        for usage in profile['usages']
+        if usage in EXTENDED_KEY_USAGE_OIDS
+    ]
+    if extended_key_usages:
+        builder = builder.add_extension(
+            x509.ExtendedKeyUsage(extended_key_usages),
+            critical=False)
+    # a self-signed certificate has no authority key id
+    if issuer_certificate is not None:
+        builder = builder.add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(
+                issuer_public_key),
+            critical=False)
+    if hosts:
+        builder = builder.add_extension(
+            x509.SubjectAlternativeName(_create_general_names(hosts)),
+            critical=False)
+    with lib.trace.span('native.sign'):
+        return builder.sign(
+            issuer_private_key,
+            _get_signature_hash(issuer_private_key)).public_bytes(
+                cryptography.hazmat.primitives.serialization.Encoding.PEM)
+
+
+# =============================================================================
+# _get_hosts
+# =============================================================================
+def _get_hosts(payload: dict) -> Optional[List[str]]:
+    # the leaf hosts param, as passed to cfssl with -hostname
+    if 'leaf' in payload['params']:
+        return payload['params']['leaf'].get('hosts')
+    return None
+
+
+# =============================================================================
+#
+# public utility functions
+#
+# =============================================================================
+
+# =============================================================================
+# generate_private_keys
+# =============================================================================
+def generate_private_keys(key_requests: List[dict]) -> List[bytes]:
+    '''generates a pem encoded private key for each key request,
+    e.g. {'algo': 'rsa', 'size': 2048}
+
+    several keys are generated in parallel in a process pool,
+    as key generation is bound by the cpu
+    '''
+    if len(key_requests) < 2:
+        return [
+            _generate_private_key_pem(key_request)
+            for key_request in key_requests
+        ]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(
+            max_workers=min(len(key_requests),
+                            os.cpu_count() or 1)) as executor:
+        return list(executor.map(_generate_private_key_pem, key_requests))
+
+
+# =============================================================================
+#
+# public lifecycle functions
+#
+# the same functions as lib.cfssl, returning the same cert, key, and csr,
+# without running cfssl
+#
+# =============================================================================
+
+# =============================================================================
+# create_root_ca
+# =============================================================================
+def create_root_ca(
+        payload: dict) -> Dict[str, bytes]:
+    # create root ca signing request
+    root_ca_signing_request = \
+        lib.cfssl.create_root_ca_signing_request(payload)
+    # generate the key
+    private_key = _generate_private_key(root_ca_signing_request['key'])
+    subject = _create_name(
+        root_ca_signing_request,
+        root_ca_signing_request['CN'])
+    # self-sign the root ca, like cfssl gencert -initca
+    path_length = root_ca_signing_request['ca'].get('pathlen', 0)
+    log('signing root ca in process')
+    return {
+        'cert': _sign_certificate(
+            subject,
+            private_key.public_key(),
+            [],
+            {
+                'expiry': root_ca_signing_request['ca']['expiry'],
+                'usages': ROOT_CA_USAGES,
+                'ca_constraint': {
+                    'is_ca': True,
+                    'max_path_len': path_length,
+                    'max_path_len_zero': path_length == 0
+                }
+            },
+            private_key),
+        'key': _encode_private_key(private_key),
+        'csr': _create_signing_request(private_key, subject, [])
+    }
+
+
+# =============================================================================
+# create_intermediate_ca
+# =============================================================================
+def create_intermediate_ca(
+        payload: dict,
+        repository_dir_path: str,
+        root_ca_certificate_file_name: str,
+        root_ca_private_key_file_name: str,
+        private_key: Optional[bytes] = None) -> Dict[str, bytes]:
+    # create intermediate ca signing request and config
+    intermediate_ca_signing_request = \
+        lib.cfssl.create_intermediate_ca_signing_request(payload)
+    intermediate_ca_signing_config = \
+        lib.cfssl.create_intermediate_ca_signing_config(payload)
+    # generate the key, unless given
+    private_key, private_key_pem = _get_private_key(
+        intermediate_ca_signing_request['key'],
+        private_key)
+    subject = _create_name(
+        intermediate_ca_signing_request,
+        payload['params']['CN'])
+    # sign the intermediate ca with the root ca
+    log('signing intermediate ca in process')
+    return {
+        'cert': _sign_certificate(
+            subject,
+            private_key.public_key(),
+            [],
+            intermediate_ca_signing_config['signing']['profiles']['ca'],
+            _read_private_key(os.path.join(
+                repository_dir_path,
+                root_ca_private_key_file_name)),
+            _read_certificate(os.path.join(
+                repository_dir_path,
+                root_ca_certificate_file_name))),
+        'key': private_key_pem,
+        'csr': _create_signing_request(private_key, subject, [])
+    }
+
+
+# =============================================================================
+# create_leaf
+# =============================================================================
+def create_leaf(
+        payload: dict,
+        repository_dir_path: str,
+        intermediate_ca_certificate_file_name: str,
+        intermediate_ca_private_key_file_name: str,
+        private_key: Optional[bytes] = None) -> Dict[str, bytes]:
+    # create leaf signing request and config
+    leaf_signing_request = \
+        lib.cfssl.create_leaf_signing_request(payload)
+    leaf_signing_config = \
+        lib.cfssl.create_leaf_signing_config(payload)
+    # generate the key, unless given
+    private_key, private_key_pem = _get_private_key(
+        leaf_signing_request['key'],
+        private_key)
+    subject = _create_name(
+        leaf_signing_request,
+        payload['params']['CN'])
+    hosts = _get_hosts(payload) or []
+    # sign the leaf with the intermediate ca
+    log('signing leaf in process')
+    return {
+        'cert': _sign_certificate(
+            subject,
+            private_key.public_key(),
+            hosts,
+            leaf_signing_config['signing']['profiles']['leaf'],
+            _read_private_key(os.path.join(
+                repository_dir_path,
+                intermediate_ca_private_key_file_name)),
+            _read_certificate(os.path.join(
+                repository_dir_path,
+                intermediate_ca_certificate_file_name))),
+        'key': private_key_pem,
+        'csr': _create_signing_request(private_key, subject, hosts)
+    }
+
+
+# =============================================================================
+# create_intermediate_ca_key
+# =============================================================================
+def create_intermediate_ca_key(
+        payload: dict,
+        repository_dir_path: str,
+        private_key: Optional[bytes] = None) -> Dict[str, bytes]:
+    # create intermediate ca signing request
+    intermediate_ca_signing_request = \
+        lib.cfssl.create_intermediate_ca_signing_request(payload)
+    # generate the key, unless given, and the csr
+    private_key, private_key_pem = _get_private_key(
+        intermediate_ca_signing_request['key'],
+        private_key)
+    return {
+        'key': private_key_pem,
+        'csr': _create_signing_request(
+            private_key,
+            _create_name(
+                intermediate_ca_signing_request,
+                payload['params']['CN']),
+            [])
+    }
+
+
+# =============================================================================
+# create_leaf_key
+# =============================================================================
+def create_leaf_key(
+        payload: dict,
+        repository_dir_path: str,
+        private_key: Optional[bytes] = None) -> Dict[str, bytes]:
+    # create leaf signing request
+    leaf_signing_request = \
+        lib.cfssl.create_leaf_signing_request(payload)
+    # generate the key, unless given, and the csr
+    private_key, private_key_pem = _get_private_key(
+        leaf_signing_request['key'],
+        private_key)
+    return {
+        'key': private_key_pem,
+        'csr': _create_signing_request(
+            private_key,
+            _create_name(
+                leaf_signing_request,
+                payload['params']['CN']),
+            _get_hosts(payload) or [])
+    }
+
+
+# =============================================================================
+# create_renewal_signing_request
+# =============================================================================
+def create_renewal_signing_request(
+    repository_dir_path: str,
+    certificate_file_name: str,
+    private_key_file_name: str
+) -> bytes:
+    # create a signing request from the
+    # current certificate and private key
+    certificate = _read_certificate(
+        os.path.join(repository_dir_path,
+                     certificate_file_name))
+    return _create_signing_request(
+        _read_private_key(
+            os.path.join(repository_dir_path,
+                         private_key_file_name)),
+        certificate.subject,
+        _get_certificate_hosts(certificate))
+
+
+# =============================================================================
+# renew_root_certificate
+# =============================================================================
+def renew_root_certificate(
+    repository_dir_path: str,
+    root_ca_certificate_file_name: str,
+    root_ca_private_key_file_name: str
+) -> Dict[str, bytes]:
+    cryptography = _import_cryptography()
+    root_ca_certificate_file_path = \
+        os.path.join(repository_dir_path,
+                     root_ca_certificate_file_name)
+    certificate = _read_certificate(root_ca_certificate_file_path)
+    private_key = _read_private_key(
+        os.path.join(repository_dir_path,
+                     root_ca_private_key_file_name))
+    # keep the validity period and path length of the current certificate,
+    # like cfssl gencert -renewca
+    with open(root_ca_certificate_file_path, 'rb') as certificate_file:
+        certificate_info = lib.x509.get_certificate_info(
+            certificate_file.read())
+    validity = \
+        lib.cfssl.get_certificate_expiration_date(certificate_info) - \
+        lib.cfssl.get_certificate_issue_date(certificate_info)
+    basic_constraints = certificate.extensions.get_extension_for_class(
+        cryptography.x509.BasicConstraints).value
+    log('renewing root ca in process')
+    return {
+        'cert': _sign_certificate(
+            certificate.subject,
+            private_key.public_key(),
+            [],
+            {
+                'expiry': f"{int(validity.total_seconds())}s",
+                'usages': ROOT_CA_USAGES,
+                'ca_constraint': {
+                    'is_ca': True,
+                    'max_path_len': basic_constraints.path_length or 0,
+                    'max_path_len_zero':
+                        basic_constraints.path_length == 0
+                }
+            },
+            private_key),
+        'csr': _create_signing_request(
+            private_key,
+            certificate.subject,
+            [])
+    }
+
+
+# =============================================================================
+# renew_intermediate_certificate
+# =============================================================================
+def renew_intermediate_certificate(
+    payload: dict,
+    repository_dir_path: str,
+    root_ca_certificate_file_name: str,
+    root_ca_private_key_file_name: str,
+    intermediate_ca_certificate_file_name: str,
+    intermediate_ca_private_key_file_name: str,
+    certificate_request: Optional[bytes] = None
+) -> Dict[str, bytes]:
+    '''renews a certificate, keeping the private key
+
+    the certificate_request, when given, is returned as the csr,
+    instead of creating one from the current certificate
+    and private key
+    '''
+    # read the current certificate and private key
+    certificate = _read_certificate(
+        os.path.join(repository_dir_path,
+                     intermediate_ca_certificate_file_name))
+    private_key = _read_private_key(
+        os.path.join(repository_dir_path,
+                     intermediate_ca_private_key_file_name))
+    hosts = _get_certificate_hosts(certificate)
+    intermediate_ca_signing_config = \
+        lib.cfssl.create_intermediate_ca_signing_config(payload)
+    # sign the certificate using the root ca
+    log('renewing intermediate ca in process')
+    return {
+        'cert': _sign_certificate(
+            certificate.subject,
+            private_key.public_key(),
+            hosts,
+            intermediate_ca_signing_config['signing']['profiles']['ca'],
+            _read_private_key(os.path.join(
+                repository_dir_path,
+                root_ca_private_key_file_name)),
+            _read_certificate(os.path.join(
+                repository_dir_path,
+                root_ca_certificate_file_name))),
+        'csr': certificate_request or _create_signing_request(
+            private_key,
+            certificate.subject,
+            hosts)
+    }
+
+
+# =============================================================================
+# renew_leaf_certificate
+# =============================================================================
+def renew_leaf_certificate(
+    payload: dict,
+    repository_dir_path: str,
+    intermediate_ca_certificate_file_name: str,
+    intermediate_ca_private_key_file_name: str,
+    leaf_certificate_file_name: str,
+    leaf_private_key_file_name: str,
+    certificate_request: Optional[bytes] = None
+) -> Dict[str, bytes]:
+    '''renews a certificate, keeping the private key
+
+    the certificate_request, when given, is returned as the csr,
+    instead of creating one from the current certificate
+    and private key
+    '''
+    # read the current certificate and private key
+    certificate = _read_certificate(
+        os.path.join(repository_dir_path,
+                     leaf_certificate_file_name))
+    private_key = _read_private_key(
+        os.path.join(repository_dir_path,
+                     leaf_private_key_file_name))
+    certificate_hosts = _get_certificate_hosts(certificate)
+    leaf_signing_config = \
+        lib.cfssl.create_leaf_signing_config(payload)
+    # the hosts param replaces the current hosts, if present
+    hosts = _get_hosts(payload)
+    if hosts is None:
+        hosts = certificate_hosts
+    # sign the certificate using the intermediate ca
+    log('renewing leaf in process')
+    return {
+        'cert': _sign_certificate(
+            certificate.subject,
+            private_key.public_key(),
+            hosts,
+            leaf_signing_config['signing']['profiles']['leaf'],
+            _read_private_key(os.path.join(
+                repository_dir_path,
+                intermediate_ca_private_key_file_name)),
+            _read_certificate(os.path.join(
+                repository_dir_path,
+                intermediate_ca_certificate_file_name))),
+        'csr': certificate_request or _create_signing_request(
+            private_key,
+            certificate.subject,
+            certificate_hosts)
+    }
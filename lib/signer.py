@@ -0,0 +1,169 @@
+# stdlib
+import base64
+import hashlib
+import hmac
+import json
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+# local
+import lib.trace
+from lib.log import log
+
+# urllib3 is imported on first use, it ships with botocore
+if TYPE_CHECKING:
+    import urllib3
+
+
+# =============================================================================
+#
+# constants
+#
+# =============================================================================
+
+SIGN_ENDPOINT_PATH: str = '/api/v1/cfssl/sign'
+AUTHSIGN_ENDPOINT_PATH: str = '/api/v1/cfssl/authsign'
+SIGNER_DEFAULT_TIMEOUT: float = 30.0
+SIGNER_DEFAULT_RETRIES: int = 3
+SIGNER_RETRY_BACKOFF_FACTOR: float = 0.2
+SIGNER_MAX_POOL_CONNECTIONS: int = 1
+
+
+# =============================================================================
+#
+# private state
+#
+# =============================================================================
+
+# connection pools opened during this invocation, by timeout,
+# so every request to a signer reuses the same keep-alive connection
+# see _get_pool_manager
+_pool_manager_memo: Dict[float, 'urllib3.PoolManager'] = {}
+
+
+# =============================================================================
+#
+# private functions
+#
+# =============================================================================
+
+# =============================================================================
+# _get_pool_manager
+# =============================================================================
+def _get_pool_manager(timeout: float) -> 'urllib3.PoolManager':
+    if timeout not in _pool_manager_memo:
+        import urllib3
+        # a sign request is not idempotent, every request which reaches
+        # the signer may issue a certificate, so only failures to connect
+        # are retried, and never read errors or error statuses
+        _pool_manager_memo[timeout] = urllib3.PoolManager(
+            maxsize=SIGNER_MAX_POOL_CONNECTIONS,
+            block=True,
+            timeout=urllib3.Timeout(total=timeout),
+            retries=urllib3.Retry(
+                total=SIGNER_DEFAULT_RETRIES,
+                connect=SIGNER_DEFAULT_RETRIES,
+                read=0,
+                status=0,
+                other=0,
+                backoff_factor=SIGNER_RETRY_BACKOFF_FACTOR,
+                raise_on_status=False))
+    return _pool_manager_memo[timeout]
+
+
+# =============================================================================
+# _create_authenticated_request
+# =============================================================================
+def _create_authenticated_request(
+        sign_request: bytes,
+        auth_key: str) -> dict:
+    '''wraps a sign request the way cfssl's standard auth provider
+    expects it, i.e. with an hmac-sha256 token of the request,
+    keyed with the hex encoded auth key
+    '''
+    try:
+        key = bytes.fromhex(auth_key)
+    except ValueError:
+        raise ValueError('signer auth_key must be hex encoded')
+    token = hmac.new(key, sign_request, hashlib.sha256).digest()
+    return {
+        'token': base64.b64encode(token).decode('ascii'),
+        'request': base64.b64encode(sign_request).decode('ascii')
+    }
+
+
+# =============================================================================
+# _decode_response
+# =============================================================================
+def _decode_response(status: int, data: bytes) -> bytes:
+    # cfssl api responses carry the errors in the body,
+    # including for non-2xx statuses
+    try:
+        response = json.loads(data.decode('utf-8'))
+    except ValueError:
+        raise RuntimeError(f"signer responded with status {status}"
+                           ' and no cfssl api response')
+    if not response.get('success'):
+        messages = [
+            error.get('message', '')
+            for error in response.get('errors') or []
+        ]
+        raise RuntimeError(f"signer responded with status {status}:"
+                           f" {'; '.join(messages) or 'unknown error'}")
+    return response['result']['certificate'].encode('utf-8')
+
+
+# =============================================================================
+#
+# public functions
+#
+# =============================================================================
+
+# =============================================================================
+# sign
+# =============================================================================
+def sign(
+        signer_config: dict,
+        certificate_request: bytes,
+        profile: str,
+        hosts: Optional[List[str]] = None) -> bytes:
+    '''sends a pem encoded signing request to a cfssl api server
+    and returns the pem encoded certificate it signed
+
+    signer_config is the signer source option, i.e. the server url,
+    and optionally the auth_key, profile, label, and timeout. the
+    profile in signer_config, when set, replaces the given profile
+
+    the hosts, when given, replace the hosts of the signing request
+    '''
+    url = signer_config['url'].rstrip('/')
+    sign_request: dict = {
+        'certificate_request': certificate_request.decode('utf-8'),
+        'profile': signer_config.get('profile', profile)
+    }
+    if signer_config.get('label'):
+        sign_request['label'] = signer_config['label']
+    if hosts is not None:
+        sign_request['hosts'] = hosts
+    body = json.dumps(sign_request).encode('utf-8')
+
+    # authenticate the request, if the signer expects it
+    if signer_config.get('auth_key'):
+        url += AUTHSIGN_ENDPOINT_PATH
+        body = json.dumps(_create_authenticated_request(
+            body,
+            signer_config['auth_key'])).encode('utf-8')
+    else:
+        url += SIGN_ENDPOINT_PATH
+
+    log(f"signing with profile '{sign_request['profile']}' at {url}")
+    pool_manager = _get_pool_manager(
+        float(signer_config.get('timeout', SIGNER_DEFAULT_TIMEOUT)))
+    with lib.trace.span('signer.sign', profile=sign_request['profile']) \
+            as sign_span:
+        response = pool_manager.request(
+            'POST',
+            url,
+            body=body,
+            headers={'Content-Type': 'application/json'})
+        sign_span.end(status=response.status)
+    return _decode_response(response.status, response.data)
@@ -0,0 +1,177 @@
+# stdlib
+import atexit
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+# =============================================================================
+#
+# constants
+#
+# =============================================================================
+
+# when set, the spans of an invocation are written to this file as it exits
+# in the chrome trace event format, e.g. for chrome://tracing or perfetto
+TRACE_FILE_ENV_VAR_NAME: str = 'CFSSL_RESOURCE_TRACE_FILE'
+
+
+# =============================================================================
+#
+# private state
+#
+# =============================================================================
+
+# the spans ended during this invocation, see span
+_spans: List['Span'] = []
+
+# when this invocation started, as measured from the first import
+_start_time: float = time.perf_counter()
+
+
+# =============================================================================
+#
+# classes
+#
+# =============================================================================
+
+# =============================================================================
+# Span
+# =============================================================================
+class Span:
+    '''a timed phase of an invocation, recorded once it ends,
+    either with end() or by leaving a with block
+    '''
+
+    def __init__(self, name: str, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.thread_id = threading.get_ident()
+        self.start_time = time.perf_counter()
+        self.end_time: Optional[float] = None
+
+    def end(self, **attributes: Any) -> None:
+        if self.end_time is not None:
+            return
+        self.end_time = time.perf_counter()
+        self.attributes.update(attributes)
+        _spans.append(self)
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+    def __enter__(self) -> 'Span':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.attributes['error'] = exc_type.__name__
+        self.end()
+
+
+# =============================================================================
+#
+# private functions
+#
+# =============================================================================
+
+# =============================================================================
+# _create_trace_events
+# =============================================================================
+def _create_trace_events() -> List[dict]:
+    # complete events, timed in microseconds from the start
+    process_id = os.getpid()
+    return [
+        {
+            'name': ended_span.name,
+            'cat': ended_span.name.split('.')[0],
+            'ph': 'X',
+            'ts': round((ended_span.start_time - _start_time) * 1e6),
+            'dur': round(ended_span.duration * 1e6),
+            'pid': process_id,
+            'tid': ended_span.thread_id,
+            'args': ended_span.attributes
+        }
+        for ended_span in _spans
+    ]
+
+
+# =============================================================================
+#
+# public functions
+#
+# =============================================================================
+
+# =============================================================================
+# span
+# =============================================================================
+def span(name: str, **attributes: Any) -> Span:
+    '''starts a span, named like {category}.{operation},
+    e.g. s3.GetObject, with optional attributes
+
+    used as a context manager, the span ends with the with block,
+    and records the type of the exception that ended it, if any
+    '''
+    return Span(name, attributes)
+
+
+# =============================================================================
+# get_timings
+# =============================================================================
+def get_timings() -> Dict[str, dict]:
+    '''returns the count and total duration in milliseconds
+    of the spans ended so far, by name
+
+    spans which ran concurrently are added up,
+    so the durations can add up to more than the invocation took
+    '''
+    timings: Dict[str, dict] = {}
+    for ended_span in _spans:
+        timing = timings.setdefault(
+            ended_span.name,
+            {'count': 0, 'ms': 0.0})
+        timing['count'] += 1
+        timing['ms'] += ended_span.duration * 1000
+    return timings
+
+
+# =============================================================================
+# get_timings_summary
+# =============================================================================
+def get_timings_summary() -> str:
+    '''returns the time since the invocation started, and the timings
+    by span name, longest first, in a single line, e.g.
+    total 812ms, cfssl.gencert 230ms, s3.GetObject 3x 45ms
+    '''
+    timings = sorted(
+        get_timings().items(),
+        key=lambda item: item[1]['ms'],
+        reverse=True)
+    parts = [f"total {(time.perf_counter() - _start_time) * 1000:.0f}ms"]
+    for name, timing in timings:
+        count = f"{timing['count']}x " if timing['count'] > 1 else ''
+        parts.append(f"{name} {count}{timing['ms']:.0f}ms")
+    return ', '.join(parts)
+
+
+# =============================================================================
+# write_trace_file
+# =============================================================================
+def write_trace_file(file_path: str) -> None:
+    with open(file_path, 'w') as trace_file:
+        json.dump(
+            {
+                'traceEvents': _create_trace_events(),
+                'displayTimeUnit': 'ms'
+            },
+            trace_file)
+
+
+# write the trace file on exit, if requested
+if os.environ.get(TRACE_FILE_ENV_VAR_NAME):
+    atexit.register(
+        write_trace_file,
+        os.environ[TRACE_FILE_ENV_VAR_NAME])
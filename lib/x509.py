@@ -0,0 +1,216 @@
+# stdlib
+from typing import TYPE_CHECKING, Dict, List
+
+# the cryptography package is only imported when a certificate is parsed,
+# so check does not load it at startup
+if TYPE_CHECKING:
+    from cryptography import x509
+
+
+# =============================================================================
+#
+# constants
+#
+# =============================================================================
+
+# name attributes, as named by cfssl certinfo
+# country, organization, etc. may repeat, and are comma joined
+COMMON_NAME_OID: str = '2.5.4.3'
+SERIAL_NUMBER_OID: str = '2.5.4.5'
+NAME_ATTRIBUTE_NAMES: Dict[str, str] = {
+    '2.5.4.6': 'country',
+    '2.5.4.10': 'organization',
+    '2.5.4.11': 'organizational_unit',
+    '2.5.4.7': 'locality',
+    '2.5.4.8': 'province',
+    '2.5.4.9': 'street_address',
+    '2.5.4.17': 'postal_code'
+}
+
+# signature algorithms, as named by cfssl certinfo
+SIGNATURE_ALGORITHM_NAMES: Dict[str, str] = {
+    '1.2.840.113549.1.1.2': 'MD2WithRSA',
+    '1.2.840.113549.1.1.4': 'MD5WithRSA',
+    '1.2.840.113549.1.1.5': 'SHA1WithRSA',
+    '1.2.840.113549.1.1.11': 'SHA256WithRSA',
+    '1.2.840.113549.1.1.12': 'SHA384WithRSA',
+    '1.2.840.113549.1.1.13': 'SHA512WithRSA',
+    '1.2.840.10040.4.3': 'DSAWithSHA1',
+    '2.16.840.1.101.3.4.3.2': 'DSAWithSHA256',
+    '1.2.840.10045.4.1': 'ECDSAWithSHA1',
+    '1.2.840.10045.4.3.2': 'ECDSAWithSHA256',
+    '1.2.840.10045.4.3.3': 'ECDSAWithSHA384',
+    '1.2.840.10045.4.3.4': 'ECDSAWithSHA512'
+}
+UNKNOWN_SIGNATURE_ALGORITHM_NAME: str = 'Unknown Signature'
+
+# the format cfssl certinfo writes dates in
+CERTINFO_DATETIME_FORMAT: str = '%Y-%m-%dT%H:%M:%SZ'
+
+
+# =============================================================================
+#
+# private functions
+#
+# =============================================================================
+
+# =============================================================================
+# _is_pem
+# =============================================================================
+def _is_pem(contents: bytes) -> bool:
+    # der encoded files are accepted as well
+    return contents.lstrip().startswith(b'-----')
+
+
+# =============================================================================
+# _get_name_info
+# =============================================================================
+def _get_name_info(name: 'x509.Name') -> dict:
+    '''describes a distinguished name the way cfssl certinfo does
+    '''
+    name_info: dict = {}
+    values: Dict[str, List[str]] = {}
+    names = []
+    for attribute in name:
+        values.setdefault(attribute.oid.dotted_string, []).append(
+            attribute.value)
+        names.append(attribute.value)
+    # the last common name and serial number win
+    if COMMON_NAME_OID in values:
+        name_info['common_name'] = values[COMMON_NAME_OID][-1]
+    if SERIAL_NUMBER_OID in values:
+        name_info['serial_number'] = values[SERIAL_NUMBER_OID][-1]
+    for oid, attribute_name in NAME_ATTRIBUTE_NAMES.items():
+        if oid in values:
+            name_info[attribute_name] = ','.join(values[oid])
+    if names:
+        name_info['names'] = names
+    return name_info
+
+
+# =============================================================================
+# _get_subject_alternative_names
+# =============================================================================
+def _get_subject_alternative_names(
+        extensions: 'x509.Extensions') -> List[str]:
+    # dns names first, then ip addresses, like cfssl certinfo
+    import cryptography.x509
+    try:
+        subject_alternative_name = extensions.get_extension_for_class(
+            cryptography.x509.SubjectAlternativeName).value
+    except cryptography.x509.ExtensionNotFound:
+        return []
+    return (
+        subject_alternative_name.get_values_for_type(
+            cryptography.x509.DNSName) +
+        [str(ip_address)
+         for ip_address in subject_alternative_name.get_values_for_type(
+             cryptography.x509.IPAddress)])
+
+
+# =============================================================================
+# _format_key_identifier
+# =============================================================================
+def _format_key_identifier(key_identifier: bytes) -> str:
+    return ':'.join(f"{byte:02X}" for byte in key_identifier)
+
+
+# =============================================================================
+#
+# public functions
+#
+# =============================================================================
+
+# =============================================================================
+# get_certificate_info
+# =============================================================================
+def get_certificate_info(certificate: bytes) -> dict:
+    '''parses a pem or der encoded certificate in process
+
+    returns the same dict as cfssl certinfo, i.e. subject, issuer,
+    serial_number, sans, not_before, not_after, sigalg,
+    authority_key_id, subject_key_id, and pem
+
+    raises ValueError if the certificate is malformed
+    '''
+    import cryptography.x509
+    import cryptography.hazmat.primitives.serialization
+    if _is_pem(certificate):
+        parsed_certificate = cryptography.x509.load_pem_x509_certificate(
+            certificate)
+    else:
+        parsed_certificate = cryptography.x509.load_der_x509_certificate(
+            certificate)
+
+    certificate_info = {
+        'subject': _get_name_info(parsed_certificate.subject),
+        'issuer': _get_name_info(parsed_certificate.issuer),
+        'serial_number': str(parsed_certificate.serial_number),
+        'not_before': parsed_certificate.not_valid_before.strftime(
+            CERTINFO_DATETIME_FORMAT),
+        'not_after': parsed_certificate.not_valid_after.strftime(
+            CERTINFO_DATETIME_FORMAT),
+        'sigalg': SIGNATURE_ALGORITHM_NAMES.get(
+            parsed_certificate.signature_algorithm_oid.dotted_string,
+            UNKNOWN_SIGNATURE_ALGORITHM_NAME),
+        'authority_key_id': '',
+        'subject_key_id': '',
+        'pem': parsed_certificate.public_bytes(
+            cryptography.hazmat.primitives.serialization.Encoding.PEM
+        ).decode('ascii')
+    }
+
+    # sans are left out when there are none, like cfssl certinfo
+    try:
+        sans = _get_subject_alternative_names(parsed_certificate.extensions)
+        if sans:
+            certificate_info['sans'] = sans
+        for extension in parsed_certificate.extensions:
+            if isinstance(extension.value,
+                          cryptography.x509.SubjectKeyIdentifier):
+                certificate_info['subject_key_id'] = \
+                    _format_key_identifier(extension.value.digest)
+            elif isinstance(extension.value,
+                            cryptography.x509.AuthorityKeyIdentifier) and \
+                    extension.value.key_identifier is not None:
+                certificate_info['authority_key_id'] = \
+                    _format_key_identifier(extension.value.key_identifier)
+    except cryptography.x509.DuplicateExtension as error:
+        raise ValueError(f"malformed certificate: {error}")
+
+    return certificate_info
+
+
+# =============================================================================
+# get_certificate_request_info
+# =============================================================================
+def get_certificate_request_info(certificate_request: bytes) -> dict:
+    '''parses a pem or der encoded certificate signing request in process
+
+    returns its subject, like get_certificate_info,
+    and its sans, when it requests any
+
+    raises ValueError if the signing request is malformed
+    '''
+    import cryptography.x509
+    if _is_pem(certificate_request):
+        parsed_certificate_request = cryptography.x509.load_pem_x509_csr(
+            certificate_request)
+    else:
+        parsed_certificate_request = cryptography.x509.load_der_x509_csr(
+            certificate_request)
+
+    certificate_request_info = {
+        'subject': _get_name_info(parsed_certificate_request.subject)
+    }
+
+    # sans are left out when there are none, like get_certificate_info
+    try:
+        sans = _get_subject_alternative_names(
+            parsed_certificate_request.extensions)
+    except cryptography.x509.DuplicateExtension as error:
+        raise ValueError(f"malformed certificate request: {error}")
+    if sans:
+        certificate_request_info['sans'] = sans
+
+    return certificate_request_info